@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Compare plain, gzip and zstd csv/json objects on size, compression time and read time.
+# Run with `python benchmarks/bench_compression.py -r 1000000`
+import argparse
+import io
+import json
+import sys
+import time
+from generate_csv_data import populate_df, generate_json
+from get_data import read_csv_stream
+from compressed_io import compress_bytes, decompress_bytes
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run(rows: int) -> None:
+    df, type_number = populate_df(rows, 'flights', seed=0)
+    # orient='index' json needs unique keys
+    df = df.drop_duplicates(type_number)
+    payloads = {
+        'csv': (df.to_csv(index=False).encode('utf-8'), lambda body: read_csv_stream(io.BytesIO(body))),
+        'json': (generate_json(df, type_number).encode('utf-8'), lambda body: json.loads(decompress_bytes(body))),
+    }
+    print(f'{len(df)} rows')
+    print(f'{"object":>6} {"codec":>6} {"MB":>8} {"ratio":>6} {"compress (s)":>13} {"read (s)":>9}')
+    for name, (plain, reader) in payloads.items():
+        for codec in (None, 'gzip', 'zstd'):
+            compress_time, body = timed(compress_bytes, plain, codec)
+            read_time, _ = timed(reader, body)
+            print(f'{name:>6} {codec or "-":>6} {len(body) / 1e6:>8.1f} {len(plain) / len(body):>6.1f} '
+                  f'{compress_time:>13.3f} {read_time:>9.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark csv/json compression codecs")
+    parser.add_argument(
+        "-r", "--rows",
+        type=int,
+        help="Number of rows to generate",
+        default=1000000)
+    run(parser.parse_args(sys.argv[1:]).rows)
+    return True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Compare peak memory and time of the old split-based csv parser and the streaming reader.
+# Run with `python benchmarks/bench_csv_read.py -s 500`, each mode runs in its own process.
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import pandas as pd
+from bench_storage_formats import make_df
+from get_data import read_csv_stream
+
+
+def legacy_handle_df(obj: str) -> pd.DataFrame:
+    """The parser get_csv_data used on the S3 path before read_csv_stream"""
+    rows = obj.split('\n')
+    df = pd.DataFrame(rows)
+    df = df[0].str.split(',', expand=True)
+    df.columns = df.iloc[0]
+    df.drop(df.index[0], inplace=True)
+    return df
+
+
+def write_csv(path: str, size_mb: int) -> None:
+    rows_per_mb = 10500
+    with open(path, 'w', encoding='utf-8') as f:
+        for part in range(0, size_mb, 50):
+            df = make_df(rows_per_mb * min(50, size_mb - part))
+            df.to_csv(f, index=False, header=part == 0)
+
+
+def run_mode(mode: str, path: str) -> None:
+    start = time.perf_counter()
+    # A binary file object stands in for the S3 StreamingBody
+    with open(path, 'rb') as body:
+        if mode == 'legacy':
+            df = legacy_handle_df(body.read().decode('utf-8'))
+        else:
+            df = read_csv_stream(body)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{mode:>8} {len(df):>10} {elapsed:>9.2f} {peak_mb:>14.0f} '
+          f'{df.memory_usage(deep=True).sum() / 1e6:>10.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark csv readers")
+    parser.add_argument("-s", "--size_mb", type=int, default=500,
+                        help="Size of the generated csv in MB")
+    parser.add_argument("--mode", choices=['legacy', 'stream'], default=None,
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--path", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(sys.argv[1:])
+    if args.mode:
+        run_mode(args.mode, args.path)
+        return True
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'flights.csv')
+        write_csv(path, args.size_mb)
+        print(f'csv size: {os.path.getsize(path) / 1e6:.0f} MB')
+        print(f'{"mode":>8} {"rows":>10} {"time (s)":>9} {"peak RSS (MB)":>14} {"frame (MB)":>10}')
+        for mode in ('legacy', 'stream'):
+            result = subprocess.run([sys.executable, __file__, '--mode', mode, '--path', path], check=False)
+            if result.returncode != 0:
+                print(f'{mode:>8} failed with exit code {result.returncode} (killed when out of memory)')
+    return True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Compare the per-row Faker loop populate_df used to run with the vectorized generator.
+# Run with `python benchmarks/bench_generate.py -r 1000000`
+import argparse
+import sys
+import time
+import pandas as pd
+from faker import Faker
+from generate_csv_data import populate_df
+
+
+def legacy_populate_df(generation_number: int, transportation_type: str) -> pd.DataFrame:
+    """The row by row Faker loop populate_df used before it was vectorized"""
+    fake = Faker()
+    letter = transportation_type[0].upper()
+    rows = []
+    for _ in range(generation_number):
+        rows.append([fake.numerify(text=f'{letter}######'), fake.country(), fake.country(),
+                     fake.city(), fake.city(),
+                     fake.date_this_decade().strftime('%Y-%m-%d'), fake.date_this_decade().strftime('%Y-%m-%d'),
+                     fake.time(pattern='%H:%M'), fake.time(pattern='%H:%M'),
+                     fake.random_int(min=100, max=1000, step=100), fake.random_int(min=1000, max=2000, step=100),
+                     fake.random_int(min=2000, max=3000, step=100)])
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark data generation")
+    parser.add_argument("-r", "--rows", type=int, default=1000000,
+                        help="Rows generated by the vectorized generator")
+    parser.add_argument("-l", "--legacy_rows", type=int, default=20000,
+                        help="Rows generated by the Faker loop, its rate is extrapolated")
+    args = parser.parse_args(sys.argv[1:])
+
+    start = time.perf_counter()
+    legacy_populate_df(args.legacy_rows, 'flights')
+    legacy_rate = args.legacy_rows / (time.perf_counter() - start)
+    start = time.perf_counter()
+    populate_df(args.rows, 'flights', seed=0)
+    rate = args.rows / (time.perf_counter() - start)
+
+    print(f'{"generator":>10} {"rows/s":>12} {"time for " + str(args.rows) + " rows (s)":>28}')
+    print(f'{"faker":>10} {legacy_rate:>12.0f} {args.rows / legacy_rate:>28.1f}')
+    print(f'{"numpy":>10} {rate:>12.0f} {args.rows / rate:>28.1f}')
+    print(f'speedup: {rate / legacy_rate:.0f}x')
+    return True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Compare the JSON payloads: the old pretty-printed index response, minified index, records and columns
+# layouts, with the standard library and with orjson. Run with `python benchmarks/bench_json_layout.py -r 1000000`
+import argparse
+import json
+import sys
+import time
+import orjson
+from generate_csv_data import populate_df, generate_json
+from json_layout import to_layout
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run(rows: int) -> None:
+    df, type_number = populate_df(rows, 'flights', seed=0)
+    # orient='index' json needs unique keys
+    df = df.drop_duplicates(type_number)
+    json_data = json.loads(generate_json(df, type_number))
+    records = to_layout(json_data, 'records', type_number)
+    columns = to_layout(json_data, 'columns', type_number)
+    encoders = {
+        'index, indent=4 sort_keys (old)': lambda: json.dumps(json_data, indent=4, sort_keys=True),
+        'index, json minified': lambda: json.dumps(json_data, separators=(',', ':')),
+        'index, orjson': lambda: orjson.dumps(json_data),
+        'records, orjson': lambda: orjson.dumps(records),
+        'columns, orjson': lambda: orjson.dumps(columns),
+        'to_layout records + orjson': lambda: orjson.dumps(to_layout(json_data, 'records', type_number)),
+        'generate_json index (pandas)': lambda: generate_json(df, type_number),
+        'generate_json records': lambda: generate_json(df, type_number, 'records'),
+    }
+    print(f'{len(df)} rows')
+    print(f'{"payload":>32} {"MB":>8} {"encode (s)":>11}')
+    for name, encoder in encoders.items():
+        encode_time, body = timed(encoder)
+        print(f'{name:>32} {len(body) / 1e6:>8.1f} {encode_time:>11.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON layouts and serializers")
+    parser.add_argument(
+        "-r", "--rows",
+        type=int,
+        help="Number of rows to generate",
+        default=1000000)
+    run(parser.parse_args(sys.argv[1:]).rows)
+    return True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Compare the old decode/encode response path of the Lambda with the pass-through one.
+# Run with `python benchmarks/bench_lambda_body.py -r 10000 100000 1000000`
+import argparse
+import json
+import random
+import sys
+import time
+from typing import List
+from common_funcs_lambda import gzip_base64
+
+
+def make_body(rows: int) -> str:
+    """Build an orient='index' JSON body shaped like generate_json output"""
+    rng = random.Random(0)
+    cities = [f'City{i}' for i in range(500)]
+    countries = [f'Country{i}' for i in range(200)]
+    data = {}
+    for i in range(rows):
+        data[f'F{i:07d}'] = {
+            'from_Country': rng.choice(countries), 'to_Country': rng.choice(countries),
+            'from_city': rng.choice(cities), 'to_city': rng.choice(cities),
+            'from_date': f'2025-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}',
+            'to_date': f'2025-0{rng.randint(1, 9)}-2{rng.randint(0, 9)}',
+            'departure': f'{rng.randint(10, 23)}:{rng.randint(10, 59)}',
+            'arrival': f'{rng.randint(10, 23)}:{rng.randint(10, 59)}',
+            'economy': rng.randrange(100, 1001, 100),
+            'eusiness': rng.randrange(1000, 2001, 100),
+            'first_class': rng.randrange(2000, 3001, 100)}
+    return json.dumps(data, separators=(',', ':'))
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def old_path(raw: bytes) -> str:
+    return json.dumps(json.loads(raw))
+
+
+def passthrough_path(raw: bytes) -> str:
+    return raw.decode('utf-8')
+
+
+def run(rows_list: List[int]) -> None:
+    print(f'{"rows":>9} {"MB":>8} {"old (s)":>9} {"raw (s)":>9} {"gzip (s)":>9} {"gzip MB":>8}')
+    for rows in rows_list:
+        raw = make_body(rows).encode('utf-8')
+        old = timed(old_path, raw)
+        passthrough = timed(passthrough_path, raw)
+        start = time.perf_counter()
+        gzipped = gzip_base64(passthrough_path(raw))
+        gzip_time = time.perf_counter() - start
+        print(f'{rows:>9} {len(raw) / 1e6:>8.1f} {old:>9.3f} {passthrough:>9.4f} '
+              f'{gzip_time:>9.3f} {len(gzipped) / 1e6:>8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Lambda response bodies")
+    parser.add_argument(
+        "-r", "--rows",
+        nargs='*',
+        type=int,
+        help="Dataset sizes to benchmark",
+        default=[10000, 100000, 1000000])
+    run(parser.parse_args(sys.argv[1:]).rows)
+    return True
+
+
+if __name__ == '__main__':
+    main()
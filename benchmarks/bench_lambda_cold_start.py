@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Measure the cold start of the Lambda package: the import time of get_data_lambda in a fresh interpreter
+# (python -X importtime) and the latency of a first and second simulated invocation against moto S3.
+# Run with `python benchmarks/bench_lambda_cold_start.py -r 10000`, exits 1 when a limit is exceeded.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+LAMBDA_MODULE = 'get_data_lambda'
+# Imported only on the paths that need them, a cold start must not load them
+DEFERRED_MODULES = ['boto3', 'pyarrow', 'numpy']
+INVOCATION_SCRIPT = '''
+import json, sys, time
+import boto3
+from moto import mock_aws
+with mock_aws():
+    s3_client = boto3.client('s3', region_name='eu-west-2')
+    s3_client.create_bucket(Bucket='web-app-python', CreateBucketConfiguration={'LocationConstraint': 'eu-west-2'})
+    s3_client.put_object(Bucket='web-app-python', Key='flights.json', Body=json.dumps(
+        {f'F{i:06d}': {'from_city': f'City{i % 500}', 'economy': 100 * (i % 10 + 1)} for i in range(int(sys.argv[1]))}))
+    start = time.perf_counter()
+    import get_data_lambda
+    init = time.perf_counter()
+    get_data_lambda.lambda_handler({'transportation_type': 'flights'}, None)
+    first = time.perf_counter()
+    get_data_lambda.lambda_handler({'transportation_type': 'flights', 'from_city': 'City7'}, None)
+    second = time.perf_counter()
+    print(json.dumps({'init': init - start, 'first': first - init, 'query': second - first}))
+'''
+
+
+def run_python(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable] + args, capture_output=True, text=True, check=True, env=os.environ.copy())
+
+
+def measure_imports() -> Tuple[float, Dict[str, int], List[str]]:
+    """Import the Lambda module in a fresh interpreter, get its cumulative ms, the cumulative us of every
+    module it imported and the deferred modules that were loaded anyway"""
+    check = '; '.join([f'import {LAMBDA_MODULE}, sys',
+                       f'print([name for name in {DEFERRED_MODULES} if name in sys.modules])'])
+    result = run_python(['-X', 'importtime', '-c', check])
+    modules = {}
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if not (line.startswith('import time:') and fields[1].strip().isdigit()):
+            continue
+        name = fields[2].strip()
+        modules[name] = int(fields[1])
+        if name == LAMBDA_MODULE:
+            break
+        if fields[2].startswith(' ' + name):
+            # Nested imports are listed before their parent, a top level one closes what came before it
+            modules = {}
+    return modules[LAMBDA_MODULE] / 1000, modules, json.loads(result.stdout.splitlines()[-1].replace("'", '"'))
+
+
+def measure_invocations(rows: int) -> Dict[str, float]:
+    """Time the import and two invocations in a fresh interpreter, botocore is already loaded by moto there"""
+    return json.loads(run_python(['-c', INVOCATION_SCRIPT, str(rows)]).stdout.splitlines()[-1])
+
+
+def run(rows: int, repeat: int, top: int, max_import_ms: float) -> bool:
+    imports = [measure_imports() for _ in range(repeat)]
+    import_ms = statistics.median(total for total, _, _ in imports)
+    print(f'{LAMBDA_MODULE} import: {import_ms:.0f} ms (median of {repeat}, limit {max_import_ms:.0f} ms)')
+    for name, cumulative in sorted(imports[0][1].items(), key=lambda item: -item[1])[1:top + 1]:
+        print(f'  {cumulative / 1000:>8.1f} ms  {name}')
+    invocations = measure_invocations(rows)
+    print(f'init {invocations["init"] * 1000:.0f} ms, first invocation ({rows} rows) '
+          f'{invocations["first"] * 1000:.0f} ms, first query {invocations["query"] * 1000:.0f} ms')
+    loaded = imports[0][2]
+    if loaded:
+        print(f'Deferred modules imported at init: {loaded}')
+    return import_ms <= max_import_ms and not loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the Lambda import time and first invocation latency')
+    parser.add_argument('-r', '--rows', type=int, default=1000, help='Rows of the simulated flights.json')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='Fresh interpreters to import in')
+    parser.add_argument('-t', '--top', type=int, default=10, help='Slowest imported modules to list')
+    parser.add_argument('-m', '--max-import-ms', type=float, default=1000.0,
+                        help='Fail when the median import time is over this many ms')
+    args = parser.parse_args()
+    sys.exit(0 if run(args.rows, args.repeat, args.top, args.max_import_ms) else 1)
+
+
+if __name__ == '__main__':
+    main()
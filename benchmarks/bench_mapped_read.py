@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Compare the memory of worker processes reading the same local dataset: csv parsed by pandas vs the
+# uncompressed {type}.arrow file memory-mapped (`generate_csv_data.py -f arrow`), converted to pandas or
+# used in place as an Arrow table. Private pages (RssAnon) are per process, mapped file pages (RssFile) are
+# shared by every process through the page cache.
+# Run with `python benchmarks/bench_mapped_read.py -r 1000000 -w 4`
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import pyarrow.parquet as pq
+from bench_storage_formats import make_df
+from common_funcs import get_verbose_logger
+from generate_csv_data import generate_columnar
+from get_data import get_file_data, map_columnar_table
+from storage import LocalStorage
+
+MODES = ['csv', 'arrow pandas', 'arrow table', 'arrow 2 cols, 1 filter']
+
+
+def rss_kb() -> dict:
+    with open('/proc/self/status', encoding='utf-8') as status:
+        return {line.split(':')[0]: int(line.split()[1]) for line in status if line.startswith(('RssAnon', 'RssFile'))}
+
+
+def read(mode: str, storage: LocalStorage):
+    verboseprint, log, logger = get_verbose_logger(False, False)
+    if mode in ('csv', 'arrow pandas'):
+        # get_file_data prefers the arrow file, only the csv mode runs without one
+        return get_file_data('flights', storage, verboseprint, log, logger)[1]
+    if mode == 'arrow table':
+        table = map_columnar_table('flights', storage)
+        # Touch every column like a full scan would
+        return table, [column.nbytes for column in table.columns]
+    return map_columnar_table('flights', storage, ['flights_number', 'economy'], [('from_city', '==', 'City1')])
+
+
+def worker(mode: str, root: str, results) -> None:
+    storage = LocalStorage(root)
+    # Loads pyarrow.dataset, imported by the first filtered read, outside the measure
+    pq.filters_to_expression([('economy', '==', 0)])
+    before = rss_kb()
+    start = time.perf_counter()
+    data = read(mode, storage)
+    seconds = time.perf_counter() - start
+    after = rss_kb()
+    results.put((seconds, after['RssAnon'] - before['RssAnon'], after['RssFile'] - before['RssFile']))
+    del data
+
+
+def run_mode(mode: str, root: str, workers: int) -> list:
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, root, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measures = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return measures
+
+
+def run(rows: int, workers: int) -> None:
+    df = make_df(rows)
+    with tempfile.TemporaryDirectory() as root:
+        with open(os.path.join(root, 'flights.arrow'), 'wb') as arrow_file:
+            arrow_file.write(generate_columnar(df, 'arrow'))
+        print(f'{rows} rows, arrow {os.path.getsize(os.path.join(root, "flights.arrow")) / 1e6:.1f} MB, '
+              f'{workers} workers')
+        print(f'{"mode":>24} {"read (s)":>9} {"private MB/worker":>18} {"mapped MB/worker":>17}')
+        for mode in MODES:
+            csv_path = os.path.join(root, 'flights.csv')
+            if mode == 'csv':
+                df.to_csv(csv_path, index=False)
+                os.rename(os.path.join(root, 'flights.arrow'), os.path.join(root, 'flights.arrow.hidden'))
+            measures = run_mode(mode, root, workers)
+            if mode == 'csv':
+                os.remove(csv_path)
+                os.rename(os.path.join(root, 'flights.arrow.hidden'), os.path.join(root, 'flights.arrow'))
+            seconds = max(measure[0] for measure in measures)
+            private = sum(measure[1] for measure in measures) / workers / 1024
+            mapped = sum(measure[2] for measure in measures) / workers / 1024
+            print(f'{mode:>24} {seconds:>9.3f} {private:>18.1f} {mapped:>17.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark worker memory of mapped arrow reads vs csv')
+    parser.add_argument('-r', '--rows', type=int, default=1000000, help='Number of rows to generate')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='Processes reading the dataset at once')
+    args = parser.parse_args(sys.argv[1:])
+    run(args.rows, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Compare csv, json and the columnar formats on size, write time and read time.
+# Run with `python benchmarks/bench_storage_formats.py -r 1000000`
+import argparse
+import io
+import sys
+import time
+import numpy as np
+import pandas as pd
+from pyarrow import BufferReader
+from generate_csv_data import generate_json, generate_columnar
+from get_data import read_columnar
+
+
+def make_df(rows: int) -> pd.DataFrame:
+    """Build a dataset with the populate_df schema"""
+    rng = np.random.default_rng(0)
+    countries = np.array([f'Country{i}' for i in range(250)])
+    cities = np.array([f'City{i}' for i in range(2000)])
+    dates = (np.datetime64('2020-01-01') + rng.integers(0, 3650, size=(2, rows))).astype(str)
+    times = [f'{h:02d}:{m:02d}' for h in range(24) for m in range(60)]
+    return pd.DataFrame({
+        'flights_number': [f'F{i:07d}' for i in range(rows)],
+        'from_Country': countries[rng.integers(0, 250, rows)],
+        'to_Country': countries[rng.integers(0, 250, rows)],
+        'from_city': cities[rng.integers(0, 2000, rows)],
+        'to_city': cities[rng.integers(0, 2000, rows)],
+        'from_date': dates[0], 'to_date': dates[1],
+        'departure': np.array(times)[rng.integers(0, 1440, rows)],
+        'arrival': np.array(times)[rng.integers(0, 1440, rows)],
+        'economy': rng.integers(1, 11, rows) * 100,
+        'eusiness': rng.integers(10, 21, rows) * 100,
+        'first_class': rng.integers(20, 31, rows) * 100})
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run(rows: int) -> None:
+    df = make_df(rows)
+    writers = {
+        'csv': lambda: df.to_csv(index=False).encode('utf-8'),
+        'json': lambda: generate_json(df, 'flights_number').encode('utf-8'),
+        'parquet': lambda: generate_columnar(df, 'parquet'),
+        'feather': lambda: generate_columnar(df, 'feather'),
+        'arrow': lambda: generate_columnar(df, 'arrow'),
+    }
+    readers = {
+        'csv': lambda body: pd.read_csv(io.BytesIO(body)),
+        'json': lambda body: pd.read_json(io.BytesIO(body), orient='index'),
+        'parquet': lambda body: read_columnar(BufferReader(body), 'parquet'),
+        'feather': lambda body: read_columnar(BufferReader(body), 'feather'),
+        'arrow': lambda body: read_columnar(BufferReader(body), 'arrow'),
+    }
+    print(f'{rows} rows')
+    print(f'{"format":>8} {"MB":>8} {"write (s)":>10} {"read (s)":>10} {"read 2 cols, 1 filter (s)":>26}')
+    for name, writer in writers.items():
+        write_time, body = timed(writer)
+        read_time, _ = timed(readers[name], body)
+        if name in ('parquet', 'feather', 'arrow'):
+            pruned_time, _ = timed(read_columnar, BufferReader(body), name, ['flights_number', 'economy'],
+                                   [('from_city', '==', 'City1')])
+            pruned = f'{pruned_time:>26.3f}'
+        else:
+            pruned = f'{"-":>26}'
+        print(f'{name:>8} {len(body) / 1e6:>8.1f} {write_time:>10.3f} {read_time:>10.3f} {pruned}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dataset storage formats")
+    parser.add_argument(
+        "-r", "--rows",
+        type=int,
+        help="Number of rows to generate",
+        default=1000000)
+    run(parser.parse_args(sys.argv[1:]).rows)
+    return True
+
+
+if __name__ == '__main__':
+    main()
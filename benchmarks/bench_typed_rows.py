@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Compare the rows served by the Flask app and the Lambda held as one dict per row (query_data.build_index)
+# vs typed columns (typed_rows.TypedRows): memory held after the build, build time, whole dataset render
+# time (streamed in chunks as the Flask app sends it) and the time of a few filtered pages.
+# Run with `python benchmarks/bench_typed_rows.py -r 1000000`
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pyarrow import BufferReader
+from bench_storage_formats import make_df
+from data_store import iter_layout
+from generate_csv_data import generate_columnar, generate_json
+from get_data import read_columnar_table
+from json_layout import dumps, loads
+from query_data import build_index, parse_query, run_query
+from typed_rows import TypedRows
+
+QUERIES = [{}, {'from_country': 'Country7'}, {'from_city': 'City3', 'to_city': 'City9'},
+           {'date_from': '2024-01-01', 'date_to': '2024-01-31', 'price_class': 'economy', 'max_price': '300'},
+           {'min_price': '800', 'price_class': 'economy', 'fields': 'to_city,economy'}]
+
+
+def measured(build, *args):
+    """Get the seconds of a build and the MB it still holds, traced in a second build as tracemalloc slows it"""
+    start = time.perf_counter()
+    build(*args)
+    seconds = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    result = build(*args)
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] / 1e6
+    tracemalloc.stop()
+    return seconds, held, result
+
+
+def from_json(json: bytes) -> dict:
+    return build_index(loads(json))
+
+
+def typed_from_json(json: bytes) -> TypedRows:
+    return TypedRows.from_json_data(loads(json))
+
+
+def typed_from_arrow(arrow: bytes) -> TypedRows:
+    return TypedRows.from_table(read_columnar_table(BufferReader(arrow), 'arrow'), 'flights_number')
+
+
+def query_ms(run, queries: list) -> list:
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(10):
+            run(query)
+        times.append((time.perf_counter() - start) * 100)
+    return times
+
+
+def run(rows: int) -> None:
+    df = make_df(rows)
+    json = generate_json(df, 'flights_number').encode('utf-8')
+    arrow = generate_columnar(df, 'arrow')
+    del df
+    queries = [parse_query(params)[1] for params in QUERIES]
+    print(f'{rows} rows, json {len(json) / 1e6:.1f} MB')
+    print(f'{"rows":>18} {"build (s)":>10} {"held MB":>8} {"render (s)":>11} {"query ms":>36}')
+    for name, build, source in [('dict', from_json, json), ('typed, json', typed_from_json, json),
+                                ('typed, arrow', typed_from_arrow, arrow)]:
+        seconds, held, result = measured(build, source)
+        if isinstance(result, dict):
+            start = time.perf_counter()
+            dumps(dict(zip(result['keys'], result['rows'])))
+            render = time.perf_counter() - start
+            times = query_ms(lambda query, index=result: run_query(index, query), queries)
+        else:
+            start = time.perf_counter()
+            b''.join(iter_layout(result, 'index', 'flights_number'))
+            render = time.perf_counter() - start
+            times = query_ms(result.run_query, queries)
+        print(f'{name:>18} {seconds:>10.2f} {held:>8.1f} {render:>11.2f} {" ".join(f"{t:6.2f}" for t in times):>36}')
+        del result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dict rows vs typed columns')
+    parser.add_argument('-r', '--rows', type=int, default=1000000, help='Number of rows to generate')
+    args = parser.parse_args(sys.argv[1:])
+    run(args.rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,92 +1,616 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from __future__ import print_function
+import hashlib
+import io
+import json as jsonlib
+import math
 import os
 import sys
 import argparse
-from typing import Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import date
+from functools import partial, reduce
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+import pyarrow.parquet as pq
 from faker import Faker
-from common_vars import DATA_DIRECTORY, FLIGHTS, BUS, TRAIN
-from common_funcs import get_verbose_logger, get_s3_client, write_object_to_s3, get_ddb_client, write_ddb_object, get_logger, \
-    get_verbose, get_on_aws, get_on_ddb, get_transportation_type, get_overwrite, get_aws_profile, get_bucket, transport_in_list, generate_json_file
+from faker.providers.address.en_US import Provider as AddressProvider
+from common_vars import DATA_DIRECTORY, FLIGHTS, BUS, TRAIN, CATEGORY_COLUMNS, DATE_COLUMNS, PRICE_COLUMNS, COLUMNAR_FORMATS, \
+    IPC_COMPRESSION, MANIFEST_NAME, INDEX_DIRECTORY, SUMMARY_DIRECTORY
+from common_funcs import get_verbose_logger, get_s3_client, get_ddb_client, write_ddb_object, get_logger, \
+    get_verbose, get_on_aws, get_on_ddb, get_transportation_type, get_overwrite, get_aws_profile, get_bucket, transport_in_list, generate_json_file, \
+    get_format, get_compression, get_json_layout, get_seed, get_workers, get_shard_rows, get_append, \
+    get_indexes, ensure_ddb_indexes, get_summaries
+from storage import Storage, get_storage, read_index_object, read_json_object, get_object_size
+from aws_clients import get_client_stats
+from s3_transfer import MIN_PART_SIZE, get_first_range, get_range, replace_tail
+from compressed_io import compress_bytes, decompress_bytes, sniff_compression, open_compressed_writer
+from get_data import read_manifest, get_csv_data
+from json_layout import dumps
+from secondary_index import INDEX_DIMENSIONS, INDEX_COLUMNS, INDEX_BUCKETS, ROW_FILE_ROWS, \
+    value_bucket, postings_name, rows_name
+from summaries import SUMMARY_DIMENSIONS
+from dataset_summaries import compute_summaries, merge_summaries
+from dataset_metadata import metadata_name, describe_rows, merge_metadata, stamp_metadata
 
 transportation_type_list = [FLIGHTS, BUS, TRAIN]
+CITY_POOL_SIZE = 2000
+# Rows generated and serialized at a time, peak memory is bound by the batch not the dataset
+BATCH_ROWS = 100000
+# Index and row files written at once to S3 or disk
+INDEX_WRITERS = 8
+# Closing bytes of a json file by layout, appended rows are spliced in before them
+JSON_TAILS = {'index': b'}', 'records': b']}'}
+# Key numbers have at least 6 digits, the key space grows by powers of 10 past 1M rows
+KEY_DIGITS = 6
+# Mixed into the run seed so the key permutation does not reuse the stream of the row values
+KEY_SEED_SALT = 0x6B657973
+# 'HH:MM' for every minute of the day
+TIMES = np.array([f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(24 * 60)])
+# Last date drawn by a seeded run instead of today, so a seed gives the same rows on any day
+SEEDED_DATES_END = date(2025, 12, 31)
 
 
-def populate_df(generation_number: int, transportation_type: str) -> Tuple[pd.DataFrame, str]:
-    # TODO: Improve this function so that it can generate better random data
-    fake = Faker()
+def get_pools(fake: Faker) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the countries and a pre-sampled pool of Faker cities to draw the rows from"""
+    countries = np.unique(AddressProvider.countries)
+    cities = np.unique([fake.city() for _ in range(CITY_POOL_SIZE)])
+    return countries, cities
+
+
+def get_dates(seed: Optional[int] = None) -> np.ndarray:
+    """Get every 'YYYY-MM-DD' fake.date_this_decade() can return: from the start of the decade up to today,
+    or up to SEEDED_DATES_END for a seeded run"""
+    end = date.today() if seed is None else SEEDED_DATES_END
+    decade_start = np.datetime64(f'{end.year // 10 * 10}-01-01', 'D')
+    return np.datetime_as_string(np.arange(decade_start, np.datetime64(end, 'D') + 1), unit='D')
+
+
+def get_key_plan(generation_number: int, seed: Optional[int] = None) -> dict:
+    """Pick a random bijection i -> (multiplier * i + increment) % modulus over a key space holding every row
+
+    Row i of the dataset gets key number f(i), so batches and shards numbering disjoint row ranges
+    (offset) can never collide, without sharing a set of the keys drawn so far."""
+    modulus = 10 ** max(KEY_DIGITS, len(str(max(generation_number - 1, 0))))
+    rng = np.random.default_rng(None if seed is None else [KEY_SEED_SALT, seed])
+    multiplier = int(rng.integers(1, modulus))
+    while math.gcd(multiplier, modulus) != 1:
+        multiplier = int(rng.integers(1, modulus))
+    return {'multiplier': multiplier, 'increment': int(rng.integers(0, modulus)), 'modulus': modulus, 'offset': 0}
+
+
+def allocate_numbers(keys: dict, count: int) -> np.ndarray:
+    """Get the key numbers of the count rows starting at the offset of the plan"""
+    index = np.arange(keys['offset'], keys['offset'] + count, dtype=np.int64)
+    return (keys['multiplier'] * index + keys['increment']) % keys['modulus']
+
+
+def format_keys(type_number: str, numbers: np.ndarray) -> np.ndarray:
+    """Get the 'F000001' keys of the key numbers, the letter is the first of the type"""
+    return np.char.add(type_number[0].upper(), np.char.zfill(numbers.astype(str), KEY_DIGITS))
+
+
+def populate_df(generation_number: int, transportation_type: str, seed: Optional[int] = None,
+                pools: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                keys: Optional[dict] = None, dates: Optional[np.ndarray] = None) -> Tuple[pd.DataFrame, str]:
+    """Generate the rows column by column with NumPy, the same seed gives the same data
+
+    Batches and shards get seeds spawned even for an unseeded run, they take the dates of the run."""
+    rng = np.random.default_rng(seed)
+    if pools is None:
+        fake = Faker()
+        if seed is not None:
+            fake.seed_instance(seed)
+        pools = get_pools(fake)
     type_number = f'{transportation_type}_number'
-    letter = type_number[0].upper()
-    rows = []
     header = [type_number, 'from_Country', 'to_Country',
               'from_city', 'to_city',
               'from_date', 'to_date',
               'departure', 'arrival',
               'economy', 'eusiness', 'first_class']
 
-    for _ in range(generation_number):
-        data = {}
-        data['from_country'] = fake.country()
-        data['to_country'] = fake.country()
-        data['from_city'] = fake.city()
-        data['to_city'] = fake.city()
-        data['from_date'] = fake.date_this_decade().strftime('%Y-%m-%d')
-        data['to_date'] = fake.date_this_decade().strftime('%Y-%m-%d')
-        data[type_number] = str(fake.numerify(text=f'{letter}######'))
-        data['departure'] = fake.time(pattern='%H:%M')
-        data['arrival'] = fake.time(pattern='%H:%M')
-        data['economy'] = fake.random_int(min=100, max=1000, step=100)
-        data['business'] = fake.random_int(
-            min=1000, max=2000, step=100)
-        data['first_class'] = fake.random_int(
-            min=2000, max=3000, step=100)
-
-        rows.append([data[type_number], data['from_country'], data['to_country'],
-                     data['from_city'], data['to_city'], data['from_date'], data['to_date'],
-                     data['departure'], data['arrival'], data['economy'], data['business'], data['first_class']])
-    return pd.DataFrame(rows, columns=header), type_number
-
-
-def generate_json(df: pd.DataFrame, type_number: str):
+    countries, cities = pools
+    if dates is None:
+        dates = get_dates(seed)
+
+    def draw(pool: np.ndarray) -> pd.Categorical:
+        # Rows hold codes into the pool, the strings are only materialized on output
+        return pd.Categorical.from_codes(rng.integers(0, len(pool), generation_number), categories=pool)
+
+    columns = [
+        format_keys(type_number, allocate_numbers(keys or get_key_plan(generation_number, seed), generation_number)),
+        draw(countries), draw(countries),
+        draw(cities), draw(cities),
+        draw(dates), draw(dates),
+        draw(TIMES), draw(TIMES),
+        rng.integers(1, 11, generation_number) * 100,
+        rng.integers(10, 21, generation_number) * 100,
+        rng.integers(20, 31, generation_number) * 100,
+    ]
+    return pd.DataFrame(dict(zip(header, columns))), type_number
+
+
+class SecondaryIndexWriter:
+    """Write one index segment as the batches go by: the rows as consecutive row files, then the postings of every value"""
+
+    def __init__(self, transportation_type: str, segment: int, write_file: Callable[[str, bytes], None]):
+        self.prefix = f'{transportation_type}/{INDEX_DIRECTORY}/'
+        self.segment = {'segment': segment, 'rows': 0, 'row_files': 0, 'columns': []}
+        self.write_file = write_file
+        # Rows not filling a row file yet, and the indexed columns of every row
+        self.pending = []
+        self.values = []
+        self.executor = ThreadPoolExecutor(max_workers=INDEX_WRITERS)
+        self.futures = []
+
+    def submit(self, name: str, body: bytes) -> None:
+        self.futures.append(self.executor.submit(self.write_file, self.prefix + name, body))
+
+    def write_rows(self, df: pd.DataFrame) -> None:
+        self.submit(rows_name(self.segment['segment'], self.segment['row_files']),
+                    generate_json(df, self.segment['columns'][0], 'records').encode('utf-8'))
+        self.segment['row_files'] += 1
+        self.segment['rows'] += len(df)
+
+    def add(self, df: pd.DataFrame) -> None:
+        self.segment['columns'] = list(df.columns)
+        self.values.append(df[INDEX_COLUMNS].copy())
+        pending = pd.concat(self.pending + [df], ignore_index=True) if self.pending else df
+        full = len(pending) // ROW_FILE_ROWS * ROW_FILE_ROWS
+        for start in range(0, full, ROW_FILE_ROWS):
+            self.write_rows(pending.iloc[start:start + ROW_FILE_ROWS])
+        self.pending = [pending.iloc[full:]] if full < len(pending) else []
+
+    def close(self) -> dict:
+        """Write the last rows and the postings, wait for every file and describe the segment for the manifest"""
+        try:
+            if self.pending:
+                self.write_rows(pd.concat(self.pending, ignore_index=True))
+            values = pd.concat(self.values, ignore_index=True) if self.values else pd.DataFrame(columns=INDEX_COLUMNS)
+            for dimension, columns in INDEX_DIMENSIONS.items():
+                joined = values[columns[0]].astype(str)
+                for column in columns[1:]:
+                    joined = joined + '|' + values[column].astype(str)
+                buckets = [{} for _ in range(INDEX_BUCKETS)]
+                for value, row_ids in pd.Series(np.arange(len(values))).groupby(joined.to_numpy()).indices.items():
+                    buckets[value_bucket(value)][value] = row_ids.tolist()
+                # Every bucket is written, a lookup never misses an object
+                for bucket, postings in enumerate(buckets):
+                    self.submit(postings_name(self.segment['segment'], dimension, bucket), dumps(postings).encode('utf-8'))
+            for future in self.futures:
+                future.result()
+        finally:
+            self.executor.shutdown()
+        return self.segment
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.executor.shutdown()
+
+
+def write_index_manifest(transportation_type: str, segments: List[dict], write_file: Callable[[str, bytes], None]) -> None:
+    """Write {type}/index/manifest.json last, readers only use the segments it lists"""
+    manifest = {'transportation_type': transportation_type, 'index_buckets': INDEX_BUCKETS,
+                'row_file_rows': ROW_FILE_ROWS, 'dimensions': INDEX_DIMENSIONS, 'segments': segments}
+    write_file(f'{transportation_type}/{INDEX_DIRECTORY}/{MANIFEST_NAME}',
+               jsonlib.dumps(manifest, indent=2).encode('utf-8'))
+
+
+def get_index_file_writer(on_aws: bool, bucket: str, aws_creds: str) -> Callable[[str, bytes], None]:
+    """Index objects go to S3 whenever a remote target is used, like the json file"""
+    return partial(write_data_file, on_aws=on_aws, bucket=bucket, aws_creds=aws_creds)
+
+
+def remove_stale_index(transportation_type: str, on_aws: bool, bucket: str, aws_creds: str) -> None:
+    """Remove the index manifest of an earlier run, its segments no longer match the regenerated rows"""
+    get_target_storage(on_aws, bucket, aws_creds).delete(f'{transportation_type}/{INDEX_DIRECTORY}/{MANIFEST_NAME}')
+
+
+def get_ddb_target(transportation_type: str, aws_creds: str, indexes: bool) -> Tuple[object, str]:
+    """Get the client and table to load, creating the lookup GSIs first when indexes are written"""
+    ddb_client, table_name = get_ddb_client(aws_creds), f'webapp-{transportation_type}'
+    if indexes:
+        for index_name in ensure_ddb_indexes(ddb_client, table_name):
+            verboseprint(f'Created the {index_name} GSI of {table_name}')
+            log(f'Created the {index_name} GSI of {table_name}', 'INFO', logger)
+    return ddb_client, table_name
+
+
+def with_route(df: pd.DataFrame) -> pd.DataFrame:
+    """Add the route attribute the route-index GSI of the DynamoDB table is keyed on"""
+    return df.assign(route=df['from_city'].astype(str) + '|' + df['to_city'].astype(str))
+
+
+def generate_json(df: pd.DataFrame, type_number: str, json_layout: str = 'index'):
+    if json_layout == 'records':
+        # {"columns": [type_number, ...], "data": [[...], ...]}, the column names once instead of in every row.
+        # Zipping the column lists is ~3x faster than to_json(orient='split')
+        rows = map(list, zip(*(df[column].tolist() for column in df.columns)))
+        return dumps({'columns': list(df.columns), 'data': list(rows)})
     json = df.set_index(type_number).to_json(
         orient='index')
     return json
 
 
-def generate_csv_data(generation_number: int, transportation_type: str, aws_creds: str,
-                      on_aws: bool, bucket: str, on_ddb: bool, overwrite: bool, json: bool) -> bool:
-    # TODO: Adjust the overwrite logic so it can work dynamically
+def splice_json(json: str, batch: int, json_layout: str) -> str:
+    """Get the part of a batch's json that continues the single object written so far"""
+    if json_layout == 'records':
+        if batch == 0:
+            return json[:-2]
+        return ',' + json[json.index('"data":[') + len('"data":['):-2]
+    return ('{' if batch == 0 else ',') + json[1:-1]
+
+
+def iter_batches(generation_number: int, transportation_type: str, seed: Optional[int] = None,
+                 batch_rows: int = BATCH_ROWS) -> Iterator[Tuple[pd.DataFrame, str]]:
+    """Generate the rows in batches sharing the same pools, each batch with a seed spawned from the run seed"""
+    if generation_number <= batch_rows:
+        yield populate_df(generation_number, transportation_type, seed)
+        return
+    fake = Faker()
+    if seed is not None:
+        fake.seed_instance(seed)
+    pools = get_pools(fake)
+    keys = get_key_plan(generation_number, seed)
+    dates = get_dates(seed)
+    seed_sequence = np.random.SeedSequence(seed)
+    for start in range(0, generation_number, batch_rows):
+        batch_seed = int(seed_sequence.spawn(1)[0].generate_state(1)[0])
+        yield populate_df(min(batch_rows, generation_number - start), transportation_type, batch_seed, pools,
+                          dict(keys, offset=start), dates)
+
+
+def to_typed_table(df: pd.DataFrame, compact: bool = True) -> pa.Table:
+    """Convert the dataset to a typed table: dates as date32, prices as int16, places as dictionaries
+
+    Batches of one streamed dataset keep the whole pools as dictionaries so they share one schema."""
+    typed = df.astype({column: 'category' for column in CATEGORY_COLUMNS}
+                      | {column: 'int16' for column in PRICE_COLUMNS})
+    if compact:
+        for column in typed.select_dtypes('category'):
+            typed[column] = typed[column].cat.remove_unused_categories()
+    for column in DATE_COLUMNS:
+        typed[column] = pd.to_datetime(typed[column], format='%Y-%m-%d')
+    table = pa.Table.from_pandas(typed, preserve_index=False)
+    for column in DATE_COLUMNS:
+        table = table.set_column(table.schema.get_field_index(column), column,
+                                 table[column].cast(pa.date32()))
+    return table
+
+
+def open_columnar_writer(sink, schema: pa.Schema, file_format: str):
+    if file_format == 'parquet':
+        return pq.ParquetWriter(sink, schema, compression='snappy')
+    return pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(compression=IPC_COMPRESSION[file_format]))
+
+
+def generate_columnar(df: pd.DataFrame, file_format: str) -> bytes:
+    """Serialize the dataset as typed parquet/feather/arrow"""
+    table = to_typed_table(df)
+    buffer = io.BytesIO()
+    if file_format == 'parquet':
+        pq.write_table(table, buffer, compression='snappy')
+    elif file_format == 'feather':
+        feather.write_feather(table, buffer)
+    else:
+        with open_columnar_writer(buffer, table.schema, file_format) as writer:
+            writer.write_table(table)
+    return buffer.getvalue()
+
+
+def remove_stale_json(transportation_type: str, json: bool, on_aws: bool, bucket: str, on_ddb: bool,
+                      aws_creds: str) -> None:
+    """Remove the {type}.json of an earlier run when the rows were written without one"""
+    if not json:
+        get_target_storage(on_aws or on_ddb, bucket, aws_creds).delete(f'{transportation_type}.json')
+
+
+def remove_stale_files(transportation_type: str, layout: dict, on_aws: bool, bucket: str, on_ddb: bool,
+                       aws_creds: str) -> None:
+    """Remove columnar files, shard manifests and json files that would otherwise be read instead of the freshly
+    written csv"""
+    if on_aws or not on_ddb:
+        stale_files = [f'{transportation_type}.{stale_format}' for stale_format in COLUMNAR_FORMATS
+                       if stale_format != layout['format']] + [f'{transportation_type}/{MANIFEST_NAME}']
+        storage = get_target_storage(on_aws, bucket, aws_creds)
+        for stale_file in stale_files:
+            storage.delete(stale_file)
+    remove_stale_json(transportation_type, layout['json'], on_aws, bucket, on_ddb, aws_creds)
+
+
+def plan_shards(generation_number: int, workers: int, shard_rows: Optional[int],
+                seed: Optional[int]) -> List[Tuple[int, int, int]]:
+    """Split the rows into (shard, rows, seed) parts, each shard seed derived from the run seed"""
+    shard_rows = shard_rows or math.ceil(generation_number / workers)
+    shard_count = math.ceil(generation_number / shard_rows)
+    seeds = [int(child.generate_state(1)[0])
+             for child in np.random.SeedSequence(seed).spawn(shard_count)]
+    return [(shard, min(shard_rows, generation_number - shard * shard_rows), seeds[shard])
+            for shard in range(shard_count)]
+
+
+def plan_shard_rows(shards: List[Tuple[int, int, int]], seed: Optional[int]) -> List[dict]:
+    """Share one key plan and the dates of the run across the shards, each numbering its rows after those of
+    the shards before it"""
+    keys = get_key_plan(sum(rows for _, rows, _ in shards), shards[0][2])
+    offsets = np.cumsum([0] + [rows for _, rows, _ in shards])
+    dates = get_dates(seed)
+    return [{'keys': dict(keys, offset=int(offsets[shard])), 'dates': dates} for shard, _, _ in shards]
+
+
+def get_target_storage(on_aws: bool, bucket: str, aws_creds: str) -> Storage:
+    return get_storage(on_aws, bucket, get_s3_client(aws_creds) if on_aws else None)
+
+
+def write_data_file(object_name: str, body: bytes, on_aws: bool, bucket: str, aws_creds: str,
+                    compression: Optional[str] = None) -> None:
+    """Write a file of the dataset to S3 or under DATA_DIRECTORY"""
+    get_target_storage(on_aws, bucket, aws_creds).put(object_name, body,
+                                                      **({'ContentEncoding': compression} if compression else {}))
+
+
+def write_shard_files(transportation_type: str, shard: int, rows: int, bodies: dict,
+                      on_aws: bool, bucket: str, on_ddb: bool, aws_creds: str, compression: Optional[str]) -> List[dict]:
+    """Write the part files of one shard and describe them for the manifest"""
+    parts = []
+    for extension, body in bodies.items():
+        name = f'part-{shard:05d}.{extension}'
+        # The columnar formats compress internally (arrow stays plain to be mapped), only the text files are
+        # compressed as a whole
+        codec = compression if extension in ('csv', 'json') else None
+        body = compress_bytes(body, codec)
+        # The json part goes to S3 whenever a remote target is used, like the json file it is merged into
+        on_s3 = on_aws or (on_ddb and extension == 'json')
+        if on_s3 or not on_ddb:
+            write_data_file(f'{transportation_type}/{name}', body, on_s3, bucket, aws_creds, codec)
+        parts.append({'file': name, 'format': extension, 'compression': codec, 'rows': rows,
+                      'bytes': len(body), 'sha256': hashlib.sha256(body).hexdigest()})
+    return parts
+
+
+def generate_shard(shard: int, rows: int, seed: int, transportation_type: str, aws_creds: str,
+                   on_aws: bool, bucket: str, on_ddb: bool, layout: dict,
+                   plan: dict) -> Tuple[List[dict], Optional[dict], dict]:
+    """Generate one part of a sharded dataset in a worker process, numbering the rows from the offset of its plan
+
+    The shard is also written as the index segment of the same number when indexes are enabled, and
+    described for the dataset metadata."""
+    df, type_number = populate_df(rows, transportation_type, seed, keys=plan['keys'], dates=plan['dates'])
+    bodies = {'csv': df.to_csv(index=False).encode('utf-8')}
+    if layout['json']:
+        bodies['json'] = generate_json(df, type_number, layout['json_layout']).encode('utf-8')
+    if layout['format']:
+        bodies[layout['format']] = generate_columnar(df, layout['format'])
+    segment = None
+    if layout['indexes']:
+        with SecondaryIndexWriter(transportation_type, shard,
+                                  get_index_file_writer(on_aws or on_ddb, bucket, aws_creds)) as index_writer:
+            index_writer.add(df)
+            segment = index_writer.close()
+    if on_ddb:
+        write_ddb_object(get_ddb_client(aws_creds), f'webapp-{transportation_type}',
+                         with_route(df) if layout['indexes'] else df)
+    return write_shard_files(transportation_type, shard, rows, bodies, on_aws, bucket, on_ddb, aws_creds,
+                             layout['compression']), segment, describe_rows(df)
+
+
+def merge_json_parts(transportation_type: str, parts: List[dict], on_aws: bool, bucket: str, aws_creds: str,
+                     layout: dict) -> List[dict]:
+    """Merge the json parts of the shards into {type}.json one at a time, get the other parts for the manifest"""
+    json_parts = [part for part in parts if part['format'] == 'json']
+    if not json_parts:
+        return parts
+    storage = get_target_storage(on_aws, bucket, aws_creds)
+    with ExitStack() as stack:
+        output = open_text_output(stack, f'{transportation_type}.json', on_aws, bucket, aws_creds,
+                                  layout['compression'])
+        for index, part in enumerate(json_parts):
+            body = decompress_bytes(storage.read(f'{transportation_type}/{part["file"]}')).decode('utf-8')
+            output.write(splice_json(body, index, layout['json_layout']).encode('utf-8'))
+        output.write(JSON_TAILS[layout['json_layout']])
+    for part in json_parts:
+        storage.delete(f'{transportation_type}/{part["file"]}')
+    return [part for part in parts if part['format'] != 'json']
+
 
+def remove_unsharded_files(transportation_type: str, json: bool, on_aws: bool, bucket: str, on_ddb: bool,
+                           aws_creds: str) -> None:
+    """Remove the {type}.csv, columnar and json files of an earlier unsharded run, the manifest parts replace them"""
+    if on_aws or not on_ddb:
+        storage = get_target_storage(on_aws, bucket, aws_creds)
+        for extension in ['csv'] + COLUMNAR_FORMATS:
+            storage.delete(f'{transportation_type}.{extension}')
+    remove_stale_json(transportation_type, json, on_aws, bucket, on_ddb, aws_creds)
+
+
+def generate_sharded_data(shards: List[Tuple[int, int, int]], workers: int, transportation_type: str, aws_creds: str,
+                          on_aws: bool, bucket: str, on_ddb: bool, overwrite: bool, layout: dict,
+                          seed: Optional[int] = None) -> bool:
+    """Generate the shards across a process pool, then write the manifest listing the parts"""
+    if not overwrite:
+        verboseprint(
+            f'Error in generating the {transportation_type} shards - Overwrite is not enabled')
+        log(f'Error in generating the {transportation_type} shards - Overwrite is not enabled', 'ERROR', logger)
+        return False
+    try:
+        if on_ddb:
+            get_ddb_target(transportation_type, aws_creds, layout['indexes'])
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(generate_shard, shard, rows, shard_seed, transportation_type, aws_creds,
+                                       on_aws, bucket, on_ddb, layout, plan)
+                       for (shard, rows, shard_seed), plan in zip(shards, plan_shard_rows(shards, seed))]
+            results = [future.result() for future in futures]
+        manifest = {'transportation_type': transportation_type,
+                    'rows': sum(rows for _, rows, _ in shards),
+                    'shards': len(shards),
+                    'parts': merge_json_parts(transportation_type,
+                                              [part for shard_parts, _, _ in results for part in shard_parts],
+                                              on_aws or on_ddb, bucket, aws_creds, layout)}
+        if on_aws or not on_ddb:
+            write_data_file(f'{transportation_type}/{MANIFEST_NAME}', jsonlib.dumps(manifest, indent=2).encode('utf-8'),
+                            on_aws, bucket, aws_creds)
+        remove_unsharded_files(transportation_type, layout['json'], on_aws, bucket, on_ddb, aws_creds)
+        if layout['indexes']:
+            write_index_manifest(transportation_type, [segment for _, segment, _ in results],
+                                 get_index_file_writer(on_aws or on_ddb, bucket, aws_creds))
+        else:
+            remove_stale_index(transportation_type, on_aws or on_ddb, bucket, aws_creds)
+        write_metadata(transportation_type, stamp_metadata(
+            reduce(merge_metadata, [metadata for _, _, metadata in results], None), transportation_type,
+            get_file_bytes(transportation_type, ['json'] if layout['json'] else [], on_aws, bucket, aws_creds, on_ddb,
+                           manifest['parts'] if on_aws or not on_ddb else []), True),
+                       on_aws or on_ddb, bucket, aws_creds)
+        verboseprint(f'Generated {len(shards)} shards of {transportation_type} with {workers} workers')
+        log(f'Generated {len(shards)} shards of {transportation_type} with {workers} workers', 'INFO', logger)
+    except Exception as error:
+        verboseprint(
+            f'Error in generating the {transportation_type} shards - {error}')
+        log(
+            f'Error in generating the {transportation_type} shards - {error}', 'ERROR', logger)
+        return False
+    return True
+
+
+def open_output(object_name: str, on_aws: bool, bucket: str, aws_creds: str, compression: Optional[str] = None):
+    """Open a binary writer on S3 (multipart upload) or under DATA_DIRECTORY"""
+    return get_target_storage(on_aws, bucket, aws_creds).writer(
+        object_name, **({'ContentEncoding': compression} if compression else {}))
+
+
+def open_text_output(stack: ExitStack, object_name: str, on_aws: bool, bucket: str, aws_creds: str,
+                     compression: Optional[str]):
+    """Open a csv/json writer, compressing on the fly when a codec is set"""
+    raw = stack.enter_context(open_output(object_name, on_aws, bucket, aws_creds, compression))
+    if compression is None:
+        return raw
+    return stack.enter_context(open_compressed_writer(raw, compression))
+
+
+def open_outputs(stack: ExitStack, transportation_type: str, aws_creds: str, on_aws: bool, bucket: str,
+                 on_ddb: bool, layout: dict) -> dict:
+    """Open a writer per output file, json goes to S3 whenever a remote target is used"""
+    outputs = {}
+    if on_aws or not on_ddb:
+        outputs['csv'] = open_text_output(stack, f'{transportation_type}.csv', on_aws, bucket, aws_creds,
+                                          layout['compression'])
+        if layout['format']:
+            outputs[layout['format']] = stack.enter_context(
+                open_output(f'{transportation_type}.{layout["format"]}', on_aws, bucket, aws_creds))
+    if layout['json']:
+        outputs['json'] = open_text_output(stack, f'{transportation_type}.json', on_aws or on_ddb, bucket,
+                                           aws_creds, layout['compression'])
+    return outputs
+
+
+def write_batches(stack: ExitStack, batches: Iterator[Tuple[pd.DataFrame, str]], outputs: dict,
+                  ddb_target: Optional[Tuple[object, str]], compact: bool, json_layout: str = 'index',
+                  index_writer: Optional[SecondaryIndexWriter] = None) -> Tuple[dict, dict]:
+    """Serialize each batch into every output as it is generated, so memory stays flat
+
+    Get the metadata describing every written row and the DynamoDB load stats."""
+    columnar_format = next((f for f in COLUMNAR_FORMATS if f in outputs), None)
+    columnar_writer = None
+    metadata = None
+    ddb_stats = {'items': 0, 'batches': 0, 'retries': 0, 'seconds': 0.0}
+    for index, (df, type_number) in enumerate(batches):
+        if 'csv' in outputs:
+            outputs['csv'].write(df.to_csv(index=False, header=index == 0).encode('utf-8'))
+        if 'json' in outputs:
+            # Each batch is one {...} object, splice them into a single object
+            outputs['json'].write(splice_json(generate_json(df, type_number, json_layout), index,
+                                              json_layout).encode('utf-8'))
+        if columnar_format:
+            table = to_typed_table(df, compact)
+            if columnar_writer is None:
+                columnar_writer = stack.enter_context(
+                    open_columnar_writer(outputs[columnar_format], table.schema, columnar_format))
+            columnar_writer.write_table(table)
+        if index_writer is not None:
+            index_writer.add(df)
+        if ddb_target is not None:
+            # The route attribute is only needed by the route-index GSI created along with the index objects
+            ddb_stats = add_ddb_stats(ddb_stats, write_ddb_object(ddb_target[0], ddb_target[1],
+                                                                  with_route(df) if index_writer else df))
+        metadata = merge_metadata(metadata, describe_rows(df))
+    if 'json' in outputs:
+        outputs['json'].write(b']}' if json_layout == 'records' else b'}')
+    return metadata, ddb_stats
+
+
+def add_ddb_stats(total: dict, stats: dict) -> dict:
+    return {key: value + stats[key] for key, value in total.items()}
+
+
+def report_ddb_stats(table_name: str, ddb_stats: dict) -> None:
+    """Print and log the DynamoDB load throughput"""
+    rate = ddb_stats['items'] / ddb_stats['seconds'] if ddb_stats['seconds'] else 0.0
+    verboseprint(f'Wrote {ddb_stats["items"]} items to {table_name} in {ddb_stats["batches"]} batches, '
+                 f'{rate:.0f} items/s, {ddb_stats["retries"]} retries')
+    log(f'Wrote {ddb_stats["items"]} items to {table_name} at {rate:.0f} items/s', 'INFO', logger)
+
+
+def get_file_bytes(transportation_type: str, extensions: List[str], on_aws: bool, bucket: str, aws_creds: str,
+                   on_ddb: bool, parts: List[dict]) -> Dict[str, int]:
+    """Get the bytes per format of the {type}.{extension} files that exist and of the manifest parts"""
+    file_bytes = {}
+    for extension in extensions:
+        # The json file goes to S3 whenever a remote target is used, like in open_outputs
+        on_s3 = on_aws or (on_ddb and extension == 'json')
+        size = get_object_size(f'{transportation_type}.{extension}', on_s3, bucket,
+                               get_s3_client(aws_creds) if on_s3 else None)
+        if size is not None:
+            file_bytes[extension] = size
+    for part in parts:
+        file_bytes[part['format']] = file_bytes.get(part['format'], 0) + part['bytes']
+    return file_bytes
+
+
+def write_metadata(transportation_type: str, metadata: dict, on_aws: bool, bucket: str, aws_creds: str) -> None:
+    """Write {type}.meta.json, last so it only describes complete data files"""
+    write_data_file(metadata_name(transportation_type), jsonlib.dumps(metadata, indent=2).encode('utf-8'),
+                    on_aws, bucket, aws_creds)
+
+
+def generate_csv_data(generation_number: int, transportation_type: str, aws_creds: str,
+                      on_aws: bool, bucket: str, on_ddb: bool, overwrite: bool, layout: dict,
+                      seed: Optional[int] = None) -> bool:
+    # A generation replaces the whole dataset, so it needs --overwrite; --append adds rows to an existing one
     if overwrite:
         try:
             if not transport_in_list:
                 return False
 
-            df, type_number = populate_df(
-                generation_number, transportation_type)
-
-            if not on_aws and not on_ddb:
-                if not os.path.exists(DATA_DIRECTORY):
-                    os.makedirs(DATA_DIRECTORY)
-                    verboseprint(f'Directory is: {DATA_DIRECTORY}')
-                    log(f'Directory is: {DATA_DIRECTORY}', 'INFO', logger)
-                df.to_csv(os.path.join(DATA_DIRECTORY,
-                                       f'{transportation_type}.csv'), index=False)
-                if json:
-                    with open(os.path.join(DATA_DIRECTORY, f'{transportation_type}.json'), 'w', encoding='utf-8') as f:
-                        f.write(generate_json(df, type_number))
+            with ExitStack() as stack:
+                outputs = open_outputs(stack, transportation_type, aws_creds, on_aws, bucket, on_ddb, layout)
+                index_writer = stack.enter_context(SecondaryIndexWriter(
+                    transportation_type, 0, get_index_file_writer(on_aws or on_ddb, bucket, aws_creds))) \
+                    if layout['indexes'] else None
+                metadata, ddb_stats = write_batches(
+                    stack, iter_batches(generation_number, transportation_type, seed, BATCH_ROWS), outputs,
+                    get_ddb_target(transportation_type, aws_creds, layout['indexes']) if on_ddb else None,
+                    compact=generation_number <= BATCH_ROWS, json_layout=layout['json_layout'],
+                    index_writer=index_writer)
+                if index_writer is not None:
+                    index_writer.close()
+            # The index manifest goes last, once the data files are complete
+            if index_writer is not None:
+                write_index_manifest(transportation_type, [index_writer.segment], index_writer.write_file)
             else:
-                if on_aws:
-                    write_object_to_s3(bucket, f'{transportation_type}.csv', df.to_csv(
-                        index=False), get_s3_client(aws_creds))
-                if on_ddb:
-                    write_ddb_object(get_ddb_client(aws_creds),
-                                     f'webapp-{transportation_type}', df)
-                if json:
-                    write_object_to_s3(
-                        bucket, f'{transportation_type}.json', generate_json(df, type_number),  get_s3_client(aws_creds))
+                remove_stale_index(transportation_type, on_aws or on_ddb, bucket, aws_creds)
+            write_metadata(transportation_type, stamp_metadata(metadata, transportation_type, get_file_bytes(
+                transportation_type, list(outputs), on_aws, bucket, aws_creds, on_ddb, []), True),
+                           on_aws or on_ddb, bucket, aws_creds)
+            verboseprint(f'Wrote {metadata["rows"]} rows of {transportation_type}')
+            if on_ddb:
+                report_ddb_stats(f'webapp-{transportation_type}', ddb_stats)
+            remove_stale_files(transportation_type, layout, on_aws, bucket, on_ddb, aws_creds)
 
         except Exception as error:
             verboseprint(
@@ -102,6 +626,239 @@ def generate_csv_data(generation_number: int, transportation_type: str, aws_cred
     return True
 
 
+def scan_keys(transportation_type: str, aws_creds: str, on_aws: bool, bucket: str) -> Tuple[int, int]:
+    """Get the row count and highest key number of an existing dataset, reading only its key column"""
+    type_number = f'{transportation_type}_number'
+    success, df = get_csv_data(transportation_type, aws_creds, on_aws, bucket, verboseprint, log, logger,
+                               columns=[type_number])
+    if not success or df.empty:
+        return 0, -1
+    return len(df), int(df[type_number].astype(str).str[1:].astype(int).max())
+
+
+def get_json_head(object_name: str, on_aws: bool, bucket: str, s3_client) -> Tuple[bytes, int, str]:
+    """Get the first bytes, size and ETag of a json file, a missing file has size 0"""
+    if on_aws:
+        _, head, size, etag = get_first_range(bucket, object_name, s3_client, 16)
+        return head, size, etag
+    path = os.path.join(DATA_DIRECTORY, object_name)
+    if not os.path.exists(path):
+        return b'', 0, ''
+    with open(path, 'rb') as json_file:
+        return json_file.read(16), os.path.getsize(path), ''
+
+
+def get_json_tail(body: bytes) -> Tuple[str, bytes]:
+    """Get the layout a json file was written with from its first bytes, and the bytes closing it"""
+    json_layout = 'records' if body.startswith(b'{"columns"') else 'index'
+    return json_layout, JSON_TAILS[json_layout]
+
+
+def splice_rows(df: pd.DataFrame, type_number: str, json_layout: str, before: bytes) -> bytes:
+    """Get the new rows continuing a json file, without a leading comma when the byte before its end opens it"""
+    data = splice_json(generate_json(df, type_number, json_layout), 1, json_layout)
+    return (data[1:] if before in (b'{', b'[') else data).encode('utf-8')
+
+
+def splice_json_body(df: pd.DataFrame, type_number: str, object_name: str, body: bytes) -> bytes:
+    """Get the whole json file with the new rows spliced in before its closing bytes"""
+    json_layout, tail = get_json_tail(body)
+    if not body.endswith(tail):
+        raise ValueError(f'{object_name} does not end with {tail}')
+    return body[:-len(tail)] + splice_rows(df, type_number, json_layout, body[-len(tail) - 1:-len(tail)]) + tail
+
+
+def splice_json_in_place(df: pd.DataFrame, type_number: str, object_name: str, head: bytes, size: int, etag: str,
+                         s3_client, bucket: str) -> None:
+    """Overwrite the closing bytes of a plain json file with the new rows, keeping everything before them"""
+    json_layout, tail = get_json_tail(head)
+    if s3_client is not None:
+        end = get_range(bucket, object_name, s3_client, size - len(tail) - 1, size - 1, etag)
+        if end[1:] != tail:
+            raise ValueError(f'{object_name} does not end with {tail}')
+        replace_tail(bucket, object_name, s3_client, size - len(tail),
+                     splice_rows(df, type_number, json_layout, end[:1]) + tail, etag)
+        return
+    with open(os.path.join(DATA_DIRECTORY, object_name), 'r+b') as json_file:
+        json_file.seek(-len(tail) - 1, os.SEEK_END)
+        end = json_file.read()
+        if end[1:] != tail:
+            raise ValueError(f'{object_name} does not end with {tail}')
+        json_file.seek(-len(tail), os.SEEK_END)
+        json_file.write(splice_rows(df, type_number, json_layout, end[:1]) + tail)
+
+
+def append_json_index(df: pd.DataFrame, type_number: str, transportation_type: str, on_aws: bool, bucket: str,
+                      aws_creds: str, layout: dict) -> None:
+    """Splice the new rows into the json file before its closing bytes instead of rewriting it"""
+    object_name = f'{transportation_type}.json'
+    s3_client = get_s3_client(aws_creds) if on_aws else None
+    head, size, etag = get_json_head(object_name, on_aws, bucket, s3_client)
+    if size == 0:
+        write_data_file(object_name, compress_bytes(generate_json(df, type_number, layout['json_layout']).encode(
+            'utf-8'), layout['compression']), on_aws, bucket, aws_creds, layout['compression'])
+        return
+    compression = sniff_compression(head)
+    if compression is None and (not on_aws or size >= MIN_PART_SIZE):
+        splice_json_in_place(df, type_number, object_name, head, size, etag, s3_client, bucket)
+        return
+    # A compressed stream cannot be cut before its closing bytes, nor can a small S3 object be copied as a part
+    body = decompress_bytes(get_storage(on_aws, bucket, s3_client).read(object_name))
+    write_data_file(object_name, compress_bytes(splice_json_body(df, type_number, object_name, body), compression),
+                    on_aws, bucket, aws_creds, compression)
+
+
+def append_index_segment(df: pd.DataFrame, transportation_type: str, aws_creds: str, on_aws: bool, bucket: str,
+                         indexes: bool) -> Optional[dict]:
+    """Index the appended rows as a new segment of an existing index, get the index manifest to write with the data one
+
+    An index only answers queries when it covers every row, so one is never started by an append."""
+    index_manifest = read_index_object(transportation_type, MANIFEST_NAME, on_aws, bucket,
+                                       get_s3_client(aws_creds) if on_aws else None)
+    if index_manifest is None:
+        if indexes:
+            verboseprint(f'No index of {transportation_type} to append to, regenerate it with --overwrite --indexes')
+            log(f'No index of {transportation_type} to append to', 'WARNING', logger)
+        return None
+    with SecondaryIndexWriter(transportation_type, len(index_manifest['segments']),
+                              get_index_file_writer(on_aws, bucket, aws_creds)) as index_writer:
+        index_writer.add(df)
+        index_manifest['segments'].append(index_writer.close())
+    return index_manifest
+
+
+def append_metadata(df: pd.DataFrame, transportation_type: str, manifest: dict, aws_creds: str, on_aws: bool,
+                    bucket: str) -> None:
+    """Merge the appended rows into {type}.meta.json and measure the files again
+
+    A dataset generated before the metadata existed is read back and described whole once."""
+    metadata = read_json_object(metadata_name(transportation_type), on_aws, bucket,
+                                get_s3_client(aws_creds) if on_aws else None)
+    if metadata is None:
+        success, dataset = get_csv_data(transportation_type, aws_creds, on_aws, bucket, verboseprint, log, logger)
+        if not success:
+            raise ValueError(f'{transportation_type} could not be read back to describe it')
+        metadata = describe_rows(dataset)
+    else:
+        metadata = merge_metadata(metadata, describe_rows(df))
+    file_bytes = get_file_bytes(transportation_type, (['csv'] + COLUMNAR_FORMATS if manifest.get('base') else [])
+                                + ['json'], on_aws, bucket, aws_creds, False, manifest['parts'])
+    write_metadata(transportation_type, stamp_metadata(metadata, transportation_type, file_bytes, False),
+                   on_aws, bucket, aws_creds)
+
+
+def append_data(append_number: int, transportation_type: str, aws_creds: str, on_aws: bool, bucket: str,
+                on_ddb: bool, layout: dict, seed: Optional[int] = None) -> bool:
+    """Generate only the new rows, write them as the next part of the manifest and splice them into the json"""
+    if on_ddb and not on_aws:
+        verboseprint(f'Error in appending to {transportation_type} - Append needs the dataset files, '
+                     f'use it with --on_aws or without --on_ddb')
+        log(f'Error in appending to {transportation_type} - Append needs the dataset files', 'ERROR', logger)
+        return False
+    try:
+        manifest = read_manifest(transportation_type, get_target_storage(on_aws, bucket, aws_creds))
+        if manifest is None:
+            # An unsharded dataset stays where it is, the manifest lists the appended parts on top of it
+            manifest = {'transportation_type': transportation_type, 'rows': 0, 'shards': 0, 'parts': [], 'base': True}
+        if 'key_high' not in manifest:
+            # Only the first append reads the existing keys, the manifest keeps the highest one afterwards
+            manifest['rows'], manifest['key_high'] = scan_keys(transportation_type, aws_creds, on_aws, bucket)
+        # The new rows are numbered after the highest existing key so they cannot collide with it
+        df, type_number = populate_df(append_number, transportation_type, seed, keys={
+            'multiplier': 1, 'increment': manifest['key_high'] + 1,
+            'modulus': manifest['key_high'] + 1 + append_number, 'offset': 0})
+        manifest['key_high'] += append_number
+        bodies = {'csv': df.to_csv(index=False).encode('utf-8')}
+        if layout['format']:
+            bodies[layout['format']] = generate_columnar(df, layout['format'])
+        manifest['parts'] += write_shard_files(transportation_type, manifest['shards'], len(df), bodies,
+                                               on_aws, bucket, on_ddb, aws_creds, layout['compression'])
+        index_manifest = append_index_segment(df, transportation_type, aws_creds, on_aws, bucket, layout['indexes'])
+        if on_ddb:
+            report_ddb_stats(f'webapp-{transportation_type}', write_ddb_object(
+                *get_ddb_target(transportation_type, aws_creds, layout['indexes']),
+                with_route(df) if index_manifest is not None else df))
+        if layout['json']:
+            append_json_index(df, type_number, transportation_type, on_aws, bucket, aws_creds, layout)
+        manifest['rows'] += len(df)
+        manifest['shards'] += 1
+        # The manifest goes last, readers only see the new part once everything else is written
+        write_data_file(f'{transportation_type}/{MANIFEST_NAME}', jsonlib.dumps(manifest, indent=2).encode('utf-8'),
+                        on_aws, bucket, aws_creds)
+        if index_manifest is not None:
+            write_index_manifest(transportation_type, index_manifest['segments'],
+                                 get_index_file_writer(on_aws, bucket, aws_creds))
+        append_metadata(df, transportation_type, manifest, aws_creds, on_aws, bucket)
+        if not append_summaries(df, transportation_type, aws_creds, on_aws, bucket, layout['summaries']):
+            return False
+        verboseprint(f'Appended {len(df)} rows to {transportation_type}, {manifest["rows"]} rows in total')
+        log(f'Appended {len(df)} rows to {transportation_type}, {manifest["rows"]} rows in total', 'INFO', logger)
+    except Exception as error:
+        verboseprint(
+            f'Error in appending to {transportation_type} - {error}')
+        log(
+            f'Error in appending to {transportation_type} - {error}', 'ERROR', logger)
+        return False
+    return True
+
+
+def write_summaries(transportation_type: str, computed: Dict[str, dict], on_aws: bool, bucket: str,
+                    aws_creds: str) -> None:
+    for dimension, summary in computed.items():
+        write_data_file(f'{transportation_type}/{SUMMARY_DIRECTORY}/{dimension}.json', dumps(summary).encode('utf-8'),
+                        on_aws, bucket, aws_creds)
+    rows = next(iter(computed.values()))['rows']
+    # The manifest goes last, it only lists complete summaries
+    write_data_file(f'{transportation_type}/{SUMMARY_DIRECTORY}/{MANIFEST_NAME}', jsonlib.dumps({
+        'rows': rows, 'groups': {dimension: len(summary['data']) for dimension, summary in computed.items()}},
+        indent=2).encode('utf-8'), on_aws, bucket, aws_creds)
+    verboseprint(f'Summarized {rows} rows of {transportation_type}')
+    log(f'Summarized {rows} rows of {transportation_type}', 'INFO', logger)
+
+
+def append_summaries(df: pd.DataFrame, transportation_type: str, aws_creds: str, on_aws: bool, bucket: str,
+                     summaries: bool) -> bool:
+    """Merge the summaries of the appended rows into {type}/summary/, only ones without sums are recomputed"""
+    storage = get_target_storage(on_aws, bucket, aws_creds)
+    summarized = storage.read_json(f'{transportation_type}/{SUMMARY_DIRECTORY}/{MANIFEST_NAME}') is not None
+    stored = {dimension: storage.read_json(f'{transportation_type}/{SUMMARY_DIRECTORY}/{dimension}.json')
+              for dimension in SUMMARY_DIMENSIONS} if summarized else {}
+    if not summarized or not all(summary is not None and 'sums' in summary for summary in stored.values()):
+        return update_summaries(transportation_type, aws_creds, on_aws, bucket, False, True) if summarized or summaries else True
+    write_summaries(transportation_type, merge_summaries(stored, compute_summaries(df)), on_aws, bucket, aws_creds)
+    return True
+
+
+def update_summaries(transportation_type: str, aws_creds: str, on_aws: bool, bucket: str, on_ddb: bool,
+                     summaries: bool) -> bool:
+    """Compute {type}/summary/ from the dataset files of a generation run with -sm
+
+    A generation without summaries removes the stale ones instead."""
+    if on_ddb and not on_aws:
+        if summaries:
+            # Summaries are computed from the dataset files, a DynamoDB only run has none
+            verboseprint(f'Skipped the {transportation_type} summaries - they need the dataset files on S3 or disk')
+            log(f'Skipped the {transportation_type} summaries - no dataset files', 'WARNING', logger)
+        return True
+    if not summaries:
+        storage = get_target_storage(on_aws, bucket, aws_creds)
+        for name in [MANIFEST_NAME] + [f'{dimension}.json' for dimension in SUMMARY_DIMENSIONS]:
+            storage.delete(f'{transportation_type}/{SUMMARY_DIRECTORY}/{name}')
+        return True
+    # Only the grouped and price columns are read back
+    success, df = get_csv_data(transportation_type, aws_creds, on_aws, bucket, verboseprint, log, logger,
+                               columns=list(dict.fromkeys(sum(SUMMARY_DIMENSIONS.values(), []))) + PRICE_COLUMNS)
+    if not success:
+        verboseprint(f'Error in summarizing {transportation_type} - the dataset files could not be read')
+        log(f'Error in summarizing {transportation_type} - the dataset files could not be read', 'ERROR', logger)
+        return False
+    for column in DATE_COLUMNS:
+        if column in df and pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime('%Y-%m-%d')
+    write_summaries(transportation_type, compute_summaries(df), on_aws, bucket, aws_creds)
+    return True
+
+
 def main():
     global verboseprint
     global log
@@ -112,14 +869,18 @@ def main():
      on_aws,
      bucket,
      on_ddb,
-     json,
+     layout,
      overwrite,
+     append,
+     seed,
+     workers,
+     shard_rows,
      verbose,
      logger) = check_args(sys.argv[1:])
 
     verboseprint, log, logger = get_verbose_logger(verbose, logger)
 
-    if int(generation_number) < 1:
+    if int(generation_number or append) < 1:
         return False
 
     verboseprint((f' ARGUMENTS\n'
@@ -128,49 +889,73 @@ def main():
                   f' on_aws: {on_aws}\n'
                   f' bucket: {bucket}\n'
                   f' on_ddb: {on_ddb}\n'
-                  f' json_file: {json}\n'
+                  f' json_file: {layout["json"]}\n'
                   f' overwrite: {overwrite}\n'
+                  f' append: {append}\n'
+                  f' format: {layout["format"]}\n'
+                  f' compression: {layout["compression"]}\n'
+                  f' json_layout: {layout["json_layout"]}\n'
+                  f' indexes: {layout["indexes"]}\n'
+                  f' summaries: {layout["summaries"]}\n'
+                  f' seed: {seed}\n'
+                  f' workers: {workers}\n'
+                  f' shard_rows: {shard_rows}\n'
                   f' verbose: {verbose}\n'
                   f' logger: {logger}\n'))
 
     for transport_type in transportation_type:
-        if generate_csv_data(int(generation_number), transport_type, aws_creds,
-                             on_aws, bucket, on_ddb, overwrite, json):
+        if append:
+            success = append_data(append, transport_type, aws_creds, on_aws, bucket, on_ddb, layout, seed)
+        elif workers > 1 or shard_rows:
+            success = generate_sharded_data(plan_shards(int(generation_number), workers, shard_rows, seed), workers,
+                                            transport_type, aws_creds, on_aws, bucket, on_ddb, overwrite, layout, seed)
+        else:
+            success = generate_csv_data(int(generation_number), transport_type, aws_creds,
+                                        on_aws, bucket, on_ddb, overwrite, layout, seed)
+        # An append merges its own rows into the summaries, only a generation computes them from the dataset
+        success = success and (bool(append) or update_summaries(transport_type, aws_creds, on_aws, bucket, on_ddb,
+                                                                 layout['summaries']))
+        if success:
 
             verboseprint(
                 f'Successfully generated the {transport_type}.csv file')
-            if json:
+            if layout['json']:
                 verboseprint(
                     f'Successfully generated the json-{transport_type}.json file')
             log(f'Successfully generated the {transport_type}.csv file',
                 'INFO', logger)
-            if json:
+            if layout['json']:
                 log(f'Successfully generated the json-{transport_type}.json file',
                     'INFO', logger)
         else:
             verboseprint(
                 f'Failed to generate the {transport_type}.csv file')
-            if json:
+            if layout['json']:
                 verboseprint(
                     f'Failed to generate the json-{transport_type}.json file')
             log(f'Failed to generate the {transport_type}.csv file',
                 'ERROR', logger)
-            if json:
+            if layout['json']:
                 log(f'Failed to generate the json-{transport_type}.json file',
                     'ERROR', logger)
             return False
+    if on_aws or on_ddb:
+        verboseprint(f'AWS clients: {get_client_stats()}')
     return True
 
 
-def check_args(args=None) -> Tuple[str, str, str, bool, str, bool, bool, bool, bool, bool]:
+def check_args(args=None) -> Tuple[Optional[str], str, str, bool, str, bool, dict, bool, Optional[int], Optional[int], int,
+                                   Optional[int], bool, bool]:
     """Get command line arguments"""
     parser = argparse.ArgumentParser(description="Generate csv file/s")
 
-    parser.add_argument(
+    # Either the whole dataset is generated or only new rows are appended to it
+    rows = parser.add_mutually_exclusive_group(required=True)
+    rows.add_argument(
         "-g", "--generation_number",
         help="Enter how many rows of data you want to generate",
-        required=True,
-        default='default')
+        default=None)
+    get_append(rows)
 
     get_transportation_type(parser)
     get_aws_profile(parser)
@@ -179,6 +964,14 @@ def check_args(args=None) -> Tuple[str, str, str, bool, str, bool, bool, bool, b
     get_on_ddb(parser)
     generate_json_file(parser)
     get_overwrite(parser)
+    get_format(parser)
+    get_compression(parser)
+    get_json_layout(parser)
+    get_indexes(parser)
+    get_summaries(parser)
+    get_seed(parser)
+    get_workers(parser)
+    get_shard_rows(parser)
     get_verbose(parser)
     get_logger(parser)
 
@@ -189,8 +982,15 @@ def check_args(args=None) -> Tuple[str, str, str, bool, str, bool, bool, bool, b
             cmd_line_args.on_aws,
             cmd_line_args.bucket,
             cmd_line_args.on_ddb,
-            cmd_line_args.json,
+            # The options shaping the written files travel together
+            {'json': cmd_line_args.json, 'format': cmd_line_args.format,
+             'compression': cmd_line_args.compression, 'json_layout': cmd_line_args.json_layout,
+             'indexes': cmd_line_args.indexes, 'summaries': cmd_line_args.summaries},
             cmd_line_args.overwrite,
+            cmd_line_args.append,
+            cmd_line_args.seed,
+            cmd_line_args.workers,
+            cmd_line_args.shard_rows,
             cmd_line_args.verbose,
             cmd_line_args.logger
             )
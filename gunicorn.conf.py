@@ -0,0 +1,25 @@
+# gunicorn webapp:server picks this file up from the working directory
+import gc
+import multiprocessing
+import os
+
+bind = f'0.0.0.0:{os.environ.get("PORT", "5000")}'
+# The datasets are loaded once in the master and shared with the workers through fork
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Requests are short, threads let a worker overlap the S3 reads of the index and summary queries
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = 60
+keepalive = 5
+
+
+def when_ready(server):  # pylint: disable=unused-argument
+    # Objects loaded before the fork leave the collected generations, the collector would touch
+    # (and so copy) every shared page in each worker otherwise
+    gc.freeze()
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    # The refresh thread of the master does not survive the fork, each worker refreshes its own store
+    server.app.wsgi().extensions['data_store'].start_refresh()
@@ -1,8 +1,26 @@
-import json
-import os
-from typing import Tuple
+import base64
+import gzip
+import sys
+from functools import lru_cache
+from typing import Optional, Tuple
 import logging
-from common_vars_lambda import transportation_type_list, DATA_DIRECTORY
+from botocore.exceptions import ClientError
+from common_vars_lambda import transportation_type_list, CACHE_TTL_SECONDS, INDEX_DIRECTORY, \
+    SUMMARY_DIRECTORY, LOG_LEVEL, METADATA_SUFFIX
+from compressed_io_lambda import decompress_bytes, sniff_compression
+from json_layout_lambda import dumps, loads, to_layout, from_layout
+from storage_lambda import CachedStorage, S3Storage, get_storage
+
+# Read-through caches of the buckets kept across warm invocations, their entries also hold the decoded
+# bodies and what is derived from them (parsed rows, layouts, indexes)
+cached_storages = {}
+cache_stats = {'hits': 0, 'misses': 0, 'revalidations': 0}
+# Configured once per container. The Lambda runtime already sends the root logger to CloudWatch, so
+# basicConfig only adds a stdout handler when run locally. Nothing is written to the task filesystem.
+logging.basicConfig(stream=sys.stdout, level=LOG_LEVEL,
+                    format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+lambda_logger = logging.getLogger('get_data_lambda')
+lambda_logger.setLevel(LOG_LEVEL)
 
 
 def get_verbose_logger(verbose: bool, logger_arg: bool):
@@ -13,9 +31,27 @@ def get_verbose_logger(verbose: bool, logger_arg: bool):
 
 
 def get_logger_instance() -> logging.Logger:
-    logging.basicConfig(filename='webapp.log', level=logging.INFO, filemode='w',
-                        format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
-    return logging.getLogger(__name__)
+    return lambda_logger
+
+
+@lru_cache(maxsize=None)
+def get_parquet():
+    """Get (pyarrow, pyarrow.parquet), None without pyarrow
+
+    pyarrow is imported on the first parquet read instead of at init, it is the heaviest import of the package."""
+    try:
+        import pyarrow as pa  # pylint: disable=import-outside-toplevel
+        import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return pa, pq
+
+
+@lru_cache(maxsize=None)
+def get_typed_rows():
+    """Get the TypedRows class, numpy is imported on the first query instead of at init"""
+    from typed_rows_lambda import TypedRows  # pylint: disable=import-outside-toplevel
+    return TypedRows
 
 
 def log_msg(msg: str, level: str, logger) -> None:
@@ -36,49 +72,164 @@ def get_json_data(transportation_type: str, aws_profile: str, s3_client,
     try:
         if not transport_in_list:
             return False, json_data
-        if on_aws:
-            if check_if_object_exists_in_s3(bucket, f'{transportation_type}.json', s3_client=s3_client):
-                verboseprint(
-                    f'Object {transportation_type}.json exists in S3, retrieving from S3...')
-                obj = read_object_from_s3(
-                    bucket, f'{transportation_type}.json', s3_client)
-                json_data = json.loads(obj)
-                verboseprint(json_data)
-                return True, json_data
-        elif check_local_exist(transportation_type):
-            verboseprint(
-                f'Object {transportation_type}.json exists locally, retrieving from local...')
-            with open(f'{DATA_DIRECTORY}{transportation_type}.json', encoding='utf-8') as json_file:
-                json_data = json.load(json_file)
-            verboseprint(json_data)
-            return True, json_data
-        return False, json_data
+        storage = get_storage(on_aws, bucket, s3_client)
+        body = storage.read(f'{transportation_type}.json')
+        if body is None:
+            return False, json_data
+        verboseprint(f'Object {transportation_type}.json exists {storage.where}, retrieving...')
+        json_data = from_layout(loads(decompress_bytes(body)))
+        verboseprint(json_data)
+        return True, json_data
     except Exception as e:
         verboseprint(f'Error in get_json_data() - {e}')
         return False, json_data
 
 
-def check_local_exist(transportation_type: str) -> bool:
-    if os.path.exists(f'{DATA_DIRECTORY}{transportation_type}.csv'):
-        return True
-    return False
+def get_cached_storage(s3_client, bucket: str, ttl: float) -> CachedStorage:
+    """Get the read-through cache of a bucket, kept across warm invocations"""
+    if bucket not in cached_storages:
+        cached_storages[bucket] = CachedStorage(S3Storage(bucket, s3_client), ttl, cache_stats)
+    cached_storages[bucket].ttl = ttl
+    return cached_storages[bucket]
 
 
-def check_if_object_exists_in_s3(bucket_name: str, object_name: str, s3_client) -> bool:
-    """Check if object exists in S3"""
-    try:
-        s3_client.head_object(Bucket=bucket_name, Key=object_name)
-        return True
-    except Exception as e:
-        print(e)
-        return False
+def get_cache_entry(transportation_type: str, s3_client, bucket: str, verboseprint,
+                    ttl: float = CACHE_TTL_SECONDS, extension: str = 'json') -> Optional[dict]:
+    """Get the cached raw body of {type}.{extension}, revalidating it against S3 by ETag"""
+    return get_object_entry(f'{transportation_type}.{extension}', s3_client, bucket, verboseprint, ttl,
+                            extension == 'json')
 
 
-def read_object_from_s3(bucket_name: str, object_name: str, s3_client) -> str:
-    """Read object from S3 bucket"""
-    obj = s3_client.get_object(Bucket=bucket_name, Key=object_name).get(
-        'Body').read().decode('utf-8')
-    return obj
+def get_object_entry(object_name: str, s3_client, bucket: str, verboseprint,
+                     ttl: float = CACHE_TTL_SECONDS, text: bool = True) -> Optional[dict]:
+    """Get the cached raw body of any object, decoded when text, revalidating it against S3 by ETag"""
+    try:
+        entry = get_cached_storage(s3_client, bucket, ttl).entry(object_name)
+    except ClientError as e:
+        verboseprint(f'Error in get_object_entry() - {e}')
+        return None
+    if entry is None:
+        verboseprint(f'Object {object_name} not found in S3')
+        return None
+    if 'body' not in entry:
+        raw = entry['raw']
+        body = decompress_bytes(raw)
+        entry['body'] = body.decode('utf-8') if text else body
+        if text and sniff_compression(raw[:4]) == 'gzip':
+            # Stored gzipped already, the gzip response body needs no recompression
+            entry['gzip'] = base64.b64encode(raw).decode('ascii')
+        # Only the decoded body is kept in the warm container
+        entry['raw'] = None
+        verboseprint(f'Object {object_name} retrieved from S3 and cached')
+    return entry
+
+
+def get_cached_json_body(transportation_type: str, s3_client, bucket: str,
+                         verboseprint, ttl: float = CACHE_TTL_SECONDS) -> Tuple[bool, str]:
+    """Get the raw JSON text from S3 without decoding it"""
+    entry = get_cache_entry(transportation_type, s3_client,
+                            bucket, verboseprint, ttl)
+    if entry is None:
+        return False, ''
+    return True, entry['body']
+
+
+def get_cached_gzip_body(transportation_type: str, s3_client, bucket: str,
+                         verboseprint, ttl: float = CACHE_TTL_SECONDS) -> Tuple[bool, str]:
+    """Get the gzipped, base64 encoded JSON text, compressed once per ETag"""
+    entry = get_cache_entry(transportation_type, s3_client,
+                            bucket, verboseprint, ttl)
+    if entry is None:
+        return False, ''
+    if 'gzip' not in entry:
+        entry['gzip'] = gzip_base64(entry['body'])
+    return True, entry['gzip']
+
+
+def get_cached_layout_body(transportation_type: str, s3_client, bucket: str, verboseprint,
+                           layout: str, use_gzip: bool, ttl: float = CACHE_TTL_SECONDS) -> Tuple[bool, str]:
+    """Get the dataset as minified JSON in the requested layout, encoded once per ETag"""
+    success, rows = get_cached_rows(transportation_type, s3_client, bucket, verboseprint, ttl)
+    if not success:
+        return False, ''
+    layouts = get_cache_entry(transportation_type, s3_client, bucket, verboseprint, ttl).setdefault('layouts', {})
+    if (layout, use_gzip) not in layouts:
+        body = dumps(to_layout(rows.to_json_data(), layout, f'{transportation_type}_number'))
+        layouts[(layout, use_gzip)] = gzip_base64(body) if use_gzip else body
+    return True, layouts[(layout, use_gzip)]
+
+
+def get_cached_rows(transportation_type: str, s3_client, bucket: str,
+                    verboseprint, ttl: float = CACHE_TTL_SECONDS) -> Tuple[bool, object]:
+    """Get the rows of {type}.json as typed columns, encoded once per ETag instead of kept as dicts"""
+    entry = get_cache_entry(transportation_type, s3_client, bucket, verboseprint, ttl)
+    if entry is None:
+        return False, None
+    if 'rows' not in entry:
+        entry['rows'] = get_typed_rows().from_json_data(from_layout(loads(entry['body'])))
+    return True, entry['rows']
+
+
+def get_cached_index(transportation_type: str, s3_client, bucket: str,
+                     verboseprint, ttl: float = CACHE_TTL_SECONDS) -> Tuple[bool, object]:
+    """Get the typed rows answering queries, from {type}.parquet, or {type}.json without pyarrow"""
+    if get_parquet() is not None:
+        entry = get_cache_entry(transportation_type, s3_client, bucket,
+                                verboseprint, ttl, 'parquet')
+        if entry is not None:
+            if 'rows' not in entry:
+                pa, pq = get_parquet()
+                entry['rows'] = get_typed_rows().from_table(pq.read_table(pa.BufferReader(entry['body'])),
+                                                            f'{transportation_type}_number')
+            return True, entry['rows']
+    return get_cached_rows(transportation_type, s3_client, bucket, verboseprint, ttl)
+
+
+def get_cached_index_object(transportation_type: str, name: str, s3_client, bucket: str,
+                            verboseprint, ttl: float = CACHE_TTL_SECONDS) -> Optional[dict]:
+    """Get a parsed object under {type}/index/, None if the dataset has no such index object"""
+    entry = get_object_entry(f'{transportation_type}/{INDEX_DIRECTORY}/{name}', s3_client, bucket, verboseprint, ttl)
+    if entry is None:
+        return None
+    if 'data' not in entry:
+        entry['data'] = loads(entry['body'])
+    return entry['data']
+
+
+def get_cached_summary(transportation_type: str, dimension: str, s3_client, bucket: str,
+                       verboseprint, ttl: float = CACHE_TTL_SECONDS) -> Optional[dict]:
+    """Get a parsed {type}/summary/{dimension}.json, kept across warm invocations until its ETag changes"""
+    entry = get_object_entry(f'{transportation_type}/{SUMMARY_DIRECTORY}/{dimension}.json', s3_client, bucket,
+                             verboseprint, ttl)
+    if entry is None:
+        return None
+    if 'data' not in entry:
+        entry['data'] = loads(entry['body'])
+    return entry['data']
+
+
+def get_cached_metadata_body(transportation_type: str, s3_client, bucket: str,
+                             verboseprint, ttl: float = CACHE_TTL_SECONDS) -> Optional[str]:
+    """Get the raw {type}.meta.json written by the generator, None for a dataset without one"""
+    entry = get_object_entry(f'{transportation_type}{METADATA_SUFFIX}', s3_client, bucket, verboseprint, ttl)
+    return None if entry is None else entry['body']
+
+
+def gzip_base64(body: str) -> str:
+    """Gzip a response body and base64 encode it for API Gateway binary responses"""
+    return base64.b64encode(gzip.compress(body.encode('utf-8'), compresslevel=6)).decode('ascii')
+
+
+def get_cache_stats() -> dict:
+    """Get the hit/miss/revalidation counters of the warm container cache"""
+    return dict(cache_stats, entries=sum(len(storage.entries) for storage in cached_storages.values()))
+
+
+def clear_cache() -> None:
+    """Drop every cached dataset and reset the counters"""
+    cached_storages.clear()
+    for stat in cache_stats:
+        cache_stats[stat] = 0
 
 
 def transport_in_list(value: str) -> bool:
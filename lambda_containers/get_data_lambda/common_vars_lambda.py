@@ -6,3 +6,24 @@ FLIGHTS = 'flights'
 BUS = 'bus'
 TRAIN = 'train'
 transportation_type_list = [FLIGHTS, BUS, TRAIN]
+# Seconds a cached dataset is served without asking S3 if it changed.
+# 0 means every invocation revalidates with a conditional GET.
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '0'))
+# Columns of the served rows stored as int32 days, minutes and uint16 prices in memory
+DATE_COLUMNS = ['from_date', 'to_date']
+TIME_COLUMNS = ['departure', 'arrival']
+PRICE_COLUMNS = ['economy', 'eusiness', 'first_class']
+# Outcome of a single round trip S3 read
+OBJECT_FOUND = 'found'
+OBJECT_NOT_FOUND = 'not_found'
+OBJECT_NOT_MODIFIED = 'not_modified'
+# Bucket holding the datasets, and the level of the get_data_lambda logger
+DATA_BUCKET = os.environ.get('DATA_BUCKET', 'web-app-python')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+# Secondary index objects live under {type}/index/, listed in {type}/index/manifest.json
+INDEX_DIRECTORY = 'index'
+MANIFEST_NAME = 'manifest.json'
+# Price statistics by route, country and date live under {type}/summary/{group_by}.json
+SUMMARY_DIRECTORY = 'summary'
+# Row count, sizes, schema and ranges of a dataset, written by the generator next to {type}.json
+METADATA_SUFFIX = '.meta.json'
@@ -1,20 +1,136 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import json
-import boto3
-from common_funcs_lambda import get_json_data, get_verbose_logger
+from aws_clients_lambda import get_client, get_client_stats
+from common_funcs_lambda import get_cached_json_body, get_cached_gzip_body, \
+    get_cached_layout_body, get_cached_index, get_cached_index_object, get_cached_summary, get_cache_stats, \
+    get_cached_metadata_body, get_verbose_logger
+from common_vars_lambda import MANIFEST_NAME, DATA_BUCKET
+from query_data_lambda import has_query, parse_query
+from secondary_index_lambda import run_index_query
+from summaries_lambda import has_summary_query, parse_summary_query, run_summary_query
+from json_layout_lambda import dumps, get_layout, to_layout
 
+# Built once during the container init, every invocation reuses them
+verboseprint, log, logger = get_verbose_logger(True, True)
+s3_client = get_client('s3')
 
-def get_data(transportation_type):
-    verboseprint, log, _ = get_verbose_logger(True, True)
-    s3_client = boto3.client('s3', region_name='eu-west-2')
-    tupl = get_json_data(transportation_type=transportation_type, aws_profile='', s3_client=s3_client, on_aws=True,
-                         bucket='web-app-python', verboseprint=verboseprint, log=log, logger=True)
+
+def get_body(transportation_type, use_gzip, layout=None):
+    """Get the stored JSON text as the response body, skipping the decode/encode round trip unless a layout is asked for"""
+    if layout is not None:
+        tupl = get_cached_layout_body(transportation_type, s3_client, DATA_BUCKET, verboseprint, layout, use_gzip)
+    else:
+        get_body_func = get_cached_gzip_body if use_gzip else get_cached_json_body
+        tupl = get_body_func(transportation_type=transportation_type, s3_client=s3_client,
+                             bucket=DATA_BUCKET, verboseprint=verboseprint)
+    verboseprint(f'Cache stats: {get_cache_stats()}, client stats: {get_client_stats()}')
     if tupl[0]:
         return tupl[1]
     return None
 
 
+def get_indexed_result(transportation_type, query):
+    """Answer a route, country or single date query from the secondary index objects, None without them"""
+    manifest = get_cached_index_object(transportation_type, MANIFEST_NAME, s3_client, DATA_BUCKET, verboseprint)
+    if manifest is None:
+        return None
+    return run_index_query(manifest, query, lambda name: get_cached_index_object(
+        transportation_type, name, s3_client, DATA_BUCKET, verboseprint))
+
+
+def get_query_result(transportation_type, query):
+    """Answer a filtered/paged query from the secondary indexes, or the cached full index"""
+    result = get_indexed_result(transportation_type, query)
+    if result is not None:
+        verboseprint(f'Query answered from the secondary index, client stats: {get_client_stats()}')
+        return result
+    success, rows = get_cached_index(transportation_type=transportation_type, s3_client=s3_client,
+                                     bucket=DATA_BUCKET, verboseprint=verboseprint)
+    verboseprint(f'Cache stats: {get_cache_stats()}, client stats: {get_client_stats()}')
+    if success:
+        return rows.run_query(query)
+    return None
+
+
+def query_response(transportation_type, params, layout):
+    if has_stats_query(params):
+        return stats_response(transportation_type)
+    if has_summary_query(params):
+        return summary_response(transportation_type, params)
+    success, query = parse_query(params)
+    if not success:
+        return {
+            'statusCode': 400,
+            'body': json.dumps(query['error'])
+        }
+    result = get_query_result(transportation_type, query)
+    if result is None:
+        return {
+            'statusCode': 400,
+            'body': json.dumps('data not found')
+        }
+    result['items'] = to_layout(result['items'], layout, f'{transportation_type}_number')
+    return {
+        'statusCode': 200,
+        'body': dumps(result)
+    }
+
+
+def summary_response(transportation_type, params):
+    """Answer a group_by query from the precomputed summary, a few KB instead of the dataset"""
+    success, query = parse_summary_query(params)
+    if not success:
+        return {
+            'statusCode': 400,
+            'body': json.dumps(query['error'])
+        }
+    summary = get_cached_summary(transportation_type, query['group_by'], s3_client, DATA_BUCKET, verboseprint)
+    if summary is None:
+        return {
+            'statusCode': 400,
+            'body': json.dumps('summary not found')
+        }
+    return {
+        'statusCode': 200,
+        'body': dumps(run_summary_query(summary, query))
+    }
+
+
+def has_stats_query(params: dict) -> bool:
+    return params.get('stats', '').lower() in ('1', 'true')
+
+
+def stats_response(transportation_type):
+    """Answer with {type}.meta.json as written by the generator, a HEAD-sized read instead of the dataset"""
+    body = get_cached_metadata_body(transportation_type, s3_client, DATA_BUCKET, verboseprint)
+    if body is None:
+        return {
+            'statusCode': 400,
+            'body': json.dumps('stats not found')
+        }
+    return {
+        'statusCode': 200,
+        'body': body
+    }
+
+
+def get_query_params(event) -> dict:
+    """Get the query parameters of a mapping template or proxy integration event"""
+    params = {key: value for key, value in event.items() if isinstance(value, str)}
+    params.update(event.get('queryStringParameters') or {})
+    return params
+
+
+def accepts_gzip(event) -> bool:
+    """Check if the caller asked for a gzipped binary response"""
+    if event.get('gzip') is True:
+        return True
+    headers = event.get('headers') or {}
+    accept_encoding = headers.get('Accept-Encoding', headers.get('accept-encoding', ''))
+    return 'gzip' in accept_encoding
+
+
 def lambda_handler(event, context):
     if 'transportation_type' in event:
         transportation_type = event['transportation_type']
@@ -24,15 +140,35 @@ def lambda_handler(event, context):
             'body': json.dumps('transportation_type not found in event')
         }
 
-    data = get_data(transportation_type)
+    params = get_query_params(event)
+    success, layout = get_layout(params)
+    if not success:
+        return {
+            'statusCode': 400,
+            'body': json.dumps(layout)
+        }
+    if has_query(params) or has_summary_query(params) or has_stats_query(params):
+        return query_response(transportation_type, params, layout)
+
+    use_gzip = accepts_gzip(event)
+    body = get_body(transportation_type, use_gzip, layout if params.get('layout') else None)
 
-    if data is None:
+    if body is None:
+        log(f'{transportation_type} not found in {DATA_BUCKET}', 'WARNING', logger)
         return {
             'statusCode': 400,
             'body': json.dumps('data not found')
         }
 
+    if use_gzip:
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+            'isBase64Encoded': True,
+            'body': body
+        }
+
     return {
         'statusCode': 200,
-        'body': json.dumps(data)
+        'body': body
     }
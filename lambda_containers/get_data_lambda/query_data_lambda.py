@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Query parsing and row matching of utils/query_data.py, the Lambda answers queries from typed_rows_lambda
+# so the dict index (build_index, run_query) is left out
+from typing import Tuple
+
+# Query parameter -> column matched exactly through an inverted index
+MATCH_FILTERS = {'from_city': 'from_city', 'to_city': 'to_city',
+                 'from_country': 'from_Country', 'to_country': 'to_Country'}
+PRICE_CLASSES = {'economy': 'economy',
+                 'business': 'eusiness', 'first_class': 'first_class'}
+QUERY_PARAMS = list(MATCH_FILTERS) + ['date_from', 'date_to', 'price_class', 'min_price',
+                                      'max_price', 'limit', 'cursor', 'fields']
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def has_query(params: dict) -> bool:
+    return any(param in params for param in QUERY_PARAMS)
+
+
+def parse_query(params: dict) -> Tuple[bool, dict]:
+    """Turn request parameters into a query, or an error message on invalid input"""
+    query = {'match': {}, 'ranges': {}, 'limit': DEFAULT_LIMIT,
+             'cursor': params.get('cursor') or None, 'fields': None}
+    try:
+        for param, column in MATCH_FILTERS.items():
+            if params.get(param):
+                query['match'][column] = params[param]
+        if params.get('date_from') or params.get('date_to'):
+            query['ranges']['from_date'] = (params.get('date_from') or None,
+                                            params.get('date_to') or None)
+        price_class = params.get('price_class') or 'economy'
+        if price_class not in PRICE_CLASSES:
+            raise ValueError(f'price_class must be one of {list(PRICE_CLASSES)}')
+        if params.get('min_price') or params.get('max_price'):
+            query['ranges'][PRICE_CLASSES[price_class]] = (
+                int(params['min_price']) if params.get('min_price') else None,
+                int(params['max_price']) if params.get('max_price') else None)
+        if params.get('limit'):
+            query['limit'] = int(params['limit'])
+        if not 1 <= query['limit'] <= MAX_LIMIT:
+            raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+        if params.get('fields'):
+            query['fields'] = [field for field in str(params['fields']).split(',') if field]
+    except ValueError as e:
+        return False, {'error': f'Invalid query - {e}'}
+    return True, query
+
+
+def row_matches(row: dict, query: dict) -> bool:
+    for column, value in query['match'].items():
+        if row.get(column) != value:
+            return False
+    for column, (low, high) in query['ranges'].items():
+        value = row.get(column)
+        if value is None or (low is not None and value < low) or (high is not None and value > high):
+            return False
+    return True
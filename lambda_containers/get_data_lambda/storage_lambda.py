@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import io
+import os
+from abc import ABC, abstractmethod
+import time
+from itertools import count
+from typing import Optional, Tuple
+from botocore.exceptions import ClientError
+from common_vars_lambda import DATA_DIRECTORY, OBJECT_FOUND, OBJECT_NOT_FOUND, OBJECT_NOT_MODIFIED
+from compressed_io_lambda import decompress_bytes
+from json_layout_lambda import loads
+
+
+# Read side of utils/storage.py, the Lambda never writes the datasets
+class Storage(ABC):
+    """Objects of the datasets by name ('flights.json', 'flights/manifest.json', ...), wherever they are kept
+
+    get is the read primitive every other read goes through: it takes the version of a copy the caller already
+    has (S3 ETag, file mtime and size, memory counter) and returns OBJECT_NOT_MODIFIED instead of the body.
+    A backend implements get and size, the other methods are built on them."""
+    where = 'in storage'
+
+    @abstractmethod
+    def get(self, name: str, version: Optional[str] = None) -> Tuple[str, Optional[bytes], Optional[str]]:
+        """Get the status, body and version of an object, no body when it matches the given version"""
+
+    @abstractmethod
+    def size(self, name: str) -> Optional[int]:
+        """Get the size of an object in bytes, None if it does not exist"""
+
+    def read(self, name: str) -> Optional[bytes]:
+        status, body, _ = self.get(name)
+        return body if status == OBJECT_FOUND else None
+
+    def read_json(self, name: str):
+        """Get a parsed json object, decompressing a gzip or zstd body, None if it does not exist"""
+        body = self.read(name)
+        return None if body is None else loads(decompress_bytes(body))
+
+    def open(self, name: str):
+        """Get a binary file-like object to stream the object from, None if it does not exist"""
+        body = self.read(name)
+        return None if body is None else io.BytesIO(body)
+
+    def exists(self, name: str) -> bool:
+        return self.size(name) is not None
+
+
+class LocalStorage(Storage):
+    """Files under DATA_DIRECTORY, versioned by mtime and size"""
+    where = 'locally'
+
+    def __init__(self, root: str = DATA_DIRECTORY):
+        self.root = root
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def get(self, name: str, version: Optional[str] = None) -> Tuple[str, Optional[bytes], Optional[str]]:
+        try:
+            stat = os.stat(self.path(name))
+        except FileNotFoundError:
+            return OBJECT_NOT_FOUND, None, None
+        current = f'{stat.st_mtime_ns}-{stat.st_size}'
+        if current == version:
+            return OBJECT_NOT_MODIFIED, None, version
+        with open(self.path(name), 'rb') as local_file:
+            return OBJECT_FOUND, local_file.read(), current
+
+    def open(self, name: str):
+        return open(self.path(name), 'rb') if os.path.exists(self.path(name)) else None
+
+    def size(self, name: str) -> Optional[int]:
+        return os.path.getsize(self.path(name)) if os.path.exists(self.path(name)) else None
+
+
+class S3Storage(Storage):
+    """Objects of a bucket, versioned by ETag"""
+    where = 'in S3'
+
+    def __init__(self, bucket: str, s3_client):
+        self.bucket = bucket
+        self.s3_client = s3_client
+
+    def get(self, name: str, version: Optional[str] = None) -> Tuple[str, Optional[bytes], Optional[str]]:
+        status, response = get_object_from_s3(self.bucket, name, self.s3_client, if_none_match=version)
+        if status != OBJECT_FOUND:
+            return status, None, version if status == OBJECT_NOT_MODIFIED else None
+        return status, response['Body'].read(), response['ETag']
+
+    def open(self, name: str):
+        status, response = get_object_from_s3(self.bucket, name, self.s3_client)
+        return response['Body'] if status == OBJECT_FOUND else None
+
+    def size(self, name: str) -> Optional[int]:
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket, Key=name)['ContentLength']
+        except ClientError:
+            return None
+
+
+class MemoryStorage(Storage):
+    """Objects in a dict of the process, for tests without disk or network"""
+    where = 'in memory'
+
+    def __init__(self):
+        self.objects = {}
+        self.versions = count(1)
+
+    def get(self, name: str, version: Optional[str] = None) -> Tuple[str, Optional[bytes], Optional[str]]:
+        if name not in self.objects:
+            return OBJECT_NOT_FOUND, None, None
+        current, body = self.objects[name]
+        if current == version:
+            return OBJECT_NOT_MODIFIED, None, version
+        return OBJECT_FOUND, body, current
+
+    def put(self, name: str, body: bytes) -> None:
+        self.objects[name] = (str(next(self.versions)), bytes(body))
+
+    def size(self, name: str) -> Optional[int]:
+        return len(self.objects[name][1]) if name in self.objects else None
+
+
+class CachedStorage(Storage):
+    """Read-through cache in front of another storage, a cached copy is revalidated by version after ttl seconds
+
+    Callers can keep what they derive from a body (parsed rows, indexes) in its entry, the entry is
+    replaced as soon as the object changes. A caller keeping a decoded copy can set 'raw' to None."""
+
+    def __init__(self, backend: Storage, ttl: float = 0.0, stats: Optional[dict] = None):
+        self.backend = backend
+        self.where = backend.where
+        self.ttl = ttl
+        self.entries = {}
+        self.stats = stats if stats is not None else {'hits': 0, 'misses': 0, 'revalidations': 0}
+
+    def entry(self, name: str) -> Optional[dict]:
+        cached = self.entries.get(name)
+        now = time.monotonic()
+        if cached and now - cached['checked'] < self.ttl:
+            self.stats['hits'] += 1
+            return cached
+        status, body, version = self.backend.get(name, cached['version'] if cached else None)
+        if status == OBJECT_NOT_MODIFIED:
+            self.stats['revalidations'] += 1
+            cached['checked'] = now
+            return cached
+        if status == OBJECT_NOT_FOUND:
+            self.entries.pop(name, None)
+            return None
+        self.stats['misses'] += 1
+        self.entries[name] = {'version': version, 'raw': body, 'checked': now}
+        return self.entries[name]
+
+    def get(self, name: str, version: Optional[str] = None) -> Tuple[str, Optional[bytes], Optional[str]]:
+        entry = self.entry(name)
+        if entry is None:
+            return OBJECT_NOT_FOUND, None, None
+        if entry['version'] == version:
+            return OBJECT_NOT_MODIFIED, None, version
+        return OBJECT_FOUND, self.raw(name, entry), entry['version']
+
+    def raw(self, name: str, entry: dict) -> bytes:
+        return self.backend.read(name) if entry['raw'] is None else entry['raw']
+
+    def read_json(self, name: str):
+        """Get a parsed json object, parsed once per version"""
+        entry = self.entry(name)
+        if entry is None:
+            return None
+        if 'json' not in entry:
+            entry['json'] = loads(decompress_bytes(self.raw(name, entry)))
+        return entry['json']
+
+    def size(self, name: str) -> Optional[int]:
+        return self.backend.size(name)
+
+
+def get_storage(on_aws: bool, bucket: str, s3_client) -> Storage:
+    """Get the storage the on_aws flag points to"""
+    return S3Storage(bucket, s3_client) if on_aws else LocalStorage()
+
+
+def get_object_from_s3(bucket_name: str, object_name: str, s3_client,
+                       byte_range: Optional[Tuple[int, Optional[int]]] = None,
+                       if_none_match: Optional[str] = None) -> Tuple[str, dict]:
+    """Get an object in one round trip, a missing or unchanged object is a status rather than an error"""
+    args = {'Bucket': bucket_name, 'Key': object_name}
+    if byte_range is not None:
+        start, end = byte_range
+        args['Range'] = f'bytes={start}-{"" if end is None else end}'
+    if if_none_match is not None:
+        args['IfNoneMatch'] = if_none_match
+    try:
+        return OBJECT_FOUND, s3_client.get_object(**args)
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code in ('NoSuchKey', '404', 'NotFound'):
+            return OBJECT_NOT_FOUND, {}
+        if code in ('304', 'NotModified'):
+            return OBJECT_NOT_MODIFIED, {}
+        raise
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import re
+from bisect import bisect_left, bisect_right
+from itertools import repeat
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from common_vars_lambda import DATE_COLUMNS, TIME_COLUMNS, PRICE_COLUMNS
+
+KEY_PATTERN = re.compile(r'(\D*)(\d+)')
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+TIME_PATTERN = re.compile(r'([01]\d|2[0-3]):[0-5]\d')
+# Columns looked up by exact value keep their row ids grouped by value, like the inverted index of query_data
+POSTING_COLUMNS = ['from_city', 'to_city', 'from_Country', 'to_Country']
+# Rows compared at once when a query scans instead of walking postings
+SCAN_BLOCK_ROWS = 65536
+
+
+# Value of a column absent from a row, left out of the row on output
+MISSING = object()
+
+
+def factorize(values: list) -> Tuple[np.ndarray, list]:
+    """Get the code of every value and the distinct values in order of first appearance"""
+    labels = {label: code for code, label in enumerate(dict.fromkeys(values))}
+    return np.fromiter(map(labels.__getitem__, values), dtype=np.int64, count=len(values)), list(labels)
+
+
+def column_values(rows: list, name: str) -> list:
+    try:
+        return list(map(itemgetter(name), rows))
+    except KeyError:
+        return [row.get(name, MISSING) for row in rows]
+
+
+def smallest_uint(count: int):
+    return next(dtype for dtype in (np.uint8, np.uint16, np.uint32) if count <= np.iinfo(dtype).max + 1)
+
+
+def typed_labels(column: str, labels: list) -> Optional[np.ndarray]:
+    """Get the typed value of every distinct value: int32 days, minutes or uint16 prices, None to keep codes"""
+    if column in DATE_COLUMNS and all(isinstance(label, str) and DATE_PATTERN.fullmatch(label) for label in labels):
+        try:
+            days = np.array(labels, dtype='datetime64[D]')
+        except ValueError:
+            return None
+        # 2025-02-30 would be stored as another day
+        return days.astype(np.int32) if np.datetime_as_string(days).tolist() == labels else None
+    if column in TIME_COLUMNS and all(isinstance(label, str) and TIME_PATTERN.fullmatch(label) for label in labels):
+        return np.array([int(label[:2]) * 60 + int(label[3:]) for label in labels], dtype=np.uint16)
+    if column in PRICE_COLUMNS and all(isinstance(label, int) and not isinstance(label, bool) and 0 <= label <= 0xFFFF
+                                        for label in labels):
+        return np.array(labels, dtype=np.uint16)
+    return None
+
+
+def encode_column(column: str, codes: np.ndarray, labels: list) -> dict:
+    """Store a column as typed values when every value has the column type, as dictionary codes otherwise
+
+    A typed column keeps its sorted distinct values and their labels to decode rows and compare with bounds."""
+    typed = typed_labels(column, labels)
+    if typed is None:
+        return {'codes': codes.astype(smallest_uint(len(labels))), 'labels': labels}
+    values = typed[codes]
+    order = np.argsort(typed, kind='stable')
+    sorted_labels = [labels[i] for i in order]
+    return {'values': values, 'uniques': typed[order], 'labels': sorted_labels,
+            'decoded': np.array(sorted_labels, dtype=object)}
+
+
+def encode_keys(keys: list) -> dict:
+    """Store 'F000123' keys as numbers when they share a prefix and a width, as strings otherwise"""
+    match = KEY_PATTERN.fullmatch(keys[0]) if keys and isinstance(keys[0], str) else None
+    if match and len(match.group(2)) <= 18:
+        prefix, size = match.group(1), len(keys[0])
+        digits = [key[len(prefix):] for key in keys]
+        if all(isinstance(key, str) and len(key) == size and key.startswith(prefix) for key in keys) \
+                and all(map(str.isdigit, digits)) and all(map(str.isascii, digits)):
+            return {'prefix': prefix, 'width': size - len(prefix), 'numbers': np.array(digits).astype(np.int64)}
+    return {'strings': list(keys)}
+
+
+class TypedRows:
+    """Rows of a dataset as typed columns ordered by key, materialized as dicts only when they are output
+
+    Places are dictionary codes, dates int32 day numbers, times minutes and prices uint16: 1M flights take
+    ~30MB instead of a dict per row. Columns whose values do not all fit their type keep dictionary codes."""
+
+    def __init__(self, keys: dict, columns: Dict[str, dict]):
+        self.keys = keys
+        self.columns = columns
+        self.has_missing = any(MISSING in column.get('labels', ()) for column in columns.values())
+        self.postings = {name: self.build_postings(columns[name]) for name in POSTING_COLUMNS
+                         if name in columns and 'codes' in columns[name]}
+        self.label_codes = {}
+
+    @classmethod
+    def from_json_data(cls, json_data: dict) -> 'TypedRows':
+        """Encode an orient='index' dataset, every column of any row becomes a column"""
+        keys = list(json_data)
+        rows = list(json_data.values())
+        names = list(dict.fromkeys(name for row in rows for name in row))
+        encoded = {name: factorize(column_values(rows, name)) for name in names}
+        return cls.ordered(keys, {name: encode_column(name, *encoded[name]) for name in names})
+
+    @classmethod
+    def from_table(cls, table, type_number: str) -> 'TypedRows':
+        """Encode a typed pyarrow table (columnar dataset), dictionary columns keep their codes"""
+        columns = {}
+        for name in table.column_names:
+            if name == type_number:
+                continue
+            values = table[name].combine_chunks()
+            if values.null_count:
+                columns[name] = encode_column(name, *factorize(values.to_pylist()))
+                continue
+            if str(values.type) in ('string', 'large_string'):
+                values = values.dictionary_encode()
+            if hasattr(values, 'indices'):
+                codes, labels = values.indices.to_numpy(zero_copy_only=False).astype(np.int64), values.dictionary.to_pylist()
+            else:
+                uniques, codes = np.unique(values.to_numpy(zero_copy_only=False), return_inverse=True)
+                labels = (np.datetime_as_string(uniques, unit='D') if uniques.dtype.kind == 'M' else uniques).tolist()
+            columns[name] = encode_column(name, codes, labels)
+        return cls.ordered(table[type_number].to_pylist(), columns)
+
+    @classmethod
+    def ordered(cls, keys: list, columns: Dict[str, dict]) -> 'TypedRows':
+        """Sort the rows by key, the order the paging cursor walks"""
+        encoded = encode_keys(keys)
+        if 'numbers' in encoded:
+            order = np.argsort(encoded['numbers'], kind='stable')
+            encoded['numbers'] = encoded['numbers'][order]
+        else:
+            order = np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int64)
+            encoded['strings'] = [keys[i] for i in order]
+        for column in columns.values():
+            for field in ('codes', 'values'):
+                if field in column:
+                    column[field] = column[field][order]
+        return cls(encoded, columns)
+
+    @staticmethod
+    def build_postings(column: dict) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the row ids grouped by code, ascending within a code, and where each code starts"""
+        order = np.argsort(column['codes'], kind='stable').astype(np.uint32)
+        starts = np.searchsorted(column['codes'][order], np.arange(len(column['labels']) + 1))
+        return order, starts
+
+    def __len__(self) -> int:
+        return len(self.keys['numbers'] if 'numbers' in self.keys else self.keys['strings'])
+
+    def key(self, row_id: int) -> str:
+        if 'numbers' in self.keys:
+            return f'{self.keys["prefix"]}{int(self.keys["numbers"][row_id]):0{self.keys["width"]}d}'
+        return self.keys['strings'][row_id]
+
+    def keys_at(self, row_ids) -> List[str]:
+        if 'numbers' in self.keys:
+            prefix, width = self.keys['prefix'], self.keys['width']
+            return [f'{prefix}{number:0{width}d}' for number in self.keys['numbers'][row_ids].tolist()]
+        strings = self.keys['strings']
+        return strings[row_ids] if isinstance(row_ids, slice) else [strings[row_id] for row_id in row_ids]
+
+    def decode(self, name: str, row_ids) -> list:
+        column = self.columns[name]
+        if 'codes' in column:
+            labels = column['labels']
+            return [labels[code] for code in column['codes'][row_ids].tolist()]
+        return column['decoded'][np.searchsorted(column['uniques'], column['values'][row_ids])].tolist()
+
+    def iter_rows(self, row_ids=slice(None), fields: Optional[List[str]] = None) -> Iterator[Tuple[str, dict]]:
+        """Materialize (key, row) pairs, the row projected to fields when given"""
+        names = [name for name in (fields or self.columns) if name in self.columns]
+        keys = self.keys_at(row_ids)
+        decoded = zip(*(self.decode(name, row_ids) for name in names)) if names else repeat((), len(keys))
+        for key, values in zip(keys, decoded):
+            if self.has_missing:
+                yield key, {name: value for name, value in zip(names, values) if value is not MISSING}
+            else:
+                yield key, dict(zip(names, values))
+
+    def to_json_data(self) -> dict:
+        """Get the orient='index' dataset back, e.g. to encode a whole layout once"""
+        return dict(self.iter_rows())
+
+    def code_of(self, name: str, value) -> Optional[int]:
+        """Get the dictionary code of a value, None when no row has it"""
+        if name not in self.label_codes:
+            self.label_codes[name] = {label: code for code, label in enumerate(self.columns[name]['labels'])
+                                      if label is not MISSING}
+        try:
+            return self.label_codes[name].get(value)
+        except TypeError:
+            return None
+
+    def count(self, row_ids) -> int:
+        return len(range(len(self))[row_ids]) if isinstance(row_ids, slice) else len(row_ids)
+
+    def match_mask(self, name: str, value, row_ids) -> np.ndarray:
+        column = self.columns[name]
+        if 'codes' in column:
+            code = self.code_of(name, value)
+            if code is None:
+                return np.zeros(self.count(row_ids), dtype=bool)
+            return column['codes'][row_ids] == code
+        labels = column['labels']
+        try:
+            position = bisect_left(labels, value)
+        except TypeError:
+            # A value of another type equals none of the column values
+            position = len(labels)
+        if position == len(labels) or labels[position] != value:
+            return np.zeros(self.count(row_ids), dtype=bool)
+        return column['values'][row_ids] == column['uniques'][position]
+
+    def range_mask(self, name: str, low, high, row_ids) -> np.ndarray:
+        """Compare with the bounds like the decoded values would be, a missing or null value never matches"""
+        column = self.columns[name]
+        if 'codes' in column:
+            inside = [code for code, label in enumerate(column['labels']) if label is not MISSING and label is not None
+                      and (low is None or label >= low) and (high is None or label <= high)]
+            return np.isin(column['codes'][row_ids], inside)
+        labels = column['labels']
+        start = bisect_left(labels, low) if low is not None else 0
+        end = bisect_right(labels, high) if high is not None else len(labels)
+        if start >= end:
+            return np.zeros(self.count(row_ids), dtype=bool)
+        values = column['values'][row_ids]
+        return (values >= column['uniques'][start]) & (values <= column['uniques'][end - 1])
+
+    def query_mask(self, query: dict, row_ids) -> Optional[np.ndarray]:
+        """Get which rows match every filter, None for a query without filters"""
+        masks = []
+        for name, value in query['match'].items():
+            masks.append(self.match_mask(name, value, row_ids) if name in self.columns
+                         else np.zeros(self.count(row_ids), dtype=bool))
+        for name, (low, high) in query['ranges'].items():
+            masks.append(self.range_mask(name, low, high, row_ids) if name in self.columns
+                         else np.zeros(self.count(row_ids), dtype=bool))
+        return np.logical_and.reduce(masks) if masks else None
+
+    def get_candidates(self, query: dict) -> Optional[np.ndarray]:
+        """Get the ascending row ids of the rarest matched value, None to scan every row"""
+        postings = []
+        for name, value in query['match'].items():
+            if name in self.postings:
+                code = self.code_of(name, value)
+                order, starts = self.postings[name]
+                postings.append(order[starts[code]:starts[code + 1]] if code is not None else order[:0])
+        return min(postings, key=len) if postings else None
+
+    def run_query(self, query: dict) -> dict:
+        """Get one page of matching rows of a parse_query query, projected to the requested fields"""
+        start = bisect_right(KeyView(self), query['cursor']) if query['cursor'] else 0
+        candidates = self.get_candidates(query)
+        found = []
+        if candidates is not None:
+            candidates = candidates[np.searchsorted(candidates, start):].astype(np.int64)
+            mask = self.query_mask(query, candidates)
+            found.append(candidates if mask is None else candidates[mask])
+        else:
+            for block in range(start, len(self), SCAN_BLOCK_ROWS):
+                rows = slice(block, min(block + SCAN_BLOCK_ROWS, len(self)))
+                mask = self.query_mask(query, rows)
+                found.append(np.arange(rows.start, rows.stop) if mask is None else np.flatnonzero(mask) + block)
+                if sum(map(len, found)) >= query['limit']:
+                    break
+        row_ids = np.concatenate(found)[:query['limit']] if found else np.zeros(0, dtype=np.int64)
+        items = dict(self.iter_rows(row_ids, query['fields']))
+        next_cursor = self.key(int(row_ids[-1])) if len(items) == query['limit'] else None
+        return {'items': items, 'count': len(items), 'next_cursor': next_cursor}
+
+
+class KeyView:
+    """Keys of typed rows as a sequence for bisect, each one formatted on access"""
+
+    def __init__(self, rows: TypedRows):
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, row_id: int) -> str:
+        return self.rows.key(row_id)
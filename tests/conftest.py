@@ -0,0 +1,21 @@
+from typing import Optional
+import boto3
+import pytest
+from moto import mock_aws
+
+REGION = 'eu-west-2'
+
+
+@pytest.fixture(name='make_bucket')
+def fixture_make_bucket():
+    """Get a function creating a moto S3 bucket with its seed objects and returning the client, for the test"""
+    with mock_aws():
+        s3_client = boto3.client('s3', region_name=REGION)
+
+        def make_bucket(bucket: str, objects: Optional[dict] = None):
+            s3_client.create_bucket(Bucket=bucket, CreateBucketConfiguration={'LocationConstraint': REGION})
+            for key, body in (objects or {}).items():
+                s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+            return s3_client
+
+        yield make_bucket
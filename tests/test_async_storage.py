@@ -0,0 +1,57 @@
+import asyncio
+import json
+import threading
+import time
+from async_storage import gather_bounded, get_semaphore, read_object_from_s3_async, write_object_to_s3_async, \
+    check_if_object_exists_in_s3_async
+from get_json_length import get_json_lengths
+
+BUCKET = 'web-app-python'
+TYPES = ['flights', 'bus', 'train']
+
+
+def test_gather_bounded_limits_concurrency() -> None:
+    # Blocking calls should overlap, but never more than the limit at once
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0}
+
+    def slow_call(value: int) -> int:
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+        time.sleep(0.05)
+        with lock:
+            state['running'] -= 1
+        return value
+
+    start = time.perf_counter()
+    results = asyncio.run(gather_bounded([(slow_call, (i,)) for i in range(8)], limit=4))
+    assert results == list(range(8))
+    assert state['peak'] == 4
+    assert time.perf_counter() - start < 8 * 0.05
+
+
+def test_async_s3_round_trip(capsys, make_bucket) -> None:
+    # Every type should be written, found and read back concurrently
+    s3_client = make_bucket(BUCKET)
+
+    async def round_trip():
+        semaphore = get_semaphore(2)
+        await asyncio.gather(*(write_object_to_s3_async(BUCKET, f'{ttype}.json', ttype * 2, s3_client, semaphore)
+                               for ttype in TYPES))
+        exists = await asyncio.gather(*(check_if_object_exists_in_s3_async(BUCKET, f'{ttype}.json', s3_client, semaphore)
+                                        for ttype in TYPES))
+        bodies = await asyncio.gather(*(read_object_from_s3_async(BUCKET, f'{ttype}.json', s3_client, semaphore)
+                                        for ttype in TYPES))
+        return exists, bodies
+
+    exists, bodies = asyncio.run(round_trip())
+    assert exists == [True] * 3
+    assert bodies == [ttype * 2 for ttype in TYPES]
+    # The row counts come from the metadata sidecars, a type without one falls back to counting its json rows
+    for rows, ttype in enumerate(TYPES[:2], 1):
+        s3_client.put_object(Bucket=BUCKET, Key=f'{ttype}.meta.json', Body=json.dumps({'rows': rows * 1000}))
+    s3_client.put_object(Bucket=BUCKET, Key='train.json', Body=json.dumps({'T000001': {}, 'T000002': {}}))
+    assert asyncio.run(get_json_lengths(TYPES, '', True, BUCKET, 2, lambda *a: None, lambda *a: None, None)) == \
+        [1000, 2000, 2]
+    assert capsys.readouterr().out.split() == ['1000', '2000', '2']
@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
+from moto import mock_aws
+from aws_clients import get_client, get_client_stats, clear_clients, MAX_POOL_CONNECTIONS
+from common_funcs import get_s3_client, get_ddb_client
+
+
+@mock_aws
+def test_clients_are_shared_per_service() -> None:
+    # The helpers should hand out the one client per profile, region and service
+    clear_clients()
+    s3_client = get_s3_client('')
+    assert get_client('s3') is s3_client
+    assert get_ddb_client('') is not s3_client
+    assert get_client('s3', region='us-east-1') is not s3_client
+    assert s3_client.meta.config.max_pool_connections == MAX_POOL_CONNECTIONS
+    stats = get_client_stats()
+    assert stats['created'] == 3 and stats['reused'] == 1 and stats['clients'] == 3
+
+
+@mock_aws
+def test_clients_created_once_across_threads() -> None:
+    # Concurrent first use should still build a single client and count its requests
+    clear_clients()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        s3_clients = list(executor.map(lambda _: get_client('s3'), range(64)))
+    assert all(s3_client is s3_clients[0] for s3_client in s3_clients)
+    s3_clients[0].list_buckets()
+    stats = get_client_stats()
+    assert stats['created'] == 1 and stats['reused'] == 63 and stats['requests'] == 1
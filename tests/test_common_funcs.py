@@ -0,0 +1,38 @@
+import pytest
+from aws_clients import clear_clients, get_client_stats
+from common_funcs import get_verbose_logger, get_object_from_s3, get_s3_client
+from storage import get_json_data
+from common_vars import OBJECT_FOUND, OBJECT_NOT_FOUND, OBJECT_NOT_MODIFIED
+
+BUCKET = 'web-app-python'
+
+
+@pytest.fixture(name='s3_client')
+def fixture_s3_client(make_bucket):
+    s3_client = make_bucket(BUCKET, {'flights.json': '{"F000001": {"economy": 100}}'})
+    clear_clients()
+    return s3_client
+
+
+def test_get_object_statuses(s3_client) -> None:
+    # Found, ranged, unchanged and missing objects should each come back as a status
+    status, response = get_object_from_s3(BUCKET, 'flights.json', s3_client)
+    assert status == OBJECT_FOUND
+    etag = response['ETag']
+    status, response = get_object_from_s3(BUCKET, 'flights.json', s3_client, byte_range=(2, 8))
+    assert status == OBJECT_FOUND and response['Body'].read() == b'F000001'
+    status, response = get_object_from_s3(BUCKET, 'flights.json', s3_client, byte_range=(25, None))
+    assert response['Body'].read() == b'00}}'
+    assert get_object_from_s3(BUCKET, 'flights.json', s3_client, if_none_match=etag) == (OBJECT_NOT_MODIFIED, {})
+    assert get_object_from_s3(BUCKET, 'bus.json', s3_client) == (OBJECT_NOT_FOUND, {})
+
+
+def test_get_json_data_single_request(s3_client, capsys) -> None:
+    # A read should be one GetObject and a miss should neither raise nor print the error
+    verboseprint, log, logger = get_verbose_logger(False, False)
+    assert get_json_data('flights', '', None, True, BUCKET, verboseprint, log, logger) == \
+        (True, {'F000001': {'economy': 100}})
+    assert get_json_data('bus', '', None, True, BUCKET, verboseprint, log, logger) == (False, {})
+    assert get_client_stats()['operations'] == {'GetObject': 2}
+    assert capsys.readouterr().out == ''
+    assert get_s3_client('') is not s3_client
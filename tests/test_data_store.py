@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import json
+import os
+import sys
+import data_store
+from common_vars import DATA_DIRECTORY, MANIFEST_NAME
+from data_store import DataStore
+from generate_csv_data import generate_columnar, generate_json, populate_df, main
+from json_layout import to_layout
+from storage import S3Storage, MemoryStorage
+
+BUCKET = 'store-bucket'
+
+
+def get_body(store: DataStore, transportation_type: str, layout: str, use_gzip: bool) -> tuple:
+    chunks, etag = store.get_body(transportation_type, layout, use_gzip)
+    return b''.join(chunks), etag
+
+
+def test_store_swaps_changed_local_dataset() -> None:
+    # An unchanged file is not read again, a rewritten one is swapped in with a new ETag and index
+    path = os.path.join(DATA_DIRECTORY, 'test.json')
+    with open(path, 'w', encoding='utf-8') as json_file:
+        json.dump({'T000001': {'from_city': 'Paris', 'economy': 100}}, json_file)
+    store = DataStore(['test'])
+    assert store.load('test') is True and store.load('test') is False
+    body, etag = get_body(store, 'test', 'index', False)
+    assert json.loads(body) == {'T000001': {'from_city': 'Paris', 'economy': 100}}
+    gzip_body, gzip_etag = get_body(store, 'test', 'index', True)
+    assert gzip.decompress(gzip_body) == body and gzip_etag == f'{etag}-gz'
+    assert json.loads(get_body(store, 'test', 'records', False)[0])['columns'] == ['test_number', 'from_city', 'economy']
+    with open(path, 'w', encoding='utf-8') as json_file:
+        json.dump({'T000002': {'from_city': 'Rome', 'economy': 200}}, json_file)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1000))
+    store.load_all()
+    assert store.get_body('test', 'index', False)[1] != etag
+    assert dict(store.get('test')['rows'].iter_rows()) == {'T000002': {'from_city': 'Rome', 'economy': 200}}
+    os.remove(path)
+    store.load_all()
+    assert store.get('test') is None
+
+
+def test_store_keeps_gzipped_bodies(monkeypatch) -> None:
+    # A gzipped body is encoded once per version and layout, a plain one or one over the cap every time
+    storage = MemoryStorage()
+    storage.put('bus.json', json.dumps({'B000001': {'economy': 100}}).encode('utf-8'))
+    store = DataStore(['bus'], storage)
+    store.load('bus')
+    body, etag = get_body(store, 'bus', 'records', True)
+    monkeypatch.setattr(data_store, 'iter_layout', None)
+    assert get_body(store, 'bus', 'records', True) == (body, etag) and len(store.bodies) == 1
+    monkeypatch.undo()
+    storage.put('bus.json', json.dumps({'B000002': {'economy': 200}}).encode('utf-8'))
+    store.load('bus')
+    assert not store.bodies
+    monkeypatch.setattr(data_store, 'BODY_CACHE_BYTES', 10)
+    assert json.loads(gzip.decompress(get_body(store, 'bus', 'index', True)[0])) == {'B000002': {'economy': 200}}
+    assert not store.bodies
+
+
+def test_store_revalidates_s3_dataset(make_bucket) -> None:
+    # The refresh sends a conditional GET, only a new ETag reloads the dataset
+    s3_client = make_bucket(BUCKET, {'flights.json': json.dumps({'F000001': {'economy': 100}})})
+    store = DataStore(['flights', 'bus'], S3Storage(BUCKET, s3_client))
+    store.load_all()
+    assert store.get('bus') is None
+    entry = store.get('flights')
+    assert store.load('flights') is False and store.get('flights') is entry
+    s3_client.put_object(Bucket=BUCKET, Key='flights.json', Body=json.dumps({'F000002': {'economy': 200}}))
+    assert store.load('flights') is True
+    assert store.get('flights')['rows'].keys_at(slice(None)) == ['F000002']
+
+
+def test_store_reads_memory_storage() -> None:
+    # Any storage backend can feed the store, a put object is reloaded under its new version
+    storage = MemoryStorage()
+    storage.put('bus.json', json.dumps({'B000001': {'economy': 100}}).encode('utf-8'))
+    store = DataStore(['bus'], storage)
+    assert store.load('bus') is True and store.load('bus') is False
+    storage.put('bus.json', json.dumps({'B000002': {'economy': 200}}).encode('utf-8'))
+    assert store.load('bus') is True and store.get('bus')['rows'].keys_at(slice(None)) == ['B000002']
+    storage.delete('bus.json')
+    assert store.load('bus') is True and store.get('bus') is None
+
+
+def test_store_prefers_arrow_source(monkeypatch) -> None:
+    # {type}.arrow is loaded without parsing json, with the parts appended on top of it once there is a manifest
+    df, type_number = populate_df(50, 'bus', 3)
+    storage = MemoryStorage()
+    storage.put('bus.arrow', generate_columnar(df, 'arrow'))
+    storage.put('bus.json', json.dumps({'B000001': {'economy': 100}}).encode('utf-8'))
+    store = DataStore(['bus'], storage)
+    assert store.load('bus') is True and store.get('bus')['source'] == 'bus.arrow'
+    # Streamed over several chunks, every layout is the JSON to_layout gives for the whole dataset
+    monkeypatch.setattr(data_store, 'BODY_CHUNK_ROWS', 7)
+    data = dict(sorted(json.loads(generate_json(df, type_number)).items()))
+    for layout in ['index', 'records', 'columns']:
+        assert json.loads(get_body(store, 'bus', layout, False)[0]) == to_layout(data, layout, type_number)
+    part = generate_columnar(df.assign(bus_number=df['bus_number'].str.replace('B', 'C')), 'arrow')
+    storage.put('bus/part-00000.arrow', part)
+    storage.put(f'bus/{MANIFEST_NAME}', json.dumps({'base': True, 'parts': [
+        {'file': 'part-00000.arrow', 'format': 'arrow', 'sha256': hashlib.sha256(part).hexdigest()}]}).encode('utf-8'))
+    assert store.load('bus') is True and len(store.get('bus')['rows']) == 100
+
+
+def test_store_reads_sharded_parts() -> None:
+    # A sharded dataset is loaded from the parts of its manifest, not from the json of an earlier run
+    sys.argv = ['main.py', '-g', '9', '-type', 'test', '-o', '-j']
+    assert main() is True
+    store = DataStore(['test'])
+    assert store.load('test') is True and len(store.get('test')['rows']) == 9
+    sys.argv = ['main.py', '-g', '7', '-type', 'test', '-o', '-j', '-w', '2', '-s', '1']
+    assert main() is True
+    assert store.load('test') is True and store.get('test')['source'] == f'test/{MANIFEST_NAME}'
+    with open(os.path.join(DATA_DIRECTORY, 'test.json'), encoding='utf-8') as json_file:
+        assert dict(store.get('test')['rows'].iter_rows()) == json.load(json_file)
+    assert store.load('test') is False
+    # Back to a single file, the manifest is removed
+    sys.argv = ['main.py', '-g', '3', '-type', 'test', '-o']
+    assert main() is True
@@ -0,0 +1,117 @@
+import boto3
+import pytest
+from moto import mock_aws
+import common_funcs
+from common_funcs import write_ddb_object, write_ddb_batch, to_ddb_items, ensure_ddb_indexes
+from generate_csv_data import populate_df, with_route
+
+TABLE = 'webapp-flights'
+
+
+@pytest.fixture(name='ddb_client')
+def fixture_ddb_client():
+    with mock_aws():
+        ddb_client = boto3.client('dynamodb', region_name='eu-west-2')
+        ddb_client.create_table(TableName=TABLE, BillingMode='PAY_PER_REQUEST',
+                                KeySchema=[{'AttributeName': 'flights_number', 'KeyType': 'HASH'}],
+                                AttributeDefinitions=[{'AttributeName': 'flights_number', 'AttributeType': 'S'}])
+        yield ddb_client
+
+
+class FlakyClient:  # pylint: disable=too-few-public-methods
+    """Leave the last item of the first requests unprocessed, like a throttled table would"""
+
+    def __init__(self, ddb_client, failures: int):
+        self.ddb_client = ddb_client
+        self.failures = failures
+        self.calls = 0
+
+    def batch_write_item(self, RequestItems):  # pylint: disable=invalid-name
+        self.calls += 1
+        if self.calls > self.failures:
+            return self.ddb_client.batch_write_item(RequestItems=RequestItems)
+        if len(RequestItems[TABLE]) > 1:
+            self.ddb_client.batch_write_item(RequestItems={TABLE: RequestItems[TABLE][:-1]})
+        return {'UnprocessedItems': {TABLE: RequestItems[TABLE][-1:]}}
+
+
+class BackfillingClient:
+    """Report each new GSI as CREATING for the first describes, like a real table backfilling it"""
+
+    def __init__(self, ddb_client, polls: int):
+        self.ddb_client = ddb_client
+        self.polls = polls
+        self.calls = []
+
+    def describe_table(self, TableName):  # pylint: disable=invalid-name
+        table = self.ddb_client.describe_table(TableName=TableName)
+        for index in table['Table'].get('GlobalSecondaryIndexes', []):
+            polled = self.calls.count(('describe', index['IndexName']))
+            if polled < self.polls:
+                index['IndexStatus'] = 'CREATING'
+            self.calls.append(('describe', index['IndexName']))
+        return table
+
+    def update_table(self, **kwargs):
+        self.calls.append(('create', kwargs['GlobalSecondaryIndexUpdates'][0]['Create']['IndexName']))
+        return self.ddb_client.update_table(**kwargs)
+
+
+def test_write_ddb_object_typed_items(ddb_client) -> None:
+    # Every unique key should land in the table with prices stored as numbers
+    df, _ = populate_df(120, 'flights', seed=1)
+    stats = write_ddb_object(ddb_client, TABLE, df, workers=4)
+    unique = df['flights_number'].nunique()
+    assert stats['items'] == unique
+    assert stats['batches'] == -(-unique // 25)
+    assert ddb_client.scan(TableName=TABLE, Select='COUNT')['Count'] == unique
+    row = df.drop_duplicates('flights_number', keep='last').iloc[0]
+    item = ddb_client.get_item(TableName=TABLE, Key={'flights_number': {'S': row['flights_number']}})['Item']
+    assert item['economy'] == {'N': str(row['economy'])}
+    assert item['from_date'] == {'S': row['from_date']}
+
+
+def test_write_ddb_batch_retries_unprocessed(ddb_client) -> None:
+    # Unprocessed items should be sent again until the table takes them
+    df, _ = populate_df(10, 'flights', seed=2)
+    items = to_ddb_items(df)
+    client = FlakyClient(ddb_client, failures=1)
+    assert write_ddb_batch(client, TABLE, items) == 1
+    assert client.calls == 2
+    assert ddb_client.scan(TableName=TABLE, Select='COUNT')['Count'] == len(items)
+
+
+def test_write_ddb_batch_gives_up(ddb_client) -> None:
+    # A table that never catches up should raise once the retries are spent
+    df, _ = populate_df(10, 'flights', seed=2)
+    client = FlakyClient(ddb_client, failures=100)
+    with pytest.raises(RuntimeError):
+        write_ddb_batch(client, TABLE, to_ddb_items(df), max_retries=2)
+
+
+def test_ensure_ddb_indexes_route_query(ddb_client) -> None:
+    # The GSIs are created once and the route attribute makes a route and date lookup a single Query
+    assert len(ensure_ddb_indexes(ddb_client, TABLE)) == 3
+    assert not ensure_ddb_indexes(ddb_client, TABLE)
+    df, _ = populate_df(60, 'flights', seed=2)
+    write_ddb_object(ddb_client, TABLE, with_route(df))
+    row = df.iloc[0]
+    response = ddb_client.query(TableName=TABLE, IndexName='route-index',
+                                KeyConditionExpression='#route = :route AND from_date = :date',
+                                ExpressionAttributeNames={'#route': 'route'},
+                                ExpressionAttributeValues={':route': {'S': f'{row["from_city"]}|{row["to_city"]}'},
+                                                           ':date': {'S': row['from_date']}})
+    assert row['flights_number'] in {item['flights_number']['S'] for item in response['Items']}
+
+
+def test_ensure_ddb_indexes_waits_for_backfill(ddb_client, monkeypatch) -> None:
+    # The table is ACTIVE while an index backfills, the next create only goes out once that index is ACTIVE
+    sleeps = []
+    monkeypatch.setattr(common_funcs.time, 'sleep', sleeps.append)
+    client = BackfillingClient(ddb_client, polls=2)
+    assert ensure_ddb_indexes(client, TABLE) == ['route-index', 'from_Country-index', 'from_date-index']
+    creates = [index_number for index_number, call in enumerate(client.calls) if call[0] == 'create']
+    assert len(creates) == 3 and len(sleeps) == 6
+    # route-index was described CREATING twice then ACTIVE before from_Country-index was created
+    route_polls = [call for call in client.calls[creates[0]:creates[1]] if call == ('describe', 'route-index')]
+    assert len(route_polls) == 3
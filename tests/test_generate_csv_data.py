@@ -1,7 +1,20 @@
+import gzip
+import json
+import os
 import sys
+from datetime import date
+import pandas as pd
 import pytest
+import generate_csv_data
+from common_vars import DATA_DIRECTORY, MANIFEST_NAME
+from common_funcs import get_verbose_logger
+from storage import get_json_data
+from compressed_io import decompress_bytes
+from get_data import get_csv_data
+from dataset_metadata import describe_rows
+import get_json_length
 # import main from generate_csv_data.py
-from generate_csv_data import main
+from generate_csv_data import main, populate_df, check_args, generate_json
 
 # For now its take off as we need to give aws creds to run the tests
 # def test_generate_csv_data_aws_pass():
@@ -47,3 +60,161 @@ def test_generate_csv_data_no_args_fail() -> None:
         sys.argv = ['main.py']
         main()
     assert excinfo.value.code == 2
+
+
+class NextDecade(date):
+    @classmethod
+    def today(cls):
+        return cls(2031, 1, 1)
+
+
+def test_populate_df_seed_and_schema(monkeypatch) -> None:
+    # The same seed should give the same rows with the original header, on any day
+    df, type_number = populate_df(100, 'flights', seed=7)
+    assert type_number == 'flights_number'
+    assert list(df.columns) == ['flights_number', 'from_Country', 'to_Country', 'from_city', 'to_city',
+                                'from_date', 'to_date', 'departure', 'arrival',
+                                'economy', 'eusiness', 'first_class']
+    assert df.equals(populate_df(100, 'flights', seed=7)[0])
+    monkeypatch.setattr(generate_csv_data, 'date', NextDecade)
+    assert df.equals(populate_df(100, 'flights', seed=7)[0])
+    assert populate_df(100, 'flights')[0]['from_date'].astype(str).min() >= '2030-01-01'
+    assert df['flights_number'].str.match(r'^F\d{6}$').all()
+    assert df['economy'].between(100, 1000).all() and (df['economy'] % 100 == 0).all()
+    assert df['first_class'].between(2000, 3000).all()
+
+
+def test_generate_csv_data_sharded_pass() -> None:
+    # This should pass and write 3 part files plus a manifest that reads back in parallel, the json parts merged
+    # into test.json in place of the one of the earlier unsharded run
+    sys.argv = ['main.py', '-g', '8', '-type', 'test', '-o', '-j']
+    assert main() is True
+    sys.argv = ['main.py', '-g', '12', '-type', 'test', '-o', '-j', '-w', '2', '-sr', '5', '-s', '1']
+    assert main() is True
+    with open(f'{DATA_DIRECTORY}test/{MANIFEST_NAME}', encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+    assert [part['rows'] for part in manifest['parts']] == [5, 5, 2]
+    assert {part['format'] for part in manifest['parts']} == {'csv'} and not os.path.exists(f'{DATA_DIRECTORY}test.csv')
+    assert not os.path.exists(f'{DATA_DIRECTORY}test/part-00000.json')
+    with open(f'{DATA_DIRECTORY}test.json', encoding='utf-8') as json_file:
+        assert len(json.load(json_file)) == 12
+    success, df = get_csv_data('test', '', False, '', print, lambda *a, **k: None, None)
+    assert success is True
+    assert len(df) == 12
+    # Regenerating without shards should drop the manifest so readers use test.csv, and the json of the shards
+    sys.argv = ['main.py', '-g', '3', '-type', 'test', '-o']
+    assert main() is True
+    assert len(get_csv_data('test', '', False, '', print, lambda *a, **k: None, None)[1]) == 3
+    assert not os.path.exists(f'{DATA_DIRECTORY}test.json')
+
+
+def test_generate_csv_data_batches_pass(monkeypatch) -> None:
+    # Rows written batch by batch should add up to one csv, json and parquet file
+    monkeypatch.setattr(generate_csv_data, 'BATCH_ROWS', 4)
+    sys.argv = ['main.py', '-g', '10', '-type', 'test', '-o', '-j', '-f', 'parquet', '-s', '2']
+    assert main() is True
+    assert len(pd.read_csv(f'{DATA_DIRECTORY}test.csv')) == 10
+    with open(f'{DATA_DIRECTORY}test.json', encoding='utf-8') as json_file:
+        assert len(json.load(json_file)) == 10
+    assert len(pd.read_parquet(f'{DATA_DIRECTORY}test.parquet')) == 10
+    os.remove(f'{DATA_DIRECTORY}test.parquet')
+
+
+@pytest.mark.parametrize('codec, magic', [('gzip', b'\x1f\x8b'), ('zstd', b'\x28\xb5\x2f\xfd')])
+def test_generate_csv_data_compressed_pass(monkeypatch, codec, magic) -> None:
+    # Compressed csv and json keep their names and read back transparently
+    monkeypatch.setattr(generate_csv_data, 'BATCH_ROWS', 4)
+    sys.argv = ['main.py', '-g', '10', '-type', 'test', '-o', '-j', '-z', codec, '-s', '2']
+    assert main() is True
+    for extension in ('csv', 'json'):
+        with open(f'{DATA_DIRECTORY}test.{extension}', 'rb') as data_file:
+            assert data_file.read(4).startswith(magic)
+    verboseprint, log, logger = get_verbose_logger(False, False)
+    assert len(get_csv_data('test', '', False, '', verboseprint, log, logger)[1]) == 10
+    assert len(get_json_data('test', '', None, False, '', verboseprint, log, logger)[1]) == 10
+    sys.argv = ['main.py', '-g', '1', '-type', 'test', '-o', '-j']
+    assert main() is True
+
+
+def test_generate_csv_data_records_layout_pass(monkeypatch) -> None:
+    # A records json spliced batch by batch reads back as the same rows as the csv
+    monkeypatch.setattr(generate_csv_data, 'BATCH_ROWS', 4)
+    sys.argv = ['main.py', '-g', '10', '-type', 'test', '-o', '-j', '-jl', 'records', '-s', '2']
+    assert main() is True
+    with open(f'{DATA_DIRECTORY}test.json', encoding='utf-8') as json_file:
+        records = json.load(json_file)
+    assert records['columns'][0] == 'test_number' and len(records['data']) == 10
+    verboseprint, log, logger = get_verbose_logger(False, False)
+    json_data = get_json_data('test', '', None, False, '', verboseprint, log, logger)[1]
+    df = pd.read_csv(f'{DATA_DIRECTORY}test.csv')
+    assert json_data[df['test_number'][0]]['economy'] == df['economy'][0]
+    sys.argv = ['main.py', '-g', '1', '-type', 'test', '-o', '-j']
+    assert main() is True
+
+
+@pytest.mark.parametrize('json_layout', ['index', 'records'])
+def test_generate_csv_data_append_pass(json_layout) -> None:
+    # Appended rows get new keys, a part on top of test.csv and are spliced into the json file
+    sys.argv = ['main.py', '-g', '20', '-type', 'test', '-o', '-j', '-jl', json_layout, '-s', '3']
+    assert main() is True
+    before = os.path.getsize(f'{DATA_DIRECTORY}test.csv')
+    for seed in ('4', '5'):
+        sys.argv = ['main.py', '-a', '5', '-type', 'test', '-j', '-s', seed]
+        assert main() is True
+    assert os.path.getsize(f'{DATA_DIRECTORY}test.csv') == before
+    with open(f'{DATA_DIRECTORY}test/{MANIFEST_NAME}', encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+    assert manifest['base'] is True and manifest['rows'] == 30
+    assert [part['file'] for part in manifest['parts']] == ['part-00000.csv', 'part-00001.csv']
+    verboseprint, log, logger = get_verbose_logger(False, False)
+    df = get_csv_data('test', '', False, '', verboseprint, log, logger)[1]
+    json_data = get_json_data('test', '', None, False, '', verboseprint, log, logger)[1]
+    assert len(df) == 30
+    new_keys = set(df['test_number'][20:])
+    assert len(new_keys) == 10 and not new_keys & set(df['test_number'][:20])
+    assert new_keys <= set(json_data)
+    # A json file without rows yet takes the appended ones without a leading comma, in place or recompressed
+    empty = generate_json(populate_df(1, 'test')[0].iloc[:0], 'test_number', json_layout).encode('utf-8')
+    for body in (empty, gzip.compress(empty)):
+        with open(f'{DATA_DIRECTORY}test.json', 'wb') as json_file:
+            json_file.write(body)
+        sys.argv = ['main.py', '-a', '3', '-type', 'test', '-j', '-s', '6']
+        assert main() is True
+        with open(f'{DATA_DIRECTORY}test.json', 'rb') as json_file:
+            appended = json.loads(decompress_bytes(json_file.read()))
+        assert len(appended if json_layout == 'index' else appended['data']) == 3
+    sys.argv = ['main.py', '-g', '1', '-type', 'test', '-o', '-j']
+    assert main() is True
+    assert not os.path.exists(f'{DATA_DIRECTORY}test/{MANIFEST_NAME}')
+
+
+def test_generate_csv_data_metadata_pass(monkeypatch) -> None:
+    # test.meta.json describes the rows written batch by batch and follows appends, get_json_length only reads it
+    monkeypatch.setattr(generate_csv_data, 'BATCH_ROWS', 4)
+    verboseprint, log, logger = get_verbose_logger(False, False)
+    sys.argv = ['main.py', '-g', '10', '-type', 'test', '-o', '-j', '-s', '6']
+    assert main() is True
+    sys.argv = ['main.py', '-a', '5', '-type', 'test', '-j', '-s', '7']
+    assert main() is True
+    with open(f'{DATA_DIRECTORY}test.meta.json', encoding='utf-8') as metadata_file:
+        metadata = json.load(metadata_file)
+    df = get_csv_data('test', '', False, '', verboseprint, log, logger)[1]
+    assert metadata['rows'] == 15 and metadata['checksum'] == describe_rows(df)['checksum']
+    assert metadata['bytes'] == {'csv': os.path.getsize(f'{DATA_DIRECTORY}test.csv') + os.path.getsize(
+        f'{DATA_DIRECTORY}test/part-00000.csv'), 'json': os.path.getsize(f'{DATA_DIRECTORY}test.json')}
+    assert metadata['schema']['from_date'] == 'date' and metadata['schema']['economy'] == 'integer'
+    assert metadata['prices']['economy'] == [int(df['economy'].min()), int(df['economy'].max())]
+    assert metadata['dates']['from_date'][0] == df['from_date'].min().strftime('%Y-%m-%d')
+    assert metadata['generated_at'] <= metadata['updated_at']
+    monkeypatch.setattr(get_json_length, 'get_json_data', None)
+    assert get_json_length.get_json_length('test', '', False, '', verboseprint, log, logger) == 15
+    sys.argv = ['main.py', '-g', '1', '-type', 'test', '-o', '-j']
+    assert main() is True
+
+
+def test_generate_csv_data_append_args_fail() -> None:
+    # Generating and appending at once is rejected, appending to DynamoDB alone has no manifest to track keys
+    with pytest.raises(SystemExit):
+        check_args(['-g', '1', '-a', '1', '-type', 'test'])
+    sys.argv = ['main.py', '-a', '1', '-type', 'test', '-onddb']
+    assert main() is False
@@ -1,6 +1,12 @@
+import os
 import sys
+import pyarrow as pa
 import pytest
-from get_data import main
+import generate_csv_data
+from common_vars import DATA_DIRECTORY
+from common_funcs import get_verbose_logger
+from get_data import main, read_csv_stream, read_columnar_table, get_csv_data, map_columnar_table
+from storage import LocalStorage
 
 # The tests may fail if the csv files are not in the correct location!
 
@@ -34,3 +40,55 @@ def test_csv_data_no_args_fail() -> None:
 #     # This should pass as the type is correct
 #     sys.argv = ['main.py', '-type', 'flights', '-v', '-onaws', '-u', 'webapp', '-b', 'web-app-python']
 #     assert main() is True
+
+
+def test_read_csv_stream_typed(tmp_path) -> None:
+    # Quoted commas survive and the file-like body gives the same frame as the path
+    csv = tmp_path / 'flights.csv'
+    csv.write_text('flights_number,from_Country,to_Country,from_city,to_city,from_date,to_date,'
+                   'departure,arrival,economy,eusiness,first_class\n'
+                   'F000001,United States,France,"Washington, D.C.",Paris,2025-05-01,2025-05-02,10:00,12:00,100,1100,2100\n'
+                   'F000002,France,Italy,Paris,Rome,2025-06-01,2025-06-02,08:00,09:30,200,1200,2200\n',
+                   encoding='utf-8')
+    df = read_csv_stream(str(csv), chunksize=1)
+    with open(csv, 'rb') as body:
+        assert read_csv_stream(body, chunksize=1).equals(df)
+    assert df['from_city'].tolist() == ['Washington, D.C.', 'Paris']
+    assert str(df['from_city'].dtype) == 'category'
+    assert str(df['economy'].dtype) == 'int16'
+    assert str(df['from_date'].dtype).startswith('datetime64')
+    assert read_csv_stream(str(csv), columns=['flights_number'], filters=[('economy', '>', 100)])[
+        'flights_number'].tolist() == ['F000002']
+
+
+def test_arrow_file_mapped_in_place(monkeypatch) -> None:
+    # The batched arrow file is uncompressed, its columns are read from the mapped pages without a copy
+    monkeypatch.setattr(generate_csv_data, 'BATCH_ROWS', 4)
+    sys.argv = ['main.py', '-g', '10', '-type', 'test', '-o', '-f', 'arrow', '-s', '2']
+    assert generate_csv_data.main() is True
+    mapped = LocalStorage().map('test.arrow')
+    start = pa.py_buffer(mapped).address
+    table = read_columnar_table(pa.BufferReader(mapped), 'arrow')
+    assert table.num_rows == 10 and table['economy'].num_chunks == 3
+    for chunk in table['economy'].chunks:
+        assert start <= chunk.buffers()[1].address < start + len(mapped)
+    verboseprint, log, logger = get_verbose_logger(False, False)
+    success, df = get_csv_data('test', '', False, '', verboseprint, log, logger, ['test_number'],
+                               [('economy', '>', 500)])
+    assert success and df['test_number'].tolist() == [key for key, economy in zip(
+        table['test_number'].to_pylist(), table['economy'].to_pylist()) if economy > 500]
+    for extension in ('arrow', 'csv', 'meta.json'):
+        os.remove(f'{DATA_DIRECTORY}test.{extension}')
+
+
+def test_mapped_table_survives_regeneration() -> None:
+    # A regeneration replaces {type}.arrow instead of truncating it, a live mapped table keeps the old rows
+    sys.argv = ['main.py', '-g', '10', '-type', 'test', '-o', '-f', 'arrow', '-s', '2']
+    assert generate_csv_data.main() is True
+    table = map_columnar_table('test', LocalStorage())
+    rows = table.to_pylist()
+    sys.argv = ['main.py', '-g', '3', '-type', 'test', '-o', '-f', 'arrow', '-s', '3']
+    assert generate_csv_data.main() is True
+    assert table.to_pylist() == rows and map_columnar_table('test', LocalStorage()).num_rows == 3
+    for extension in ('arrow', 'csv', 'meta.json'):
+        os.remove(f'{DATA_DIRECTORY}test.{extension}')
@@ -0,0 +1,140 @@
+import base64
+import gzip
+import json
+import subprocess
+import sys
+import pandas as pd
+import pytest
+from common_funcs_lambda import get_cached_rows, get_cached_json_body, get_cached_gzip_body, \
+    get_cached_index, get_cached_layout_body, get_cache_stats, clear_cache
+from generate_csv_data import generate_columnar, populate_df, SecondaryIndexWriter, write_index_manifest
+import get_data_lambda
+from get_data_lambda import accepts_gzip, get_query_result
+from query_data_lambda import parse_query
+
+BUCKET = 'web-app-python'
+HEADER = ['flights_number', 'from_Country', 'to_Country', 'from_city', 'to_city', 'from_date', 'to_date',
+          'departure', 'arrival', 'economy', 'eusiness', 'first_class']
+
+
+@pytest.fixture(name='s3_client')
+def fixture_s3_client(make_bucket):
+    s3_client = make_bucket(BUCKET, {'flights.json': json.dumps({'F000001': {'economy': 100}})})
+    clear_cache()
+    return s3_client
+
+
+def test_cache_revalidates_unchanged_object(s3_client) -> None:
+    # The second call should send a conditional GET and reuse the typed rows
+    first = get_cached_rows('flights', s3_client, BUCKET, print)
+    second = get_cached_rows('flights', s3_client, BUCKET, print)
+    assert first[0] is second[0] is True and first[1] is second[1]
+    assert dict(first[1].iter_rows()) == {'F000001': {'economy': 100}}
+    stats = get_cache_stats()
+    assert (stats['misses'], stats['revalidations'], stats['hits']) == (1, 1, 0)
+
+
+def test_cache_ttl_hit(s3_client) -> None:
+    # Within the TTL the cached body is served without touching S3
+    get_cached_json_body('flights', s3_client, BUCKET, print, ttl=60)
+    s3_client.delete_object(Bucket=BUCKET, Key='flights.json')
+    assert get_cached_json_body('flights', s3_client, BUCKET, print, ttl=60)[0] is True
+    assert get_cache_stats()['hits'] == 1
+
+
+def test_cache_reloads_changed_object(s3_client) -> None:
+    # A new ETag should replace the cached body and rows
+    get_cached_rows('flights', s3_client, BUCKET, print)
+    s3_client.put_object(Bucket=BUCKET, Key='flights.json',
+                         Body=json.dumps({'F000002': {'economy': 200}}))
+    success, rows = get_cached_rows('flights', s3_client, BUCKET, print)
+    assert success is True and dict(rows.iter_rows()) == {'F000002': {'economy': 200}}
+    assert get_cache_stats()['misses'] == 2
+
+
+def test_cache_missing_object(s3_client) -> None:
+    # This should fail as the object is not in the bucket
+    assert get_cached_rows('bus', s3_client, BUCKET, print) == (False, None)
+    assert get_cached_json_body('bus', s3_client, BUCKET, print) == (False, '')
+
+
+def test_cache_body_passthrough(s3_client) -> None:
+    # The raw body is served as stored and the gzip variant is built once
+    assert get_cached_json_body('flights', s3_client, BUCKET, print) == (
+        True, json.dumps({'F000001': {'economy': 100}}))
+    success, body = get_cached_gzip_body('flights', s3_client, BUCKET, print)
+    assert success is True
+    assert json.loads(gzip.decompress(base64.b64decode(body))) == {
+        'F000001': {'economy': 100}}
+    assert get_cached_gzip_body('flights', s3_client, BUCKET, print)[1] is body
+
+
+def test_accepts_gzip() -> None:
+    assert accepts_gzip({'headers': {'Accept-Encoding': 'gzip, deflate'}}) is True
+    assert accepts_gzip({'gzip': True}) is True
+    assert accepts_gzip({'transportation_type': 'flights'}) is False
+
+
+def test_cache_index_prefers_parquet(s3_client) -> None:
+    # The query index should be built from the typed parquet file when it exists
+    df = pd.DataFrame([['F000009', 'France', 'Italy', 'Paris', 'Rome', '2025-05-01', '2025-05-02',
+                        '10:00', '12:00', 100, 1100, 2100]], columns=HEADER)
+    s3_client.put_object(Bucket=BUCKET, Key='flights.parquet',
+                         Body=generate_columnar(df, 'parquet'))
+    success, rows = get_cached_index('flights', s3_client, BUCKET, print)
+    assert success is True
+    row = dict(rows.iter_rows())['F000009']
+    assert row['from_date'] == '2025-05-01' and row['departure'] == '10:00' and row['economy'] == 100
+
+
+def test_cache_gzip_stored_object(s3_client) -> None:
+    # A gzip stored json is decoded for queries and served as stored to gzip clients
+    raw = gzip.compress(json.dumps({'F000002': {'economy': 200}}).encode('utf-8'))
+    s3_client.put_object(Bucket=BUCKET, Key='bus.json', Body=raw, ContentEncoding='gzip')
+    assert get_cached_json_body('bus', s3_client, BUCKET, print) == (True, json.dumps({'F000002': {'economy': 200}}))
+    assert dict(get_cached_rows('bus', s3_client, BUCKET, print)[1].iter_rows()) == {'F000002': {'economy': 200}}
+    assert base64.b64decode(get_cached_gzip_body('bus', s3_client, BUCKET, print)[1]) == raw
+
+
+def test_cache_layout_body(s3_client) -> None:
+    # ?layout=records is encoded once per ETag and reused
+    success, body = get_cached_layout_body('flights', s3_client, BUCKET, print, 'records', False)
+    assert success is True
+    assert json.loads(body) == {'columns': ['flights_number', 'economy'], 'data': [['F000001', 100]]}
+    assert get_cached_layout_body('flights', s3_client, BUCKET, print, 'records', False)[1] is body
+
+
+def test_query_uses_secondary_index(s3_client, monkeypatch) -> None:
+    # A route query is answered from the index objects, not from the single row flights.json
+    monkeypatch.setattr(get_data_lambda, 's3_client', s3_client)
+    df = populate_df(50, 'flights', seed=3)[0]
+
+    def write_file(object_name: str, body: bytes) -> None:
+        s3_client.put_object(Bucket=BUCKET, Key=object_name, Body=body)
+
+    with SecondaryIndexWriter('flights', 0, write_file) as index_writer:
+        index_writer.add(df)
+        write_index_manifest('flights', [index_writer.close()], write_file)
+    row = df.iloc[7]
+    query = parse_query({'from_city': row['from_city'], 'to_city': row['to_city']})[1]
+    result = get_query_result('flights', query)
+    assert row['flights_number'] in result['items']
+    assert all(item['to_city'] == row['to_city'] for item in result['items'].values())
+
+
+def test_stats_serves_metadata_sidecar(s3_client, monkeypatch) -> None:
+    # ?stats=true answers with flights.meta.json as stored, a dataset without one is not found
+    monkeypatch.setattr(get_data_lambda, 's3_client', s3_client)
+    event = {'transportation_type': 'flights', 'stats': 'true'}
+    assert get_data_lambda.lambda_handler(event, None)['statusCode'] == 400
+    body = json.dumps({'rows': 1, 'bytes': {'json': 31}})
+    s3_client.put_object(Bucket=BUCKET, Key='flights.meta.json', Body=body)
+    assert get_data_lambda.lambda_handler(event, None) == {'statusCode': 200, 'body': body}
+
+
+def test_cold_start_defers_heavy_imports() -> None:
+    # The cold start must not pay for boto3 or pyarrow, a fresh interpreter shows what the import loads
+    loaded = subprocess.run([sys.executable, '-c', 'import get_data_lambda, sys; '
+                             'print(sorted({"boto3", "pyarrow"} & set(sys.modules)))'],
+                            capture_output=True, text=True, check=True).stdout.splitlines()[-1]
+    assert loaded == '[]'
@@ -0,0 +1,26 @@
+import json
+from json_layout import dumps, get_layout, to_layout, from_layout
+
+JSON_DATA = {'F000001': {'from_city': 'Leeds', 'economy': 100},
+             'F000002': {'from_city': 'York', 'economy': 200}}
+
+
+def test_layouts_round_trip() -> None:
+    # records and columns state the column names once and convert back to the index rows
+    records = to_layout(JSON_DATA, 'records', 'flights_number')
+    assert records == {'columns': ['flights_number', 'from_city', 'economy'],
+                       'data': [['F000001', 'Leeds', 100], ['F000002', 'York', 200]]}
+    columns = to_layout(JSON_DATA, 'columns', 'flights_number')
+    assert columns == {'flights_number': ['F000001', 'F000002'], 'from_city': ['Leeds', 'York'],
+                       'economy': [100, 200]}
+    assert from_layout(records) == JSON_DATA
+    assert from_layout(columns) == JSON_DATA
+    assert from_layout(JSON_DATA) is JSON_DATA
+    assert to_layout({}, 'records', 'flights_number') == {'columns': ['flights_number'], 'data': []}
+
+
+def test_dumps_minified_and_layout_param() -> None:
+    assert dumps(JSON_DATA) == json.dumps(JSON_DATA, separators=(',', ':'))
+    assert get_layout({}) == (True, 'index')
+    assert get_layout({'layout': 'records'}) == (True, 'records')
+    assert get_layout({'layout': 'split'})[0] is False
@@ -0,0 +1,46 @@
+from query_data import build_index, parse_query, run_query
+
+DATA = {
+    'F000003': {'from_Country': 'France', 'to_Country': 'Italy', 'from_city': 'Paris', 'to_city': 'Rome',
+                'from_date': '2025-05-01', 'economy': 300, 'eusiness': 1300, 'first_class': 2300},
+    'F000001': {'from_Country': 'England', 'to_Country': 'France', 'from_city': 'London', 'to_city': 'Paris',
+                'from_date': '2025-05-01', 'economy': 100, 'eusiness': 1100, 'first_class': 2100},
+    'F000002': {'from_Country': 'England', 'to_Country': 'France', 'from_city': 'London', 'to_city': 'Paris',
+                'from_date': '2025-06-01', 'economy': 200, 'eusiness': 1200, 'first_class': 2200},
+    'F000004': {'from_Country': 'England', 'to_Country': 'Italy', 'from_city': 'London', 'to_city': 'Rome',
+                'from_date': '2025-05-02', 'economy': 900, 'eusiness': 1900, 'first_class': 2900},
+}
+
+
+def query(params: dict) -> dict:
+    success, parsed = parse_query(params)
+    assert success is True
+    return run_query(build_index(DATA), parsed)
+
+
+def test_query_route_and_date() -> None:
+    result = query({'from_city': 'London', 'to_city': 'Paris', 'date_from': '2025-05-01',
+                    'date_to': '2025-05-31'})
+    assert list(result['items']) == ['F000001']
+
+
+def test_query_price_range_and_projection() -> None:
+    result = query({'price_class': 'business', 'min_price': '1200', 'max_price': '1900',
+                    'fields': 'from_city,eusiness'})
+    assert result['items'] == {'F000002': {'from_city': 'London', 'eusiness': 1200},
+                               'F000003': {'from_city': 'Paris', 'eusiness': 1300},
+                               'F000004': {'from_city': 'London', 'eusiness': 1900}}
+
+
+def test_query_paging() -> None:
+    first = query({'from_country': 'England', 'limit': '2'})
+    assert list(first['items']) == ['F000001', 'F000002']
+    second = query({'from_country': 'England', 'limit': '2', 'cursor': first['next_cursor']})
+    assert list(second['items']) == ['F000004']
+    assert second['next_cursor'] is None
+
+
+def test_query_invalid_params() -> None:
+    assert parse_query({'limit': '0'})[0] is False
+    assert parse_query({'min_price': 'cheap'})[0] is False
+    assert parse_query({'price_class': 'premium'})[0] is False
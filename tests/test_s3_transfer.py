@@ -0,0 +1,69 @@
+import io
+import os
+import pytest
+from common_vars import OBJECT_FOUND, OBJECT_NOT_FOUND
+from s3_transfer import S3MultipartWriter, MIN_PART_SIZE, upload_stream, download_to_mmap, iter_ranges, replace_tail
+
+BUCKET = 'web-app-python'
+
+
+@pytest.fixture(name='s3_client')
+def fixture_s3_client(make_bucket):
+    return make_bucket(BUCKET)
+
+
+def test_multipart_writer_uploads_parts(s3_client) -> None:
+    # 12 MiB written in small chunks should go up as 3 parts and read back unchanged
+    chunk = bytes(range(256)) * 4096
+    with S3MultipartWriter(BUCKET, 'flights.csv', s3_client, part_size=MIN_PART_SIZE, concurrency=2) as writer:
+        for _ in range(12):
+            writer.write(chunk)
+        assert writer.tell() == 12 * len(chunk)
+    assert [part['PartNumber'] for part in writer.upload['Parts']] == [1, 2, 3]
+    assert s3_client.get_object(Bucket=BUCKET, Key='flights.csv')['Body'].read() == chunk * 12
+
+
+def test_multipart_writer_small_object(s3_client) -> None:
+    # Objects smaller than a part should be sent with a single put_object
+    with S3MultipartWriter(BUCKET, 'flights.json', s3_client) as writer:
+        writer.write(b'{}')
+    assert writer.upload['UploadId'] is None
+    assert s3_client.get_object(Bucket=BUCKET, Key='flights.json')['Body'].read() == b'{}'
+
+
+def test_multipart_writer_aborts_on_error(s3_client) -> None:
+    # A failure while writing should abort the upload and leave no object behind
+    try:
+        with S3MultipartWriter(BUCKET, 'flights.csv', s3_client, part_size=MIN_PART_SIZE) as writer:
+            writer.write(b'x' * MIN_PART_SIZE)
+            raise RuntimeError('generation failed')
+    except RuntimeError:
+        pass
+    assert s3_client.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []) == []
+    assert 'Contents' not in s3_client.list_objects_v2(Bucket=BUCKET)
+
+
+def test_ranged_download_and_stream_upload(s3_client) -> None:
+    # A stream uploaded in parallel parts should come back identical through the ranged readers
+    data = os.urandom(MIN_PART_SIZE * 2 + 1234)
+    assert upload_stream(BUCKET, 'flights.parquet', io.BytesIO(data), s3_client,
+                         part_size=MIN_PART_SIZE, concurrency=3) == len(data)
+    status, body = download_to_mmap(BUCKET, 'flights.parquet', s3_client, part_size=MIN_PART_SIZE, concurrency=3)
+    assert status == OBJECT_FOUND and body[:] == data
+    assert b''.join(iter_ranges(BUCKET, 'flights.parquet', s3_client, part_size=MIN_PART_SIZE, concurrency=2)) == data
+    # More ranges left than fetched at once, each one is queued as an earlier one is consumed
+    data = os.urandom(MIN_PART_SIZE * 5 + 10)
+    s3_client.put_object(Bucket=BUCKET, Key='flights.arrow', Body=data)
+    assert b''.join(iter_ranges(BUCKET, 'flights.arrow', s3_client, part_size=MIN_PART_SIZE, concurrency=2)) == data
+    s3_client.put_object(Bucket=BUCKET, Key='empty.csv', Body=b'')
+    assert download_to_mmap(BUCKET, 'empty.csv', s3_client) == (OBJECT_FOUND, b'')
+    assert download_to_mmap(BUCKET, 'bus.parquet', s3_client) == (OBJECT_NOT_FOUND, b'')
+    assert not list(iter_ranges(BUCKET, 'bus.parquet', s3_client))
+
+
+def test_replace_tail_copies_kept_bytes(s3_client) -> None:
+    # The kept bytes are copied inside S3 and only the new tail is uploaded
+    body = b'{' + b'x' * MIN_PART_SIZE + b'}'
+    etag = s3_client.put_object(Bucket=BUCKET, Key='flights.json', Body=body)['ETag']
+    replace_tail(BUCKET, 'flights.json', s3_client, len(body) - 1, b',"y"}', etag)
+    assert s3_client.get_object(Bucket=BUCKET, Key='flights.json')['Body'].read() == body[:-1] + b',"y"}'
@@ -0,0 +1,73 @@
+import os
+import sys
+import pytest
+import generate_csv_data
+from common_vars import DATA_DIRECTORY, INDEX_DIRECTORY, MANIFEST_NAME, DATE_COLUMNS
+from common_funcs import get_verbose_logger
+from storage import read_index_object
+from get_data import get_csv_data
+from generate_csv_data import main
+from query_data import build_index, parse_query, run_query
+from secondary_index import run_index_query, parse_cursor, rows_name
+
+
+def index_query(params: dict):
+    success, parsed = parse_query(params)
+    assert success is True
+    manifest = read_index_object('test', MANIFEST_NAME, False, '', None)
+    return run_index_query(manifest, parsed, lambda name: read_index_object('test', name, False, '', None))
+
+
+def full_query(params: dict) -> dict:
+    verboseprint, log, logger = get_verbose_logger(False, False)
+    # The csv reader follows the shard and append parts, so every row is compared
+    df = get_csv_data('test', '', False, '', verboseprint, log, logger)[1]
+    df[DATE_COLUMNS] = df[DATE_COLUMNS].apply(lambda column: column.dt.strftime('%Y-%m-%d'))
+    return run_query(build_index(df.set_index('test_number').to_dict(orient='index')), parse_query(params)[1])
+
+
+@pytest.mark.parametrize('extra_args', [['-s', '3'], ['-s', '3', '-w', '2', '-sr', '70']])
+def test_index_query_matches_full_query(monkeypatch, extra_args) -> None:
+    # Unsharded (batches of 40) and sharded datasets plus an appended segment answer like the full index
+    monkeypatch.setattr(generate_csv_data, 'BATCH_ROWS', 40)
+    monkeypatch.setattr(generate_csv_data, 'ROW_FILE_ROWS', 16)
+    sys.argv = ['main.py', '-g', '150', '-type', 'test', '-o', '-j', '-ix'] + extra_args
+    assert main() is True
+    sys.argv = ['main.py', '-a', '30', '-type', 'test', '-j', '-s', '4']
+    assert main() is True
+    manifest = read_index_object('test', MANIFEST_NAME, False, '', None)
+    assert sum(segment['rows'] for segment in manifest['segments']) == 180
+    row = next(iter(full_query({'limit': '1'})['items'].values()))
+    for params in ({'from_city': row['from_city'], 'to_city': row['to_city']},
+                   {'from_country': row['from_Country'], 'price_class': 'economy', 'max_price': '500'},
+                   {'date_from': row['from_date'], 'date_to': row['from_date'], 'fields': 'from_city'}):
+        expected = full_query(dict(params, limit='1000'))['items']
+        assert index_query(dict(params, limit='1000'))['items'] == expected
+        # Pages of 2 follow the 'segment:row' cursor through every match
+        pages, cursor = {}, None
+        while True:
+            page = index_query(dict(params, limit='2', **({'cursor': cursor} if cursor else {})))
+            pages.update(page['items'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        assert pages == expected
+    # Queries without an indexed lookup, or with a cursor of the full scan, are left to the full index
+    assert index_query({'min_price': '200'}) is None
+    assert parse_cursor('T000123') is None
+    sys.argv = ['main.py', '-g', '1', '-type', 'test', '-o', '-j']
+    assert main() is True
+    assert read_index_object('test', MANIFEST_NAME, False, '', None) is None
+
+
+def test_index_query_without_row_file() -> None:
+    # A missing row file makes the index unusable, the query falls back to the whole dataset
+    sys.argv = ['main.py', '-g', '20', '-type', 'test', '-o', '-j', '-ix', '-s', '3']
+    assert main() is True
+    row = next(iter(full_query({'limit': '1'})['items'].values()))
+    params = {'from_country': row['from_Country']}
+    assert index_query(params)['items'] == full_query(params)['items']
+    os.remove(os.path.join(DATA_DIRECTORY, 'test', INDEX_DIRECTORY, rows_name(0, 0)))
+    assert index_query(params) is None
+    sys.argv = ['main.py', '-g', '1', '-type', 'test', '-o', '-j']
+    assert main() is True
@@ -0,0 +1,72 @@
+import gzip
+import json
+import os
+import pytest
+from common_vars import OBJECT_FOUND, OBJECT_NOT_FOUND, OBJECT_NOT_MODIFIED
+from storage import Storage, LocalStorage, S3Storage, MemoryStorage, CachedStorage
+
+BUCKET = 'storage-bucket'
+
+
+def check_round_trip(storage) -> None:
+    assert storage.get('test/object.json') == (OBJECT_NOT_FOUND, None, None)
+    with storage.writer('test/object.json') as writer:
+        writer.write(gzip.compress(json.dumps({'T000001': {'economy': 100}}).encode('utf-8')))
+    status, body, version = storage.get('test/object.json')
+    assert status == OBJECT_FOUND and storage.size('test/object.json') == len(body)
+    assert storage.get('test/object.json', version) == (OBJECT_NOT_MODIFIED, None, version)
+    assert storage.read_json('test/object.json') == {'T000001': {'economy': 100}}
+    with storage.open('test/object.json') as stream:
+        assert stream.read() == body
+    assert bytes(storage.map('test/object.json')) == body
+    storage.delete('test/object.json')
+    assert not storage.exists('test/object.json') and storage.read('test/object.json') is None
+
+
+def test_storage_backends_round_trip(tmp_path, make_bucket) -> None:
+    # Every backend writes, versions, streams and maps the same bytes
+    check_round_trip(MemoryStorage())
+    check_round_trip(LocalStorage(str(tmp_path)))
+    check_round_trip(S3Storage(BUCKET, make_bucket(BUCKET)))
+
+
+def test_incomplete_backend_fails_on_creation() -> None:
+    # A backend missing one of the primitives cannot be created, instead of failing on its first call
+    class ReadOnlyStorage(Storage):  # pylint: disable=abstract-method
+        def get(self, name, version=None):
+            return OBJECT_NOT_FOUND, None, None
+
+        def size(self, name):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnlyStorage()  # pylint: disable=abstract-class-instantiated
+
+
+def test_local_storage_replaces_files(tmp_path) -> None:
+    # A rewrite moves a complete file over the old one, a mapping of the old file keeps its bytes
+    storage = LocalStorage(str(tmp_path))
+    storage.put('bus.arrow', b'old' * 4096)
+    mapped = storage.map('bus.arrow')
+    storage.put('bus.arrow', b'new')
+    assert bytes(mapped) == b'old' * 4096 and storage.read('bus.arrow') == b'new'
+    with pytest.raises(ValueError):
+        with storage.writer('bus.arrow') as writer:
+            writer.write(b'half')
+            raise ValueError('generation failed')
+    assert storage.read('bus.arrow') == b'new' and os.listdir(tmp_path) == ['bus.arrow']
+
+
+def test_cached_storage_revalidates() -> None:
+    # Reads within the ttl are hits, then a conditional get only reloads a changed object
+    backend = MemoryStorage()
+    backend.put('bus.json', b'{"B000001": {"economy": 100}}')
+    cached = CachedStorage(backend, ttl=60)
+    parsed = cached.read_json('bus.json')
+    assert cached.read_json('bus.json') is parsed and cached.stats == {'hits': 1, 'misses': 1, 'revalidations': 0}
+    cached.ttl = 0
+    assert cached.read_json('bus.json') is parsed and cached.stats['revalidations'] == 1
+    backend.put('bus.json', b'{"B000002": {"economy": 200}}')
+    assert cached.read_json('bus.json') == {'B000002': {'economy': 200}} and cached.stats['misses'] == 2
+    cached.delete('bus.json')
+    assert cached.read('bus.json') is None and not cached.entries
@@ -0,0 +1,63 @@
+import os
+import sys
+import pandas as pd
+import generate_csv_data
+from common_vars import DATA_DIRECTORY, SUMMARY_DIRECTORY, MANIFEST_NAME
+from storage import read_json_object
+from dataset_summaries import compute_summaries, merge_summaries
+from generate_csv_data import main, populate_df
+from summaries import parse_summary_query, run_summary_query
+
+
+def summary_query(summary: dict, params: dict) -> dict:
+    success, query = parse_summary_query(params)
+    assert success is True
+    return run_summary_query(summary, query)
+
+
+def test_compute_summaries() -> None:
+    df = pd.DataFrame({'from_city': ['Paris', 'London', 'London'], 'to_city': ['Rome', 'Paris', 'Paris'],
+                       'from_Country': ['France', 'England', 'England'],
+                       'from_date': ['2025-05-01', '2025-05-01', '2025-05-02'],
+                       'economy': [300, 100, 200], 'eusiness': [1300, 1100, 1200], 'first_class': [2300, 2100, 2200]})
+    summaries = compute_summaries(df)
+    route = summary_query(summaries['route'], {'group_by': 'route', 'from_city': 'London'})
+    assert route['data'] == [['London', 'Paris', 2, 100, 150.0, 200, 1100, 1150.0, 1200, 2100, 2150.0, 2200]]
+    dates = summary_query(summaries['date'], {'group_by': 'date', 'date_to': '2025-05-01'})
+    assert [row[:5] for row in dates['data']] == [['2025-05-01', 2, 100, 200.0, 300]]
+    busiest = summary_query(summaries['date'], {'group_by': 'date', 'sort': '-count'})
+    assert [row[:2] for row in busiest['data']] == [['2025-05-01', 2], ['2025-05-02', 1]]
+    cheapest = summary_query(summaries['country'], {'group_by': 'country', 'sort': 'economy_min', 'limit': '1'})
+    assert (cheapest['groups'], cheapest['data'][0][0]) == (2, 'England')
+    assert parse_summary_query({'group_by': 'date', 'from_city': 'Paris'})[0] is False
+    assert parse_summary_query({'group_by': 'fare'})[0] is False
+
+
+def test_merge_summaries_match_recompute() -> None:
+    # Merging the summaries of appended rows gives the summaries of the whole dataset
+    df, _ = populate_df(300, 'flights', 7)
+    appended, _ = populate_df(120, 'flights', 8)
+    merged = merge_summaries(compute_summaries(df), compute_summaries(appended))
+    assert merged == compute_summaries(pd.concat([df.astype(str), appended.astype(str)]).astype(
+        {column: 'int64' for column in ['economy', 'eusiness', 'first_class']}))
+
+
+def test_generate_summaries_pass(monkeypatch) -> None:
+    # Summaries are written with -sm, merged after an append and dropped by a regeneration without -sm
+    sys.argv = ['main.py', '-g', '60', '-type', 'test', '-o', '-sm', '-s', '5']
+    assert main() is True
+    # An append only summarizes its own rows, the summaries are not recomputed from the dataset
+    with monkeypatch.context() as patch:
+        patch.setattr(generate_csv_data, 'update_summaries', None)
+        sys.argv = ['main.py', '-a', '15', '-type', 'test', '-s', '6']
+        assert main() is True
+    summary = read_json_object(f'test/{SUMMARY_DIRECTORY}/date.json', False, '', None)
+    assert summary['rows'] == 75 and sum(row[1] for row in summary['data']) == 75
+    df = pd.read_csv(f'{DATA_DIRECTORY}test.csv')
+    row = df.iloc[0]
+    route = summary_query(read_json_object(f'test/{SUMMARY_DIRECTORY}/route.json', False, '', None),
+                          {'group_by': 'route', 'from_city': row['from_city'], 'to_city': row['to_city']})
+    assert route['data'][0][3] <= row['economy'] <= route['data'][0][5]
+    sys.argv = ['main.py', '-g', '1', '-type', 'test', '-o']
+    assert main() is True
+    assert not os.path.exists(f'{DATA_DIRECTORY}test/{SUMMARY_DIRECTORY}/{MANIFEST_NAME}')
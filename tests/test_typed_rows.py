@@ -0,0 +1,50 @@
+import json
+import random
+import pyarrow as pa
+from generate_csv_data import generate_columnar, generate_json, iter_batches
+from get_data import read_columnar_table
+from query_data import build_index, parse_query, run_query
+from typed_rows import TypedRows
+
+
+def generated_data() -> tuple:
+    df, type_number = next(iter_batches(300, 'flights', 5, 300))
+    return df, json.loads(generate_json(df, type_number))
+
+
+def test_typed_rows_match_query_data() -> None:
+    # Pages, projections and cursors are the ones of the dict index for the same queries
+    df, data = generated_data()
+    rows = TypedRows.from_json_data(data)
+    assert rows.columns['from_date']['values'].dtype == 'int32' and rows.columns['economy']['values'].dtype == 'uint16'
+    assert rows.columns['departure']['values'].dtype == 'uint16' and 'codes' in rows.columns['from_city']
+    assert list(rows.to_json_data().items()) == sorted(data.items())
+    index = build_index(data)
+    rng = random.Random(0)
+    for _ in range(100):
+        params = {'limit': str(rng.choice([1, 7, 100]))}
+        if rng.random() < 0.5:
+            params['from_country'] = rng.choice(df['from_Country'].tolist() + ['Nowhere'])
+        if rng.random() < 0.5:
+            params['date_from'] = rng.choice(df['from_date'].tolist() + ['2021', '2026-13'])
+        if rng.random() < 0.5:
+            params.update(price_class=rng.choice(['economy', 'business']), max_price=str(rng.randrange(3000)))
+        if rng.random() < 0.3:
+            params['fields'] = 'to_city,economy,unknown'
+        query = parse_query(params)[1]
+        page = rows.run_query(query)
+        assert page == run_query(index, query) and list(page['items']) == list(run_query(index, query)['items'])
+        if page['next_cursor']:
+            query['cursor'] = page['next_cursor']
+            assert rows.run_query(query) == run_query(index, query)
+
+
+def test_typed_rows_from_table_and_untyped_values() -> None:
+    # The columnar file gives the same rows, values that do not fit a column type keep dictionary codes
+    df, data = generated_data()
+    table = read_columnar_table(pa.BufferReader(generate_columnar(df, 'arrow')), 'arrow')
+    assert TypedRows.from_table(table, 'flights_number').to_json_data() == data
+    rows = TypedRows.from_json_data({'T10': {'economy': 70000, 'from_date': '2025-02-30'}, 'T9': {'note': None}})
+    assert rows.to_json_data() == {'T10': {'economy': 70000, 'from_date': '2025-02-30'}, 'T9': {'note': None}}
+    assert 'codes' in rows.columns['economy'] and rows.keys_at(slice(None)) == ['T10', 'T9']
+    assert list(rows.run_query(parse_query({'min_price': '1'})[1])['items']) == ['T10']
@@ -0,0 +1,58 @@
+import io
+import sys
+import numpy as np
+import pytest
+import validate_keys
+from common_vars import DATA_DIRECTORY
+from common_funcs import get_verbose_logger
+from generate_csv_data import main, populate_df, iter_batches
+from validate_keys import mark_keys, validate_keys as find_duplicates
+
+
+def test_mark_keys_reports_repeats() -> None:
+    # Keys already set and keys repeated within the chunk are both duplicates
+    bitmap, duplicates = mark_keys(np.zeros(0, dtype=np.uint8), np.array([3, 9, 3]))
+    assert duplicates.tolist() == [3]
+    bitmap, duplicates = mark_keys(bitmap, np.array([9, 1000, 4]))
+    assert duplicates.tolist() == [9] and bitmap.size == 126
+
+
+def test_generated_keys_are_unique() -> None:
+    # Keys stay unique across batches and up to the whole 6 digit key space
+    df, type_number = populate_df(10 ** 6, 'flights', seed=1)
+    assert df[type_number].is_unique and df[type_number].str.len().eq(7).all()
+    keys = np.concatenate([batch[batch_type].to_numpy()
+                           for batch, batch_type in iter_batches(250000, 'bus', seed=2, batch_rows=100000)])
+    assert len(set(keys)) == 250000
+
+
+@pytest.mark.parametrize('args', [['-g', '30', '-j'], ['-g', '30', '-w', '2', '-sr', '10']])
+def test_validate_keys_pass(args) -> None:
+    # Generated files have no duplicates, a row copied in the csv and json is reported in both
+    sys.argv = ['main.py', '-type', 'test', '-o', '-s', '5'] + args
+    assert main() is True
+    verboseprint, log, logger = get_verbose_logger(False, False)
+    unique, reports = find_duplicates('test', '', False, '', verboseprint, log, logger)
+    assert unique is True and sum(report['rows'] for report in reports if report['file'].endswith('.csv')) == 30
+    if '-j' in args:
+        with open(f'{DATA_DIRECTORY}test.csv', 'a', encoding='utf-8') as csv_file:
+            with open(f'{DATA_DIRECTORY}test.csv', encoding='utf-8') as source:
+                csv_file.write(source.readlines()[1])
+        with open(f'{DATA_DIRECTORY}test.json', 'r+', encoding='utf-8') as json_file:
+            text = json_file.read()
+            json_file.seek(0)
+            json_file.write(text[:-1] + ',' + text[1:text.index('},') + 1] + '}')
+        unique, reports = find_duplicates('test', '', False, '', verboseprint, log, logger)
+        assert unique is False
+        assert [report['duplicates'] for report in reports] == [1, 1]
+    sys.argv = ['main.py', '-g', '1', '-type', 'test', '-o', '-j']
+    assert main() is True
+
+
+def test_json_scan_across_chunks(monkeypatch) -> None:
+    # A key cut by a chunk boundary is still found once
+    monkeypatch.setattr(validate_keys, 'JSON_CHUNK_BYTES', 70)
+    monkeypatch.setattr(validate_keys, 'JSON_KEY_OVERLAP', 16)
+    body = ('{' + ','.join(f'"F{number:06d}":{{"economy":100}}' for number in range(50)) + '}').encode('utf-8')
+    numbers = np.concatenate(list(validate_keys.iter_json_numbers(io.BytesIO(body))))
+    assert numbers.tolist() == list(range(50))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+from typing import Callable, List, Optional, Tuple
+import pandas as pd
+from common_vars import STORAGE_CONCURRENCY
+from common_funcs import read_object_from_s3, read_bytes_from_s3, check_if_object_exists_in_s3, write_object_to_s3, \
+    get_ddb_object, write_ddb_object
+
+
+# boto3 is blocking, so the calls run in the default thread pool and the semaphore bounds how many are in flight
+def get_semaphore(limit: int = STORAGE_CONCURRENCY) -> asyncio.BoundedSemaphore:
+    return asyncio.BoundedSemaphore(max(1, limit))
+
+
+async def run_bounded(semaphore: Optional[asyncio.BoundedSemaphore], func: Callable, *args, **kwargs):
+    """Run a blocking call in a worker thread, waiting for a slot of the semaphore first"""
+    if semaphore is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    async with semaphore:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
+async def gather_bounded(calls: List[Tuple[Callable, tuple]], limit: int = STORAGE_CONCURRENCY) -> list:
+    """Run every (func, args) call concurrently, at most limit at a time, and return the results in order"""
+    semaphore = get_semaphore(limit)
+    return await asyncio.gather(*(run_bounded(semaphore, func, *args) for func, args in calls))
+
+
+async def read_object_from_s3_async(bucket_name: str, object_name: str, s3_client,
+                                    semaphore: Optional[asyncio.BoundedSemaphore] = None) -> str:
+    """Read object from S3 bucket"""
+    return await run_bounded(semaphore, read_object_from_s3, bucket_name, object_name, s3_client)
+
+
+async def read_bytes_from_s3_async(bucket_name: str, object_name: str, s3_client,
+                                   semaphore: Optional[asyncio.BoundedSemaphore] = None) -> bytes:
+    """Read binary object from S3 bucket"""
+    return await run_bounded(semaphore, read_bytes_from_s3, bucket_name, object_name, s3_client)
+
+
+async def check_if_object_exists_in_s3_async(bucket_name: str, object_name: str, s3_client,
+                                             semaphore: Optional[asyncio.BoundedSemaphore] = None) -> bool:
+    """Check if object exists in S3"""
+    return await run_bounded(semaphore, check_if_object_exists_in_s3, bucket_name, object_name, s3_client)
+
+
+async def write_object_to_s3_async(bucket_name: str, object_name: str, data: str, s3_client,
+                                   semaphore: Optional[asyncio.BoundedSemaphore] = None) -> None:
+    """Write object to S3 bucket"""
+    await run_bounded(semaphore, write_object_to_s3, bucket_name, object_name, data, s3_client)
+
+
+async def get_ddb_object_async(ddb_client, table_name: str, key: dict,
+                               semaphore: Optional[asyncio.BoundedSemaphore] = None) -> dict:
+    """Get DynamoDB object"""
+    return await run_bounded(semaphore, get_ddb_object, ddb_client, table_name, key)
+
+
+async def write_ddb_object_async(ddb_client, table_name: str, data: pd.DataFrame,
+                                 semaphore: Optional[asyncio.BoundedSemaphore] = None) -> dict:
+    """Bulk load the rows into DynamoDB and return the throughput stats"""
+    return await run_bounded(semaphore, write_ddb_object, ddb_client, table_name, data)
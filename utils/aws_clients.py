@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import threading
+from typing import Optional
+import boto3
+from botocore.config import Config
+
+AWS_REGION = 'eu-west-2'
+# One pool per client, sized for the thread pools of the bulk loaders and ranged readers
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '32'))
+CLIENT_CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=60,
+    retries={'mode': 'standard', 'max_attempts': 5},
+)
+
+registry_lock = threading.Lock()
+sessions = {}
+clients = {}
+client_stats = {'created': 0, 'reused': 0, 'requests': 0}
+operation_counts = {}
+
+
+def count_request(operation_name: str = '', **_) -> None:
+    with registry_lock:
+        client_stats['requests'] += 1
+        operation_counts[operation_name] = operation_counts.get(operation_name, 0) + 1
+
+
+def get_session(profile: Optional[str] = None, region: str = AWS_REGION) -> boto3.Session:
+    """Get the shared boto3 session of a profile, '' or None use the default credential chain"""
+    key = (profile or None, region)
+    with registry_lock:
+        if key not in sessions:
+            sessions[key] = boto3.Session(profile_name=profile or None, region_name=region)
+        return sessions[key]
+
+
+def get_client(service: str, profile: Optional[str] = None, region: str = AWS_REGION):
+    """Get the process-wide client of a service, created on first use and reused afterwards"""
+    key = (profile or None, region, service)
+    client = clients.get(key)
+    if client is None:
+        session = get_session(profile, region)
+        with registry_lock:
+            client = clients.get(key)
+            if client is None:
+                client = session.client(service, config=CLIENT_CONFIG)
+                client.meta.events.register('request-created', count_request)
+                clients[key] = client
+                client_stats['created'] += 1
+                return client
+    with registry_lock:
+        client_stats['reused'] += 1
+    return client
+
+
+def get_client_stats() -> dict:
+    """Clients created and reused, and the requests sent over their pooled connections by operation"""
+    with registry_lock:
+        return dict(client_stats, clients=len(clients), operations=dict(operation_counts))
+
+
+def clear_clients() -> None:
+    """Drop every session and client, e.g. in a forked worker process or between tests"""
+    with registry_lock:
+        sessions.clear()
+        clients.clear()
+        operation_counts.clear()
+        client_stats.update(created=0, reused=0, requests=0)
+
+
+def reset_after_fork() -> None:
+    """Sessions, connection pools and a lock held by another thread must not leak into a forked worker"""
+    global registry_lock
+    registry_lock = threading.Lock()
+    clear_clients()
+
+
+os.register_at_fork(after_in_child=reset_after_fork)
@@ -1,16 +1,22 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import argparse
-import json
-import os
-from typing import Tuple
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 import logging
 import boto3
 import pandas as pd
-from common_vars import transportation_type_list, DATA_DIRECTORY
+from botocore.exceptions import ClientError
+from common_vars import transportation_type_list, COLUMNAR_FORMATS, COMPRESSIONS, PRICE_COLUMNS, \
+    DDB_BATCH_SIZE, DDB_MAX_RETRIES, DDB_BACKOFF_SECONDS, DDB_WORKERS, STORAGE_CONCURRENCY, \
+    OBJECT_FOUND, OBJECT_NOT_FOUND, OBJECT_NOT_MODIFIED, DDB_INDEXES, DDB_INDEX_POLL_SECONDS, DDB_INDEX_MAX_POLLS
 from mypy_boto3_s3.client import S3Client
 from mypy_boto3_dynamodb.client import DynamoDBClient
 from boto3.session import Session
+from aws_clients import get_client, get_session
+from compressed_io import decompress_bytes
 
 def get_verbose_logger(verbose: bool, logger_arg: bool):
     verboseprint = print if verbose else lambda *a, **k: None
@@ -111,6 +117,106 @@ def get_on_ddb(parser: argparse.ArgumentParser):
     )
 
 
+def get_format(parser: argparse.ArgumentParser):
+    return parser.add_argument(
+        "-f", "--format",
+        help="Also write a typed columnar file. Valid formats are: {parquet, feather, arrow}",
+        required=False,
+        default=None,
+        choices=COLUMNAR_FORMATS
+    )
+
+
+def get_compression(parser: argparse.ArgumentParser):
+    return parser.add_argument(
+        "-z", "--compression",
+        help="Compress the csv and json files. Valid codecs are: {gzip, zstd}",
+        required=False,
+        default=None,
+        choices=COMPRESSIONS
+    )
+
+
+def get_json_layout(parser: argparse.ArgumentParser):
+    return parser.add_argument(
+        "-jl", "--json_layout",
+        help="Layout of the json file, records states the column names once. Valid layouts are: {index, records}",
+        required=False,
+        default='index',
+        choices=['index', 'records']
+    )
+
+
+def get_seed(parser: argparse.ArgumentParser):
+    return parser.add_argument(
+        "-s", "--seed",
+        help="Seed for the random generator, the same seed gives the same data",
+        required=False,
+        default=None,
+        type=int
+    )
+
+
+def get_workers(parser: argparse.ArgumentParser):
+    return parser.add_argument(
+        "-w", "--workers",
+        help="Number of processes generating shards in parallel. Default is 1",
+        required=False,
+        default=1,
+        type=int
+    )
+
+
+def get_shard_rows(parser: argparse.ArgumentParser):
+    return parser.add_argument(
+        "-sr", "--shard_rows",
+        help="Rows per part file of a sharded dataset. Default is generation_number / workers",
+        required=False,
+        default=None,
+        type=int
+    )
+
+
+def get_concurrency(parser: argparse.ArgumentParser):
+    return parser.add_argument(
+        "-c", "--concurrency",
+        help=f"Maximum number of objects fetched at once. Default is {STORAGE_CONCURRENCY}",
+        required=False,
+        default=STORAGE_CONCURRENCY,
+        type=int
+    )
+
+
+def get_append(parser: argparse.ArgumentParser):
+    return parser.add_argument(
+        "-a", "--append",
+        help="Generate only this many new rows and add them to the existing dataset as a new part",
+        required=False,
+        default=None,
+        type=int
+    )
+
+
+def get_indexes(parser: argparse.ArgumentParser):
+    return parser.add_argument(
+        "-ix", "--indexes",
+        help="Also write the route, from_country and date secondary indexes under {type}/index/",
+        required=False,
+        default=False,
+        action='store_true'
+    )
+
+
+def get_summaries(parser: argparse.ArgumentParser):
+    return parser.add_argument(
+        "-sm", "--summaries",
+        help="Also write min/mean/max prices and row counts by route, country and date under {type}/summary/",
+        required=False,
+        default=False,
+        action='store_true'
+    )
+
+
 def get_overwrite(parser: argparse.ArgumentParser):
     return parser.add_argument(
         "-o", "--overwrite",
@@ -132,41 +238,61 @@ def get_aws_creds(aws_creds: str) -> Tuple[str, str]:
 
 
 def get_boto3_session(aws_creds: str) -> Session:
-    """Get boto3 session"""
-    aws_access_key_id, aws_secret_access_key = get_aws_creds(
-        aws_creds=aws_creds)
-    session = boto3.Session(
-        aws_access_key_id=aws_access_key_id,
-        aws_secret_access_key=aws_secret_access_key,
-        region_name='eu-west-2'
-    )
-    return session
+    """Get the shared boto3 session of the profile"""
+    return get_session(aws_creds)
 
 
 def get_s3_client(aws_creds: str) -> S3Client:
-    """Get boto3 s3 client"""
-    session = get_boto3_session(aws_creds=aws_creds)
-    s3 = session.client('s3')
-    return s3
+    """Get the shared boto3 s3 client of the profile"""
+    return get_client('s3', aws_creds)
+
+
+def get_object_from_s3(bucket_name: str, object_name: str, s3_client,
+                       byte_range: Optional[Tuple[int, Optional[int]]] = None,
+                       if_none_match: Optional[str] = None) -> Tuple[str, dict]:
+    """Get an object in one round trip, a missing or unchanged object is a status rather than an error"""
+    args = {'Bucket': bucket_name, 'Key': object_name}
+    if byte_range is not None:
+        start, end = byte_range
+        args['Range'] = f'bytes={start}-{"" if end is None else end}'
+    if if_none_match is not None:
+        args['IfNoneMatch'] = if_none_match
+    try:
+        return OBJECT_FOUND, s3_client.get_object(**args)
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code in ('NoSuchKey', '404', 'NotFound'):
+            return OBJECT_NOT_FOUND, {}
+        if code in ('304', 'NotModified'):
+            return OBJECT_NOT_MODIFIED, {}
+        raise
 
 
 def read_object_from_s3(bucket_name: str, object_name: str, s3_client) -> str:
-    """Read object from S3 bucket"""
-    obj = s3_client.get_object(Bucket=bucket_name, Key=object_name).get(
-        'Body').read().decode('utf-8')
+    """Read object from S3 bucket, decompressing a gzip or zstd body"""
+    obj = decompress_bytes(s3_client.get_object(Bucket=bucket_name, Key=object_name).get(
+        'Body').read()).decode('utf-8')
     return obj
 
 
-def write_object_to_s3(bucket_name: str, object_name: str, data: str, s3_client) -> None:
+def get_object_body_from_s3(bucket_name: str, object_name: str, s3_client):
+    """Get the streaming body of an S3 object without reading it"""
+    return s3_client.get_object(Bucket=bucket_name, Key=object_name).get('Body')
+
+
+def read_bytes_from_s3(bucket_name: str, object_name: str, s3_client) -> bytes:
+    """Read binary object from S3 bucket"""
+    return s3_client.get_object(Bucket=bucket_name, Key=object_name).get('Body').read()
+
+
+def write_object_to_s3(bucket_name: str, object_name: str, data: str, s3_client, **put_args) -> None:
     """Write object to S3 bucket"""
-    s3_client.put_object(Bucket=bucket_name, Key=object_name, Body=data)
+    s3_client.put_object(Bucket=bucket_name, Key=object_name, Body=data, **put_args)
 
 
 def get_ddb_client(aws_creds: str) -> DynamoDBClient:
-    """Get boto3 DynamoDB client"""
-    session = get_boto3_session(aws_creds=aws_creds)
-    ddb = session.client('dynamodb')
-    return ddb
+    """Get the shared boto3 DynamoDB client of the profile"""
+    return get_client('dynamodb', aws_creds)
 
 
 def get_ddb_object(ddb_client, table_name: str, key: dict) -> dict:
@@ -178,10 +304,83 @@ def get_ddb_object(ddb_client, table_name: str, key: dict) -> dict:
     return response
 
 
-def write_ddb_object(ddb_client, table_name: str, data: pd.DataFrame) -> None:
-    for row in data.iterrows():
-        item = {col: {'S': str(value)} for col, value in row[1].items()}
-        ddb_client.put_item(TableName=table_name, Item=item)
+def to_ddb_items(data: pd.DataFrame) -> List[dict]:
+    """Convert the rows to DynamoDB items column by column, prices as N and dates as ISO-8601 strings"""
+    # A batch can not hold the same key twice, keep the last row like consecutive put_item calls would
+    data = data.drop_duplicates(subset=data.columns[0], keep='last')
+    columns = []
+    for col in data.columns:
+        series = data[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime('%Y-%m-%d')
+        kind = 'N' if col in PRICE_COLUMNS else 'S'
+        columns.append([{kind: value} for value in series.astype(str).tolist()])
+    return [dict(zip(data.columns, values)) for values in zip(*columns)]
+
+
+def write_ddb_batch(ddb_client, table_name: str, items: List[dict], max_retries: int = DDB_MAX_RETRIES) -> int:
+    """Write up to 25 items with BatchWriteItem, retrying the unprocessed ones with jittered backoff"""
+    request = {table_name: [{'PutRequest': {'Item': item}} for item in items]}
+    for retries in range(max_retries + 1):
+        request = ddb_client.batch_write_item(RequestItems=request).get('UnprocessedItems')
+        if not request:
+            return retries
+        time.sleep(random.uniform(0, DDB_BACKOFF_SECONDS * 2 ** retries))
+    raise RuntimeError(f'{len(request[table_name])} items still unprocessed in {table_name} '
+                       f'after {max_retries} retries')
+
+
+def write_ddb_object(ddb_client, table_name: str, data: pd.DataFrame, workers: int = DDB_WORKERS) -> dict:
+    """Bulk load the rows in 25 item batches across a thread pool and return the throughput stats"""
+    start = time.perf_counter()
+    items = to_ddb_items(data)
+    batches = [items[i:i + DDB_BATCH_SIZE] for i in range(0, len(items), DDB_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        retries = sum(executor.map(lambda batch: write_ddb_batch(ddb_client, table_name, batch), batches))
+    seconds = time.perf_counter() - start
+    return {'items': len(items), 'batches': len(batches), 'retries': retries, 'seconds': seconds,
+            'items_per_second': len(items) / seconds if seconds else 0.0}
+
+
+def wait_for_ddb_index(ddb_client, table_name: str, index_name: str) -> None:
+    """Wait until the GSI is ACTIVE, the table_exists waiter returns while it is still CREATING"""
+    for _ in range(DDB_INDEX_MAX_POLLS):
+        table = ddb_client.describe_table(TableName=table_name)['Table']
+        status = next((index.get('IndexStatus') for index in table.get('GlobalSecondaryIndexes', [])
+                       if index['IndexName'] == index_name), None)
+        if status == 'ACTIVE':
+            return
+        time.sleep(DDB_INDEX_POLL_SECONDS)
+    raise RuntimeError(f'{index_name} of {table_name} still not ACTIVE after {DDB_INDEX_MAX_POLLS} polls')
+
+
+def ensure_ddb_indexes(ddb_client, table_name: str) -> List[str]:
+    """Create the missing lookup GSIs of the table, one UpdateTable at a time as DynamoDB requires
+
+    DynamoDB creates one index at a time, so each create waits for the previous index to be ACTIVE."""
+    table = ddb_client.describe_table(TableName=table_name)['Table']
+    existing = {index['IndexName']: index.get('IndexStatus') for index in table.get('GlobalSecondaryIndexes', [])}
+    for index_name, status in existing.items():
+        if status != 'ACTIVE':
+            wait_for_ddb_index(ddb_client, table_name, index_name)
+    on_demand = table.get('BillingModeSummary', {}).get('BillingMode') == 'PAY_PER_REQUEST'
+    created = []
+    for index_name, keys in DDB_INDEXES.items():
+        if index_name in existing:
+            continue
+        key_schema = [{'AttributeName': attribute, 'KeyType': key_type}
+                      for attribute, key_type in zip(keys, ('HASH', 'RANGE')) if attribute]
+        create = {'IndexName': index_name, 'KeySchema': key_schema, 'Projection': {'ProjectionType': 'ALL'}}
+        if not on_demand:
+            # A provisioned table needs the capacity of each new index, the table's own is reused
+            create['ProvisionedThroughput'] = {key: table['ProvisionedThroughput'][key]
+                                               for key in ('ReadCapacityUnits', 'WriteCapacityUnits')}
+        ddb_client.update_table(
+            TableName=table_name, GlobalSecondaryIndexUpdates=[{'Create': create}],
+            AttributeDefinitions=[{'AttributeName': key['AttributeName'], 'AttributeType': 'S'} for key in key_schema])
+        wait_for_ddb_index(ddb_client, table_name, index_name)
+        created.append(index_name)
+    return created
 
 
 def write_object_to_both_s3_and_ddb(bucket_name: str, object_name: str, data: str, table_name: str, key: pd.DataFrame, s3_client, ddb_client) -> None:
@@ -191,12 +390,11 @@ def write_object_to_both_s3_and_ddb(bucket_name: str, object_name: str, data: st
 
 
 def check_if_object_exists_in_s3(bucket_name: str, object_name: str, s3_client) -> bool:
-    """Check if object exists in S3"""
+    """Check if object exists in S3, only for callers that do not read it, readers use get_object_from_s3"""
     try:
         s3_client.head_object(Bucket=bucket_name, Key=object_name)
         return True
-    except Exception as e:
-        print(e)
+    except ClientError:
         return False
 
 
@@ -250,43 +448,3 @@ def transport_in_list(value: str) -> bool:
         print(msg)
         return False
     return True
-
-
-def get_json_data(transportation_type: str, aws_profile: str, s3_client,
-                  on_aws: bool, bucket: str, verboseprint, log, logger) -> Tuple[bool, dict]:
-
-    json_data = {}
-    try:
-        if not transport_in_list:
-            return False, json_data
-        if on_aws:
-            if aws_profile == '':
-                s3_client = get_s3_client(aws_profile)
-            if check_if_object_exists_in_s3(bucket, f'{transportation_type}.json', s3_client=s3_client):
-                verboseprint(
-                    f'Object {transportation_type}.json exists in S3, retrieving from S3...')
-                log(f'Object {transportation_type}.json exists in S3, retrieving from S3...', 'INFO', logger)
-                obj = read_object_from_s3(
-                    bucket, f'{transportation_type}.json', s3_client)
-                json_data = json.loads(obj)
-                verboseprint(json_data)
-                return True, json_data
-        elif check_local_exist(transportation_type):
-            verboseprint(
-                f'Object {transportation_type}.json exists locally, retrieving from local...')
-            log(f'Object {transportation_type}.json exists locally, retrieving from local...', 'INFO', logger)
-            with open(f'{DATA_DIRECTORY}{transportation_type}.json', encoding='utf-8') as json_file:
-                json_data = json.load(json_file)
-            verboseprint(json_data)
-            return True, json_data
-        return False, json_data
-    except Exception as e:
-        verboseprint(f'Error in get_json_data() - {e}')
-        log(f'Error in get_json_data() - {e}', 'ERROR', logger)
-        return False, json_data
-
-
-def check_local_exist(transportation_type: str) -> bool:
-    if os.path.exists(f'{DATA_DIRECTORY}{transportation_type}.csv'):
-        return True
-    return False
@@ -12,3 +12,38 @@ FLIGHTS = 'flights'
 BUS = 'bus'
 TRAIN = 'train'
 transportation_type_list = [FLIGHTS, BUS, TRAIN]
+# Typed schema of the generated datasets, shared by writers and readers
+CATEGORY_COLUMNS = ['from_Country', 'to_Country', 'from_city', 'to_city']
+DATE_COLUMNS = ['from_date', 'to_date']
+TIME_COLUMNS = ['departure', 'arrival']
+PRICE_COLUMNS = ['economy', 'eusiness', 'first_class']
+COLUMNAR_FORMATS = ['parquet', 'feather', 'arrow']
+# Arrow IPC compression per format, arrow files are uncompressed so their buffers are used in place once mapped
+IPC_COMPRESSION = {'feather': 'lz4', 'arrow': None}
+# Codecs of the csv/json objects, stored under the same names with the matching ContentEncoding
+COMPRESSIONS = ['gzip', 'zstd']
+# Sharded datasets live under {type}/ as part-00000.csv, ... listed in the manifest
+MANIFEST_NAME = 'manifest.json'
+# Secondary index objects live under {type}/index/ next to the data, listed in its own manifest
+INDEX_DIRECTORY = 'index'
+# Price statistics by route, country and date live under {type}/summary/, one object per grouping
+SUMMARY_DIRECTORY = 'summary'
+# Row count, sizes, schema and ranges of a dataset, written next to it as {type}.meta.json
+METADATA_SUFFIX = '.meta.json'
+# GSIs of the DynamoDB tables answering the same lookups: name -> (hash key, range key)
+DDB_INDEXES = {'route-index': ('route', 'from_date'), 'from_Country-index': ('from_Country', None),
+               'from_date-index': ('from_date', None)}
+# DynamoDB BatchWriteItem takes at most 25 puts, unprocessed ones are retried with exponential backoff
+DDB_BATCH_SIZE = 25
+DDB_MAX_RETRIES = 8
+DDB_BACKOFF_SECONDS = 0.05
+# A new GSI is backfilled while the table is already ACTIVE, its own status is polled for up to an hour
+DDB_INDEX_POLL_SECONDS = 5
+DDB_INDEX_MAX_POLLS = 720
+DDB_WORKERS = int(os.environ.get('DDB_WORKERS', '8'))
+# Requests the async storage layer keeps in flight at once
+STORAGE_CONCURRENCY = int(os.environ.get('STORAGE_CONCURRENCY', '8'))
+# Outcome of a single round trip S3 read
+OBJECT_FOUND = 'found'
+OBJECT_NOT_FOUND = 'not_found'
+OBJECT_NOT_MODIFIED = 'not_modified'
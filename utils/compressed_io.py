@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import gzip
+import io
+from typing import Optional
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Readers look at the first bytes rather than the object name or its ContentEncoding,
+# so plain and compressed objects can sit under the same flights.csv / flights.json keys
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def sniff_compression(head: bytes) -> Optional[str]:
+    """Get the codec of a body from its magic bytes, None for plain data"""
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def check_codec(compression: str) -> None:
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError('zstd compression needs the zstandard package')
+
+
+def compress_bytes(data: bytes, compression: Optional[str]) -> bytes:
+    if compression is None:
+        return data
+    check_codec(compression)
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def decompress_bytes(data: bytes) -> bytes:
+    """Decompress a gzip or zstd body, plain bodies are returned as they are"""
+    compression = sniff_compression(data[:4])
+    if compression is None:
+        return data
+    check_codec(compression)
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    # Frames written by a stream writer do not record their size, so read them as a stream
+    with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+        return reader.read()
+
+
+def open_compressed_writer(raw, compression: str):
+    """Wrap a binary writer so everything written to it is compressed, closing it leaves raw open"""
+    check_codec(compression)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_LEVEL)
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=False)
+
+
+class PrefixedReader(io.RawIOBase):
+    """Readable stream giving back the bytes already read from raw before the rest of raw"""
+
+    def __init__(self, head: bytes, raw):
+        super().__init__()
+        self.head = head
+        self.raw = raw
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.head:
+            size = min(len(buffer), len(self.head))
+            buffer[:size] = self.head[:size]
+            self.head = self.head[size:]
+            return size
+        data = self.raw.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_decompressed(raw):
+    """Wrap a binary reader (file or S3 body) so it reads decompressed data, without buffering the whole body"""
+    head = raw.read(4)
+    stream = io.BufferedReader(PrefixedReader(head, raw))
+    compression = sniff_compression(head)
+    if compression is None:
+        return stream
+    check_codec(compression)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    return zstandard.ZstdDecompressor().stream_reader(stream)
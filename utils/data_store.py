@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import threading
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+import pyarrow as pa
+from common_vars import OBJECT_FOUND, OBJECT_NOT_MODIFIED, MANIFEST_NAME
+from compressed_io import decompress_bytes
+from get_data import read_columnar_table, read_manifest_data
+from json_layout import dumps, loads, from_layout
+from storage import Storage, LocalStorage
+from typed_rows import MISSING, TypedRows
+
+# Seconds between two checks of the stored datasets by the background refresh
+REFRESH_SECONDS = float(os.environ.get('DATA_REFRESH_SECONDS', '60'))
+GZIP_LEVEL = 6
+# Rows decoded and encoded at a time while a whole dataset is streamed
+BODY_CHUNK_ROWS = 10000
+# Gzipped whole dataset bodies kept per version and layout, a body that does not fit is streamed every time
+BODY_CACHE_BYTES = int(os.environ.get('BODY_CACHE_BYTES', str(256 * 2 ** 20)))
+
+
+def iter_layout(rows: TypedRows, layout: str, key_name: str) -> Iterator[bytes]:
+    """Encode the whole dataset in a layout chunk by chunk, the same JSON to_layout would give in one piece
+
+    Only a chunk of rows is ever materialized as dicts, the columns layout is written one column at a time."""
+    chunks = [slice(start, start + BODY_CHUNK_ROWS) for start in range(0, len(rows), BODY_CHUNK_ROWS)]
+    if layout == 'index':
+        for index, chunk in enumerate(chunks):
+            yield (b'{' if index == 0 else b',') + dumps(dict(rows.iter_rows(chunk)))[1:-1].encode('utf-8')
+        yield b'}' if chunks else b'{}'
+        return
+    columns = list(next(rows.iter_rows(slice(0, 1)), (None, {}))[1])
+    if layout == 'records':
+        yield f'{{"columns":{dumps([key_name] + columns)},"data":['.encode('utf-8')
+        for index, chunk in enumerate(chunks):
+            data = [[key] + [row.get(column) for column in columns] for key, row in rows.iter_rows(chunk)]
+            yield (b'' if index == 0 else b',') + dumps(data)[1:-1].encode('utf-8')
+        yield b']}'
+        return
+    for position, column in enumerate([key_name] + columns):
+        yield f'{"{" if position == 0 else ","}{dumps(column)}:['.encode('utf-8')
+        for index, chunk in enumerate(chunks):
+            values = rows.keys_at(chunk) if position == 0 else rows.decode(column, chunk)
+            if rows.has_missing:
+                values = [None if value is MISSING else value for value in values]
+            yield (b'' if index == 0 else b',') + dumps(values)[1:-1].encode('utf-8')
+        yield b']'
+    yield b'}'
+
+
+def iter_gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Gzip a stream of chunks as it is consumed"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class DataStore:
+    """Datasets of the process, loaded up front and swapped in whole by a background refresh
+
+    Requests only read the current entry of a type, they never load or parse a dataset. An entry holds the
+    rows as typed columns (their query index included) and the ETag of its source version. Whole dataset
+    bodies are encoded from the columns while they are sent, the gzipped ones are kept once fully sent."""
+
+    def __init__(self, transportation_types: Iterable[str], storage: Optional[Storage] = None, log=None):
+        self.transportation_types = list(transportation_types)
+        self.storage = storage or LocalStorage()
+        self.log = log or (lambda msg, level: None)
+        self.entries = {}
+        # (digest, layout) -> (size, gzipped chunks) of the bodies sent for the current entries
+        self.bodies = {}
+        self.bodies_lock = threading.Lock()
+        self.stop = threading.Event()
+        self.refresher = None
+
+    def get(self, transportation_type: str) -> Optional[dict]:
+        return self.entries.get(transportation_type)
+
+    @staticmethod
+    def source_names(transportation_type: str) -> List[str]:
+        """Get the objects a dataset can be loaded from, preferred first
+
+        The manifest of a sharded dataset (or of the parts appended to a single file) stands for the parts it
+        lists, every generation and append rewrites it. {type}.arrow is loaded without parsing json."""
+        return [f'{transportation_type}/{MANIFEST_NAME}', f'{transportation_type}.arrow', f'{transportation_type}.json']
+
+    def read_parts(self, transportation_type: str, manifest: dict) -> TypedRows:
+        """Encode the rows of the parts a manifest lists, read like get_csv_data reads them"""
+        df = read_manifest_data(transportation_type, manifest, self.storage, lambda *args: None,
+                                lambda msg, level, logger: self.log(msg, level), None)
+        return TypedRows.from_table(pa.Table.from_pandas(df, preserve_index=False), f'{transportation_type}_number')
+
+    def read_source(self, transportation_type: str,
+                    current: Optional[dict]) -> Tuple[Optional[str], Optional[str], Optional[bytes]]:
+        """Get the source of a dataset, its version (S3 ETag, or mtime and size) and its bytes, no bytes if
+        it is unchanged"""
+        for name in self.source_names(transportation_type):
+            known = current['version'] if current and current['source'] == name else None
+            status, body, version = self.storage.get(name, known)
+            if status == OBJECT_NOT_MODIFIED:
+                return name, version, None
+            if status == OBJECT_FOUND:
+                return name, version, body
+        return None, None, None
+
+    def load(self, transportation_type: str) -> bool:
+        """Load a dataset if its source changed since the current entry, True when a new entry was swapped in"""
+        source, version, raw = self.read_source(transportation_type, self.entries.get(transportation_type))
+        if source is None:
+            # The dataset was removed, stop serving the old rows
+            return self.entries.pop(transportation_type, None) is not None
+        if raw is None:
+            return False
+        if source.endswith(MANIFEST_NAME):
+            rows = self.read_parts(transportation_type, loads(raw))
+        elif source.endswith('.arrow'):
+            rows = TypedRows.from_table(read_columnar_table(pa.BufferReader(raw), 'arrow'),
+                                        f'{transportation_type}_number')
+        else:
+            rows = TypedRows.from_json_data(from_layout(loads(decompress_bytes(raw))))
+        # Every worker loading the same source version gives its rows the same ETag
+        entry = {'source': source, 'version': version, 'rows': rows,
+                 'digest': hashlib.sha256(f'{source}:{version}'.encode('utf-8')).hexdigest()[:32]}
+        # One assignment, a request sees either the old entry or the complete new one
+        self.entries[transportation_type] = entry
+        with self.bodies_lock:
+            self.drop_stale_bodies()
+        self.log(f'Loaded {len(rows)} rows of {transportation_type} from {source} ({version})', 'INFO')
+        return True
+
+    def load_all(self) -> None:
+        for transportation_type in self.transportation_types:
+            try:
+                self.load(transportation_type)
+            except Exception as e:
+                # Keep serving the previous entry, the next refresh tries again
+                self.log(f'Error in loading {transportation_type} - {e}', 'ERROR')
+
+    def get_body(self, transportation_type: str, layout: str,
+                 use_gzip: bool) -> Optional[Tuple[Iterator[bytes], str]]:
+        """Get the whole dataset as minified JSON chunks in a layout and its ETag
+
+        The chunks are only encoded as they are consumed, a 304 never encodes anything."""
+        entry = self.entries.get(transportation_type)
+        if entry is None:
+            return None
+        etag = f'{entry["digest"]}-{layout}{"-gz" if use_gzip else ""}'
+        cached = self.bodies.get((entry['digest'], layout)) if use_gzip else None
+        if cached is not None:
+            return iter(cached[1]), etag
+        chunks = iter_layout(entry['rows'], layout, f'{transportation_type}_number')
+        if not use_gzip:
+            return chunks, etag
+        return self.cache_body(entry['digest'], layout, iter_gzip(chunks)), etag
+
+    def cache_body(self, digest: str, layout: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Send the gzipped chunks and keep them once all are sent, while the bodies fit in BODY_CACHE_BYTES
+
+        A response cut short keeps nothing, the next one encodes the body again."""
+        sent, size = [], 0
+        for chunk in chunks:
+            size += len(chunk)
+            if size <= BODY_CACHE_BYTES:
+                sent.append(chunk)
+            yield chunk
+        with self.bodies_lock:
+            self.drop_stale_bodies()
+            if size + sum(body[0] for body in self.bodies.values()) <= BODY_CACHE_BYTES and \
+                    digest in {entry['digest'] for entry in self.entries.values()}:
+                self.bodies[(digest, layout)] = (size, sent)
+
+    def drop_stale_bodies(self) -> None:
+        """Forget the bodies of the versions swapped out by a refresh"""
+        live = {entry['digest'] for entry in self.entries.values()}
+        self.bodies = {key: body for key, body in self.bodies.items() if key[0] in live}
+
+    def refresh(self) -> None:
+        while not self.stop.wait(REFRESH_SECONDS):
+            self.load_all()
+
+    def start_refresh(self) -> None:
+        """Start the background refresh, in each process as threads do not survive a fork"""
+        if self.refresher is None or not self.refresher.is_alive():
+            self.stop.clear()
+            self.refresher = threading.Thread(target=self.refresh, name='data-store-refresh', daemon=True)
+            self.refresher.start()
+
+    def stop_refresh(self) -> None:
+        self.stop.set()
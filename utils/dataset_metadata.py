@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+from common_vars import DATE_COLUMNS, PRICE_COLUMNS, METADATA_SUFFIX
+
+
+# {type}.meta.json is built batch by batch and shard by shard while the dataset is written: the checksum is
+# the sum modulo 2**64 of the row hashes, so partial descriptions merge in any order and appends extend it
+def metadata_name(transportation_type: str) -> str:
+    return f'{transportation_type}{METADATA_SUFFIX}'
+
+
+def column_kind(column: str, series: pd.Series) -> str:
+    if column in DATE_COLUMNS or pd.api.types.is_datetime64_any_dtype(series):
+        return 'date'
+    if pd.api.types.is_integer_dtype(series):
+        return 'integer'
+    if pd.api.types.is_float_dtype(series):
+        return 'float'
+    return 'string'
+
+
+def column_range(series: pd.Series) -> Optional[list]:
+    """Get the [min, max] of a column, a categorical one only compares the categories its rows use"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = np.unique(series.cat.codes)
+        series = pd.Series(series.cat.categories[codes[codes >= 0]])
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        series = series.dt.strftime('%Y-%m-%d')
+    series = series.dropna()
+    if series.empty:
+        return None
+    return [value.item() if isinstance(value, np.generic) else value for value in (series.min(), series.max())]
+
+
+def row_checksum(df: pd.DataFrame) -> str:
+    """Sum the row hashes, dates hashed as 'YYYY-MM-DD' whether they were generated or read back typed"""
+    dates = {column: df[column].dt.strftime('%Y-%m-%d') for column in DATE_COLUMNS
+             if column in df and pd.api.types.is_datetime64_any_dtype(df[column])}
+    hashes = pd.util.hash_pandas_object(df.assign(**dates), index=False).to_numpy()
+    return f'{int(hashes.sum(dtype=np.uint64)):016x}'
+
+
+def describe_rows(df: pd.DataFrame) -> dict:
+    """Describe a batch of rows: count, schema, date and price ranges and checksum"""
+    return {'rows': len(df),
+            'schema': {column: column_kind(column, df[column]) for column in df.columns},
+            'dates': {column: column_range(df[column]) for column in DATE_COLUMNS if column in df},
+            'prices': {column: column_range(df[column]) for column in PRICE_COLUMNS if column in df},
+            'checksum': row_checksum(df)}
+
+
+def merge_ranges(total: Dict[str, Optional[list]], part: Dict[str, Optional[list]]) -> Dict[str, Optional[list]]:
+    ranges = dict(total)
+    for column, bounds in part.items():
+        if ranges.get(column) is None or bounds is None:
+            ranges[column] = ranges.get(column) or bounds
+        else:
+            ranges[column] = [min(ranges[column][0], bounds[0]), max(ranges[column][1], bounds[1])]
+    return ranges
+
+
+def merge_metadata(total: Optional[dict], part: dict) -> dict:
+    """Describe the rows of total and part together, total is None before the first batch"""
+    if total is None:
+        return dict(part)
+    return dict(total, rows=total['rows'] + part['rows'], schema=dict(part['schema'], **total['schema']),
+                dates=merge_ranges(total['dates'], part['dates']),
+                prices=merge_ranges(total['prices'], part['prices']),
+                checksum=f'{(int(total["checksum"], 16) + int(part["checksum"], 16)) % 2 ** 64:016x}')
+
+
+def stamp_metadata(metadata: dict, transportation_type: str, file_bytes: Dict[str, int], generated: bool) -> dict:
+    """Add the type, file sizes and times, a regeneration also resets generated_at"""
+    now = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    stamped = dict(metadata, transportation_type=transportation_type, bytes=file_bytes, updated_at=now)
+    if generated or 'generated_at' not in stamped:
+        stamped['generated_at'] = now
+    return stamped
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from typing import Dict
+import pandas as pd
+from summaries import SUMMARY_DIMENSIONS, SUMMARY_PRICES, SUMMARY_STATS, summary_columns
+
+
+# {type}/summary/ is computed with pandas groupbys when a dataset is generated: each group keeps the sums of its
+# prices next to its row, so the summaries of appended rows merge in without reading the dataset back
+def compute_summaries(df: pd.DataFrame) -> Dict[str, dict]:
+    """Aggregate the prices by route, country and date with vectorized groupbys, groups sorted by their columns"""
+    prices = df[list(SUMMARY_PRICES.values())].set_axis(list(SUMMARY_PRICES), axis=1)
+    sum_columns = [f'{price}_sum' for price in SUMMARY_PRICES]
+    summaries = {}
+    for dimension, columns in SUMMARY_DIMENSIONS.items():
+        grouped = prices.groupby([df[column].astype(str) for column in columns], sort=True)
+        stats = grouped.agg(SUMMARY_STATS + ['sum']).round(2)
+        stats.columns = [f'{price}_{stat}' for price, stat in stats.columns]
+        stats = stats.assign(count=grouped.size()).reset_index()
+        summaries[dimension] = {'group_by': dimension, 'rows': len(df), 'columns': summary_columns(dimension),
+                                'data': list(map(list, zip(*(stats[column].tolist()
+                                                             for column in summary_columns(dimension))))),
+                                'sums': list(map(list, zip(*(stats[column].tolist() for column in sum_columns))))}
+    return summaries
+
+
+def merge_group(stored: tuple, appended: tuple, width: int) -> tuple:
+    """Merge the (row, sums) of a group: counts and sums add up, min and max widen, the means follow the sums"""
+    (row, sums), (new_row, new_sums) = stored, appended
+    count = row[width] + new_row[width]
+    sums = [price_sum + new_sum for price_sum, new_sum in zip(sums, new_sums)]
+    merged = row[:width] + [count]
+    for position, price_sum in enumerate(sums):
+        start = width + 1 + position * len(SUMMARY_STATS)
+        stats = dict(zip(SUMMARY_STATS, row[start:start + len(SUMMARY_STATS)]))
+        new_stats = dict(zip(SUMMARY_STATS, new_row[start:start + len(SUMMARY_STATS)]))
+        stats = {'min': min(stats['min'], new_stats['min']), 'max': max(stats['max'], new_stats['max']),
+                 'mean': round(price_sum / count, 2)}
+        merged += [stats[stat] for stat in SUMMARY_STATS]
+    return merged, sums
+
+
+def merge_summaries(stored: Dict[str, dict], appended: Dict[str, dict]) -> Dict[str, dict]:
+    """Merge the summaries of appended rows into the stored ones, groups kept sorted by their columns"""
+    merged = {}
+    for dimension, summary in stored.items():
+        width = len(SUMMARY_DIMENSIONS[dimension])
+        groups = {tuple(row[:width]): (row, sums) for row, sums in zip(summary['data'], summary['sums'])}
+        for row, sums in zip(appended[dimension]['data'], appended[dimension]['sums']):
+            key = tuple(row[:width])
+            groups[key] = merge_group(groups[key], (row, sums), width) if key in groups else (row, sums)
+        ordered = [groups[key] for key in sorted(groups)]
+        merged[dimension] = {**summary, 'rows': summary['rows'] + appended[dimension]['rows'],
+                             'data': [row for row, _ in ordered], 'sums': [sums for _, sums in ordered]}
+    return merged
@@ -1,49 +1,236 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import argparse
+import asyncio
+import hashlib
+import io
+import operator
+import os
 import sys
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import List, Optional, Tuple
 import pandas as pd
-from common_vars import DATA_DIRECTORY
+import pyarrow as pa
+from pyarrow import feather
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+from common_vars import COLUMNAR_FORMATS, CATEGORY_COLUMNS, DATE_COLUMNS, PRICE_COLUMNS, MANIFEST_NAME
 from common_funcs import get_verbose_logger, get_verbose, get_transportation_type, get_on_aws, get_aws_profile, get_bucket, \
-    get_s3_client, check_if_object_exists_in_s3, read_object_from_s3, transport_in_list, get_logger, generate_json_file, \
-    check_local_exist, get_json_data
+    get_s3_client, transport_in_list, get_logger, generate_json_file, get_concurrency
+from async_storage import gather_bounded
+from storage import Storage, get_storage, get_json_data
+from compressed_io import open_decompressed
 
+CSV_DTYPES = {column: 'category' for column in CATEGORY_COLUMNS} | {column: 'int16' for column in PRICE_COLUMNS} \
+    | {'departure': 'str', 'arrival': 'str'}
+CSV_CHUNK_ROWS = 100000
+READ_WORKERS = os.cpu_count() or 4
+FILTER_OPERATORS = {'==': operator.eq, '=': operator.eq, '!=': operator.ne, '<': operator.lt,
+                    '<=': operator.le, '>': operator.gt, '>=': operator.ge}
 
-def handle_df(obj: str) -> pd.DataFrame:
-    rows = obj.split('\n')
-    df = pd.DataFrame(rows)
-    df = df[0].str.split(',', expand=True)
-    df.columns = df.iloc[0]
-    df.drop(df.index[0], inplace=True)
+
+def read_csv_stream(source, columns: Optional[List[str]] = None, filters: Optional[List[tuple]] = None,
+                    chunksize: int = CSV_CHUNK_ROWS) -> pd.DataFrame:
+    """Read a plain, gzip or zstd csv path or file-like body in chunks with the dataset dtypes, filtering each chunk"""
+    read_columns = None
+    if columns is not None:
+        read_columns = columns + [f[0] for f in filters or [] if f[0] not in columns]
+    chunks = []
+    with ExitStack() as stack:
+        if isinstance(source, str):
+            source = stack.enter_context(open(source, 'rb'))
+        # gzip/zstd bodies are decompressed while pandas reads them
+        reader = stack.enter_context(pd.read_csv(
+            open_decompressed(source), encoding='utf-8', usecols=read_columns, chunksize=chunksize,
+            dtype=CSV_DTYPES, parse_dates=[c for c in DATE_COLUMNS if read_columns is None or c in read_columns],
+            date_format='%Y-%m-%d'))
+        for chunk in reader:
+            chunks.append(apply_filters(chunk, filters))
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    df = concat_frames(chunks)
+    return df[columns] if columns is not None else df
+
+
+def concat_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concat frames read separately, aligning their categories so the category dtype is kept"""
+    for column in frames[0].select_dtypes('category'):
+        categories = union_categoricals([frame[column] for frame in frames]).categories
+        for frame in frames:
+            frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_columnar_table(source, file_format: str, columns: Optional[List[str]] = None,
+                        filters: Optional[List[tuple]] = None) -> pa.Table:
+    """Read a parquet/feather/arrow dataset as a table, decoding only the requested columns and matching rows
+
+    An arrow file is uncompressed: read from a memory-mapped buffer its columns are views of the mapped pages,
+    only the filter columns are scanned and only the matching rows of the requested columns are copied."""
+    if file_format == 'parquet':
+        return pq.read_table(source, columns=columns, filters=filters)
+    read_columns = None
+    if columns is not None:
+        read_columns = columns + [f[0] for f in filters or [] if f[0] not in columns]
+    table = feather.read_table(source, columns=read_columns)
+    if filters:
+        table = table.filter(pq.filters_to_expression(filters))
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def read_columnar(source, file_format: str, columns: Optional[List[str]] = None,
+                  filters: Optional[List[tuple]] = None) -> pd.DataFrame:
+    """Read a parquet/feather/arrow dataset, decoding only the requested columns and matching rows"""
+    return read_columnar_table(source, file_format, columns, filters).to_pandas(date_as_object=False)
+
+
+def map_columnar_table(transportation_type: str, storage: Storage, columns: Optional[List[str]] = None,
+                       filters: Optional[List[tuple]] = None) -> Optional[pa.Table]:
+    """Get the {type}.arrow table over the mapped file, None when the dataset has no arrow file
+
+    Locally the pages are shared through the page cache by every process mapping the file. A regeneration
+    replaces the file rather than rewriting it, so the table keeps the rows it was mapped with."""
+    body = storage.map(f'{transportation_type}.arrow')
+    if body is None:
+        return None
+    return read_columnar_table(pa.BufferReader(body), 'arrow', columns, filters)
+
+
+def apply_filters(df: pd.DataFrame, filters: Optional[List[tuple]]) -> pd.DataFrame:
+    """Apply (column, op, value) filters to a DataFrame read from csv"""
+    for column, op, value in filters or []:
+        if op == 'in':
+            df = df[df[column].isin(value)]
+        else:
+            df = df[FILTER_OPERATORS[op](df[column], value)]
     return df
 
 
+def get_columnar_data(transportation_type: str, storage: Storage, verboseprint, log, logger,
+                      columns: Optional[List[str]] = None,
+                      filters: Optional[List[tuple]] = None) -> Tuple[bool, pd.DataFrame]:
+    for file_format in COLUMNAR_FORMATS:
+        object_name = f'{transportation_type}.{file_format}'
+        # Memory-mapped locally, downloaded in parallel ranges into a mapped temp file from S3
+        body = storage.map(object_name)
+        if body is not None:
+            verboseprint(f'Object {object_name} exists {storage.where}, retrieving...')
+            log(f'Object {object_name} exists {storage.where}, retrieving...', 'INFO', logger)
+            return True, read_columnar(pa.BufferReader(body), file_format, columns, filters)
+    return False, pd.DataFrame()
+
+
+def read_manifest(transportation_type: str, storage: Storage) -> Optional[dict]:
+    """Get the manifest of a sharded dataset, None if the dataset is not sharded"""
+    return storage.read_json(f'{transportation_type}/{MANIFEST_NAME}')
+
+
+def read_part(transportation_type: str, part: dict, storage: Storage,
+              columns: Optional[List[str]], filters: Optional[List[tuple]]) -> pd.DataFrame:
+    """Read one part file of a sharded dataset, checking it against the manifest checksum"""
+    object_name = f'{transportation_type}/{part["file"]}'
+    body = storage.map(object_name)
+    if body is None:
+        raise ValueError(f'Missing part {object_name}')
+    if hashlib.sha256(body).hexdigest() != part['sha256']:
+        raise ValueError(f'Checksum mismatch in {object_name}')
+    if part['format'] == 'csv':
+        return read_csv_stream(io.BytesIO(body), columns, filters)
+    return read_columnar(pa.BufferReader(body), part['format'], columns, filters)
+
+
+def read_parts(transportation_type: str, parts: List[dict], storage: Storage,
+               columns: Optional[List[str]], filters: Optional[List[tuple]]) -> List[pd.DataFrame]:
+    """Read the part files of a sharded dataset in parallel"""
+    if not parts:
+        return []
+    with ThreadPoolExecutor(max_workers=min(READ_WORKERS, len(parts))) as executor:
+        return list(executor.map(lambda part: read_part(transportation_type, part, storage, columns, filters),
+                                 parts))
+
+
+def select_parts(manifest: dict) -> Tuple[str, List[dict]]:
+    """Get the preferred format of a sharded dataset and its parts, one part per shard
+
+    Appended shards may have been written with other formats than the first ones."""
+    shards = {}
+    for part in manifest['parts']:
+        shards.setdefault(part['file'].split('.', 1)[0], []).append(part)
+    parts = []
+    for shard_parts in shards.values():
+        formats = {part['format']: part for part in shard_parts}
+        parts.append(formats[next((f for f in COLUMNAR_FORMATS if f in formats), 'csv')])
+    file_format = next((f for f in COLUMNAR_FORMATS if all(part['format'] == f for part in parts)), 'csv')
+    return file_format, parts
+
+
+def get_sharded_data(transportation_type: str, storage: Storage, verboseprint, log, logger,
+                     columns: Optional[List[str]] = None,
+                     filters: Optional[List[tuple]] = None) -> Tuple[bool, pd.DataFrame]:
+    """Read every part of a sharded dataset in parallel, preferring columnar parts"""
+    manifest = read_manifest(transportation_type, storage)
+    if manifest is None:
+        return False, pd.DataFrame()
+    return True, read_manifest_data(transportation_type, manifest, storage, verboseprint, log, logger,
+                                    columns, filters)
+
+
+def read_manifest_data(transportation_type: str, manifest: dict, storage: Storage, verboseprint, log, logger,
+                       columns: Optional[List[str]] = None,
+                       filters: Optional[List[tuple]] = None) -> pd.DataFrame:
+    """Read the parts listed in a manifest, on top of the single file of an unsharded dataset with appends"""
+    file_format, parts = select_parts(manifest)
+    verboseprint(f'Reading {len(parts)} {file_format} parts of {transportation_type}...')
+    log(f'Reading {len(parts)} {file_format} parts of {transportation_type}...', 'INFO', logger)
+    frames = []
+    if manifest.get('base'):
+        # Rows appended to an unsharded dataset are parts on top of its single file
+        base = get_file_data(transportation_type, storage, verboseprint, log, logger, columns, filters)
+        if base[0]:
+            frames.append(base[1])
+    frames += read_parts(transportation_type, parts, storage, columns, filters)
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return concat_frames(frames)
+
+
+def get_file_data(transportation_type: str, storage: Storage, verboseprint, log, logger,
+                  columns: Optional[List[str]] = None,
+                  filters: Optional[List[tuple]] = None) -> Tuple[bool, pd.DataFrame]:
+    """Get an unsharded dataset, preferring the columnar file over the csv"""
+    success, df = get_columnar_data(transportation_type, storage, verboseprint, log, logger, columns, filters)
+    if success:
+        return True, df
+    source = storage.open(f'{transportation_type}.csv')
+    if source is None:
+        return False, df
+    verboseprint(f'Object {transportation_type}.csv exists {storage.where}, retrieving...')
+    log(f'Object {transportation_type}.csv exists {storage.where}, retrieving...', 'INFO', logger)
+    with source:
+        return True, read_csv_stream(source, columns, filters)
+
+
 def get_csv_data(transportation_type: str, aws_profile: str,
-                 on_aws: bool, bucket: str, verboseprint, log, logger) -> Tuple[bool, pd.DataFrame]:
+                 on_aws: bool, bucket: str, verboseprint, log, logger,
+                 columns: Optional[List[str]] = None, filters: Optional[List[tuple]] = None,
+                 storage: Optional[Storage] = None) -> Tuple[bool, pd.DataFrame]:
+    """Get the dataset, preferring a sharded dataset, then the columnar file, then the csv
+
+    The storage the flags point to can be replaced, e.g. by a MemoryStorage to measure the readers alone."""
     df = pd.DataFrame()
     try:
         if not transport_in_list:
             return False, df
-        if on_aws:
-            s3_client = get_s3_client(aws_profile)
-            if check_if_object_exists_in_s3(bucket, f'{transportation_type}.csv', s3_client=s3_client):
-                verboseprint(
-                    f'Object {transportation_type}.csv exists in S3, retrieving from S3...')
-                log(f'Object {transportation_type}.csv exists in S3, retrieving from S3...', 'INFO', logger)
-                obj = read_object_from_s3(
-                    bucket, f'{transportation_type}.csv', s3_client)
-                df = handle_df(obj)
-                # verboseprint(df)
+        if storage is None:
+            storage = get_storage(on_aws, bucket, get_s3_client(aws_profile) if on_aws else None)
+        for get_preferred_data in (get_sharded_data, get_file_data):
+            success, df = get_preferred_data(transportation_type, storage, verboseprint, log, logger,
+                                             columns, filters)
+            if success:
                 return True, df
-        elif check_local_exist(transportation_type):
-            verboseprint(
-                f'Object {transportation_type}.csv exists locally, retrieving from local...')
-            log(f'Object {transportation_type}.csv exists locally, retrieving from local...', 'INFO', logger)
-            df = pd.read_csv(
-                f'{DATA_DIRECTORY}{transportation_type}.csv', encoding='utf-8')
-            verboseprint(df)
-            return True, df
         return False, df
     except Exception as e:
         verboseprint(f'Error in get_csv_data() - {e}')
@@ -60,6 +247,7 @@ def main():
      on_aws,
      bucket,
      json,
+     concurrency,
      verbose,
      logger) = check_args(sys.argv[1:])
 
@@ -69,32 +257,39 @@ def main():
                   f' aws_profile: {aws_profile}\n'
                   f' on_aws: {on_aws}\n'
                   f' bucket: {bucket}\n'
+                  f' concurrency: {concurrency}\n'
                   f' verbose: {verbose}\n'
                   f'logger: {logger}'))
 
-    for transportation_type in transportation_type:
-        if get_csv_data(transportation_type, aws_profile, on_aws, bucket, verboseprint, log, logger)[0]:
-            verboseprint(f'{transportation_type}.csv has successful retrieved')
-            log(f'{transportation_type}.csv has successful retrieved', 'INFO', logger)
+    # Fetch the csv and json of every type at once, the wall time is the slowest object rather than the sum
+    calls = [(get_csv_data, (ttype, aws_profile, on_aws, bucket, verboseprint, log, logger))
+             for ttype in transportation_type]
+    if json:
+        calls += [(get_json_data, (ttype, aws_profile, None, on_aws, bucket, verboseprint, log, logger))
+                  for ttype in transportation_type]
+    results = asyncio.run(gather_bounded(calls, concurrency))
+
+    for index, ttype in enumerate(transportation_type):
+        if results[index][0]:
+            verboseprint(f'{ttype}.csv has successful retrieved')
+            log(f'{ttype}.csv has successful retrieved', 'INFO', logger)
         else:
-            verboseprint(f'{transportation_type}.csv has failed to retrieve')
-            log(f'{transportation_type}.csv has failed to retrieve', 'ERROR', logger)
+            verboseprint(f'{ttype}.csv has failed to retrieve')
+            log(f'{ttype}.csv has failed to retrieve', 'ERROR', logger)
             return False
         if json:
-            get_json_data(transportation_type, aws_profile, None,
-                          on_aws, bucket, verboseprint, log, logger)
             verboseprint(
-                f'{transportation_type}.json has successful retrieved')
-            log(f'{transportation_type}.json has successful retrieved', 'INFO', logger)
+                f'{ttype}.json has successful retrieved')
+            log(f'{ttype}.json has successful retrieved', 'INFO', logger)
         else:
-            verboseprint(f'{transportation_type}.json has failed to retrieve')
-            log(f'{transportation_type}.json has failed to retrieve', 'ERROR', logger)
+            verboseprint(f'{ttype}.json has failed to retrieve')
+            log(f'{ttype}.json has failed to retrieve', 'ERROR', logger)
             return False
 
     return True
 
 
-def check_args(args=None) -> Tuple[str, str, bool, str, bool, bool, bool]:
+def check_args(args=None) -> Tuple[str, str, bool, str, bool, int, bool, bool]:
     """Get command line arguments"""
     parser = argparse.ArgumentParser(description="Generate flights.csv file")
 
@@ -103,6 +298,7 @@ def check_args(args=None) -> Tuple[str, str, bool, str, bool, bool, bool]:
     get_on_aws(parser)
     get_bucket(parser)
     generate_json_file(parser)
+    get_concurrency(parser)
     get_verbose(parser)
     get_logger(parser)
 
@@ -112,6 +308,7 @@ def check_args(args=None) -> Tuple[str, str, bool, str, bool, bool, bool]:
             cmd_line_args.on_aws,
             cmd_line_args.bucket,
             cmd_line_args.json,
+            cmd_line_args.concurrency,
             cmd_line_args.verbose,
             cmd_line_args.logger
             )
@@ -1,24 +1,49 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import argparse
+import asyncio
 import sys
-from typing import Tuple
+from typing import List, Tuple
 from common_funcs import get_verbose_logger, get_verbose, get_transportation_type, get_on_aws, get_aws_profile, get_bucket, \
-    get_s3_client, read_object_from_s3, get_logger
+    get_s3_client, get_logger, get_concurrency
+from storage import get_json_data, read_json_object
+from async_storage import get_semaphore, run_bounded
+from dataset_metadata import metadata_name
 
 
-def get_json_length(transportation_type: str, aws_profile: str,
+def count_json_rows(transportation_type: str, aws_profile: str,
                     on_aws: bool, bucket: str, verboseprint, log, logger) -> int:
-    length = 0
-    s3_client = get_s3_client(aws_profile)
+    """Get the row count from {type}.meta.json, the json itself is only downloaded for a dataset without one"""
+    s3_client = get_s3_client(aws_profile) if on_aws else None
+    metadata = read_json_object(metadata_name(transportation_type), on_aws, bucket, s3_client)
+    if metadata is not None:
+        return metadata['rows']
+    verboseprint(f'No {metadata_name(transportation_type)}, counting the rows of {transportation_type}.json')
+    log(f'No {metadata_name(transportation_type)}, counting the rows of {transportation_type}.json', 'WARNING', logger)
+    _, json_data = get_json_data(transportation_type, aws_profile, s3_client, on_aws, bucket,
+                                 verboseprint, log, logger)
+    return len(json_data)
 
-    json_object = read_object_from_s3(
-        bucket, f'{transportation_type}.json', s3_client)
 
-    print(f'{len(json_object)}')
+def get_json_length(transportation_type: str, aws_profile: str,
+                    on_aws: bool, bucket: str, verboseprint, log, logger) -> int:
+    length = count_json_rows(transportation_type, aws_profile, on_aws, bucket, verboseprint, log, logger)
+    print(f'{length}')
     return length
 
 
+async def get_json_lengths(transportation_types: List[str], aws_profile: str, on_aws: bool, bucket: str,
+                           concurrency: int, verboseprint, log, logger) -> List[int]:
+    """Read every type's metadata at once and print their row counts in the order they were requested"""
+    semaphore = get_semaphore(concurrency)
+    lengths = await asyncio.gather(*(run_bounded(semaphore, count_json_rows, ttype, aws_profile, on_aws, bucket,
+                                                 verboseprint, log, logger)
+                                     for ttype in transportation_types))
+    for length in lengths:
+        print(f'{length}')
+    return lengths
+
+
 def main():
     global verboseprint
     global log
@@ -27,6 +52,7 @@ def main():
      aws_profile,
      on_aws,
      bucket,
+     concurrency,
      verbose,
      logger) = check_args(sys.argv[1:])
 
@@ -36,15 +62,15 @@ def main():
                   f' aws_profile: {aws_profile}\n'
                   f' on_aws: {on_aws}\n'
                   f' bucket: {bucket}\n'
+                  f' concurrency: {concurrency}\n'
                   f' verbose: {verbose}\n'
                   f'logger: {logger}'))
-    for ttype in transportation_type:
-        get_json_length(ttype, aws_profile, on_aws,
-                        bucket, verboseprint, log, logger)
+    asyncio.run(get_json_lengths(transportation_type, aws_profile, on_aws, bucket, concurrency,
+                                verboseprint, log, logger))
     return True
 
 
-def check_args(args=None) -> Tuple[str, str, bool, str, bool, bool]:
+def check_args(args=None) -> Tuple[str, str, bool, str, int, bool, bool]:
     """Get command line arguments"""
     parser = argparse.ArgumentParser(description="Generate flights.csv file")
 
@@ -52,6 +78,7 @@ def check_args(args=None) -> Tuple[str, str, bool, str, bool, bool]:
     get_aws_profile(parser)
     get_on_aws(parser)
     get_bucket(parser)
+    get_concurrency(parser)
     get_verbose(parser)
     get_logger(parser)
 
@@ -60,6 +87,7 @@ def check_args(args=None) -> Tuple[str, str, bool, str, bool, bool]:
             cmd_line_args.aws_profile,
             cmd_line_args.on_aws,
             cmd_line_args.bucket,
+            cmd_line_args.concurrency,
             cmd_line_args.verbose,
             cmd_line_args.logger
             )
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import json
+from typing import Tuple
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# index:   {"F000001": {"from_city": ..., ...}, ...} - the stored orient='index' shape, column names in every row
+# records: {"columns": ["flights_number", "from_city", ...], "data": [["F000001", ...], ...]}
+# columns: {"flights_number": ["F000001", ...], "from_city": [...], ...}
+JSON_LAYOUTS = ['index', 'records', 'columns']
+DEFAULT_LAYOUT = 'index'
+
+
+def dumps(obj) -> str:
+    """Minified JSON text, encoded by orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def loads(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def get_layout(params: dict) -> Tuple[bool, str]:
+    """Get the layout asked for with ?layout=, or an error message"""
+    layout = params.get('layout') or DEFAULT_LAYOUT
+    if layout not in JSON_LAYOUTS:
+        return False, f'Invalid query - layout must be one of {JSON_LAYOUTS}'
+    return True, layout
+
+
+def to_layout(json_data: dict, layout: str, key_name: str):
+    """Convert orient='index' rows to the requested layout, stating the column names once"""
+    if layout == 'index':
+        return json_data
+    columns = list(next(iter(json_data.values()), {}))
+    if layout == 'records':
+        return {'columns': [key_name] + columns,
+                'data': [[key] + [row.get(column) for column in columns] for key, row in json_data.items()]}
+    return {key_name: list(json_data),
+            **{column: [row.get(column) for row in json_data.values()] for column in columns}}
+
+
+def from_layout(data: dict) -> dict:
+    """Convert a records or columns layout back to orient='index' rows, index data is returned as it is"""
+    if set(data) == {'columns', 'data'} and isinstance(data['data'], list):
+        columns = data['columns'][1:]
+        return {row[0]: dict(zip(columns, row[1:])) for row in data['data']}
+    if data and all(isinstance(values, list) for values in data.values()):
+        key_name, *columns = list(data)
+        return {key: {column: data[column][row_id] for column in columns}
+                for row_id, key in enumerate(data[key_name])}
+    return data
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Tuple
+
+# Query parameter -> column matched exactly through an inverted index
+MATCH_FILTERS = {'from_city': 'from_city', 'to_city': 'to_city',
+                 'from_country': 'from_Country', 'to_country': 'to_Country'}
+# Columns kept in sorted order to answer range filters
+RANGE_COLUMNS = ['from_date', 'economy', 'eusiness', 'first_class']
+PRICE_CLASSES = {'economy': 'economy',
+                 'business': 'eusiness', 'first_class': 'first_class'}
+QUERY_PARAMS = list(MATCH_FILTERS) + ['date_from', 'date_to', 'price_class', 'min_price',
+                                      'max_price', 'limit', 'cursor', 'fields']
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Range slices up to this size are sorted and walked instead of scanning all rows
+SLICE_THRESHOLD = 4096
+
+
+def build_index(json_data: dict) -> dict:
+    """Build the in-memory index of an orient='index' dataset, rows ordered by transport number
+
+    The served rows are typed columns, this dict index is the reference the tests and benchmarks compare to."""
+    keys = sorted(json_data)
+    rows = [json_data[key] for key in keys]
+    match = {column: {} for column in MATCH_FILTERS.values()}
+    for row_id, row in enumerate(rows):
+        for column, postings in match.items():
+            postings.setdefault(row.get(column), []).append(row_id)
+    ranges = {}
+    for column in RANGE_COLUMNS:
+        if rows and column in rows[0]:
+            order = sorted(range(len(rows)), key=lambda row_id, col=column: rows[row_id][col])
+            ranges[column] = ([rows[row_id][column] for row_id in order], order)
+    return {'keys': keys, 'rows': rows, 'match': match, 'ranges': ranges}
+
+
+def has_query(params: dict) -> bool:
+    return any(param in params for param in QUERY_PARAMS)
+
+
+def parse_query(params: dict) -> Tuple[bool, dict]:
+    """Turn request parameters into a query, or an error message on invalid input"""
+    query = {'match': {}, 'ranges': {}, 'limit': DEFAULT_LIMIT,
+             'cursor': params.get('cursor') or None, 'fields': None}
+    try:
+        for param, column in MATCH_FILTERS.items():
+            if params.get(param):
+                query['match'][column] = params[param]
+        if params.get('date_from') or params.get('date_to'):
+            query['ranges']['from_date'] = (params.get('date_from') or None,
+                                            params.get('date_to') or None)
+        price_class = params.get('price_class') or 'economy'
+        if price_class not in PRICE_CLASSES:
+            raise ValueError(f'price_class must be one of {list(PRICE_CLASSES)}')
+        if params.get('min_price') or params.get('max_price'):
+            query['ranges'][PRICE_CLASSES[price_class]] = (
+                int(params['min_price']) if params.get('min_price') else None,
+                int(params['max_price']) if params.get('max_price') else None)
+        if params.get('limit'):
+            query['limit'] = int(params['limit'])
+        if not 1 <= query['limit'] <= MAX_LIMIT:
+            raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+        if params.get('fields'):
+            query['fields'] = [field for field in str(params['fields']).split(',') if field]
+    except ValueError as e:
+        return False, {'error': f'Invalid query - {e}'}
+    return True, query
+
+
+def get_range_bounds(index: dict, column: str, low, high) -> Optional[Tuple[int, int]]:
+    """Get the [start, end) positions of the values within [low, high] in the sorted column"""
+    if column not in index['ranges']:
+        return None
+    values = index['ranges'][column][0]
+    start = bisect_left(values, low) if low is not None else 0
+    end = bisect_right(values, high) if high is not None else len(values)
+    return start, end
+
+
+def get_candidates(index: dict, query: dict) -> Optional[List[int]]:
+    """Get the sorted row ids that can satisfy the query, None to scan every row"""
+    postings = sorted((index['match'].get(column, {}).get(value, [])
+                       for column, value in query['match'].items()), key=len)
+    if len(postings) == 1:
+        return postings[0]
+    if postings:
+        return sorted(set(postings[0]).intersection(*postings[1:]))
+
+    best, best_size = None, len(index['rows'])
+    for column, (low, high) in query['ranges'].items():
+        bounds = get_range_bounds(index, column, low, high)
+        if bounds is None:
+            continue
+        size = bounds[1] - bounds[0]
+        # Dense ranges are cheaper to scan in key order than to sort
+        if (size <= SLICE_THRESHOLD or size * 16 < len(index['rows'])) and size <= best_size:
+            best, best_size = (column, bounds[0], bounds[1]), size
+    if best is None:
+        return None
+    column, start, end = best
+    return sorted(index['ranges'][column][1][start:end])
+
+
+def row_matches(row: dict, query: dict) -> bool:
+    for column, value in query['match'].items():
+        if row.get(column) != value:
+            return False
+    for column, (low, high) in query['ranges'].items():
+        value = row.get(column)
+        if value is None or (low is not None and value < low) or (high is not None and value > high):
+            return False
+    return True
+
+
+def run_query(index: dict, query: dict) -> dict:
+    """Get one page of matching rows, projected to the requested fields"""
+    keys, rows = index['keys'], index['rows']
+    start = bisect_right(keys, query['cursor']) if query['cursor'] else 0
+    candidates = get_candidates(index, query)
+    if candidates is None:
+        row_ids = range(start, len(rows))
+    else:
+        row_ids = candidates[bisect_left(candidates, start):]
+
+    items = {}
+    last_id = None
+    for row_id in row_ids:
+        row = rows[row_id]
+        if not row_matches(row, query):
+            continue
+        if query['fields']:
+            row = {field: row[field] for field in query['fields'] if field in row}
+        items[keys[row_id]] = row
+        last_id = row_id
+        if len(items) == query['limit']:
+            break
+
+    next_cursor = keys[last_id] if len(items) == query['limit'] else None
+    return {'items': items, 'count': len(items), 'next_cursor': next_cursor}
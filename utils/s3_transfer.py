@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import math
+import mmap
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterator, Tuple, Union
+from botocore.exceptions import ClientError
+from common_vars import OBJECT_FOUND
+from common_funcs import get_object_from_s3
+
+# S3 rejects parts smaller than 5 MiB, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 16 * 1024 * 1024
+# upload_part_copy copies at most 5 GiB per part
+MAX_COPY_PART_SIZE = 5 * 1024 * 1024 * 1024
+# Parts in flight per transfer, memory use is about concurrency * part_size
+TRANSFER_CONCURRENCY = int(os.environ.get('TRANSFER_CONCURRENCY', '8'))
+
+
+class S3MultipartWriter:
+    """Binary file-like object uploading to S3 part by part as data is written, several parts at once"""
+
+    def __init__(self, bucket_name: str, object_name: str, s3_client, part_size: int = DEFAULT_PART_SIZE,
+                 concurrency: int = TRANSFER_CONCURRENCY, **put_args):
+        self.target = {'Bucket': bucket_name, 'Key': object_name}
+        self.s3_client = s3_client
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.put_args = put_args
+        self.buffer = bytearray()
+        self.upload = {'UploadId': None, 'Parts': [], 'Pending': [], 'Concurrency': max(1, concurrency)}
+        self.executor = ThreadPoolExecutor(max_workers=self.upload['Concurrency'])
+
+    @property
+    def closed(self) -> bool:
+        return self.executor is None
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            self.upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def send_part(self, part_number: int, body: bytes) -> dict:
+        response = self.s3_client.upload_part(**self.target, UploadId=self.upload['UploadId'],
+                                              PartNumber=part_number, Body=body)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def upload_part(self, body: bytes) -> None:
+        if self.upload['UploadId'] is None:
+            self.upload['UploadId'] = self.s3_client.create_multipart_upload(
+                **self.target, **self.put_args)['UploadId']
+        pending = self.upload['Pending']
+        # Wait for the oldest part once the pool is busy, so at most concurrency parts sit in memory
+        if len(pending) >= self.upload['Concurrency']:
+            self.upload['Parts'].append(pending.pop(0).result())
+        part_number = len(self.upload['Parts']) + len(pending) + 1
+        pending.append(self.executor.submit(self.send_part, part_number, body))
+
+    def tell(self) -> int:
+        # Every part but the last one is exactly part_size
+        return (len(self.upload['Parts']) + len(self.upload['Pending'])) * self.part_size + len(self.buffer)
+
+    def flush(self) -> None:
+        """Parts are only sent once full, the rest goes out on close"""
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self.upload['UploadId'] is None:
+                # Small objects never fill a part, a single put is cheaper
+                self.s3_client.put_object(**self.target, Body=bytes(self.buffer), **self.put_args)
+                return
+            if self.buffer:
+                self.upload_part(bytes(self.buffer))
+            self.buffer = bytearray()
+            self.upload['Parts'] += [future.result() for future in self.upload['Pending']]
+            self.upload['Pending'] = []
+            self.s3_client.complete_multipart_upload(**self.target, UploadId=self.upload['UploadId'],
+                                                     MultipartUpload={'Parts': self.upload['Parts']})
+        except Exception:
+            if self.upload['UploadId'] is not None:
+                self.s3_client.abort_multipart_upload(**self.target, UploadId=self.upload['UploadId'])
+            raise
+        finally:
+            self.executor.shutdown()
+            self.executor = None
+
+    def abort(self) -> None:
+        if self.closed:
+            return
+        for future in self.upload['Pending']:
+            future.cancel()
+        self.executor.shutdown()
+        self.executor = None
+        if self.upload['UploadId'] is not None:
+            self.s3_client.abort_multipart_upload(**self.target, UploadId=self.upload['UploadId'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def upload_stream(bucket_name: str, object_name: str, stream, s3_client, part_size: int = DEFAULT_PART_SIZE,
+                  concurrency: int = TRANSFER_CONCURRENCY, **put_args) -> int:
+    """Upload a binary file-like object with a parallel multipart upload, return the bytes sent"""
+    with S3MultipartWriter(bucket_name, object_name, s3_client, part_size, concurrency, **put_args) as writer:
+        for chunk in iter(lambda: stream.read(writer.part_size), b''):
+            writer.write(chunk)
+        return writer.tell()
+
+
+def get_range(bucket_name: str, object_name: str, s3_client, start: int, end: int, etag: str) -> bytes:
+    # IfMatch makes every range come from the same version of the object
+    return s3_client.get_object(Bucket=bucket_name, Key=object_name, Range=f'bytes={start}-{end}',
+                                IfMatch=etag)['Body'].read()
+
+
+def get_first_range(bucket_name: str, object_name: str, s3_client, part_size: int) -> Tuple[str, bytes, int, str]:
+    """Get the first part, its Content-Range gives the object size without a head_object"""
+    try:
+        status, response = get_object_from_s3(bucket_name, object_name, s3_client, byte_range=(0, part_size - 1))
+    except ClientError as e:
+        # An empty object has no byte 0 to start the range at
+        if e.response['Error']['Code'] == 'InvalidRange':
+            return OBJECT_FOUND, b'', 0, ''
+        raise
+    if status != OBJECT_FOUND:
+        return status, b'', 0, ''
+    body = response['Body'].read()
+    content_range = response.get('ContentRange')
+    size = int(content_range.rsplit('/', 1)[1]) if content_range else len(body)
+    return status, body, size, response['ETag']
+
+
+def iter_ranges(bucket_name: str, object_name: str, s3_client, part_size: int = DEFAULT_PART_SIZE,
+                concurrency: int = TRANSFER_CONCURRENCY) -> Iterator[bytes]:
+    """Stream an object in order while the next ranges are fetched in parallel, nothing if it does not exist"""
+    status, body, size, etag = get_first_range(bucket_name, object_name, s3_client, part_size)
+    if status != OBJECT_FOUND:
+        return
+    yield body
+    starts = iter(range(part_size, size, part_size))
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        pending = [executor.submit(get_range, bucket_name, object_name, s3_client, start,
+                                   min(start + part_size, size) - 1, etag)
+                   for start in islice(starts, max(1, concurrency))]
+        while pending:
+            chunk = pending.pop(0).result()
+            start = next(starts, None)
+            if start is not None:
+                pending.append(executor.submit(get_range, bucket_name, object_name, s3_client, start,
+                                               min(start + part_size, size) - 1, etag))
+            yield chunk
+
+
+def download_to_mmap(bucket_name: str, object_name: str, s3_client, part_size: int = DEFAULT_PART_SIZE,
+                     concurrency: int = TRANSFER_CONCURRENCY) -> Tuple[str, Union[bytes, mmap.mmap]]:
+    """Download the ranges in parallel into an unlinked temp file and map it, instead of one big bytes object"""
+    status, body, size, etag = get_first_range(bucket_name, object_name, s3_client, part_size)
+    if status != OBJECT_FOUND or size <= len(body):
+        return status, body
+    with tempfile.TemporaryFile() as temp_file:
+        temp_file.truncate(size)
+        fd = temp_file.fileno()
+        os.pwrite(fd, body, 0)
+
+        def write_range(start: int) -> None:
+            os.pwrite(fd, get_range(bucket_name, object_name, s3_client, start,
+                                    min(start + part_size, size) - 1, etag), start)
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            list(executor.map(write_range, range(part_size, size, part_size)))
+        # The mapping keeps the pages alive after the file is closed
+        return status, mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+
+
+def replace_tail(bucket_name: str, object_name: str, s3_client, keep: int, data: bytes, etag: str,
+                 **put_args) -> None:
+    """Rewrite an object as its first keep bytes followed by data, the kept bytes are copied inside S3
+
+    Only data goes over the network, keep must be at least MIN_PART_SIZE like every part but the last one."""
+    target = {'Bucket': bucket_name, 'Key': object_name}
+    upload_id = s3_client.create_multipart_upload(**target, **put_args)['UploadId']
+    try:
+        # Equal copy parts, so none of them falls under MIN_PART_SIZE
+        copy_size = math.ceil(keep / math.ceil(keep / MAX_COPY_PART_SIZE))
+        parts = []
+        for part_number, start in enumerate(range(0, keep, copy_size), 1):
+            response = s3_client.upload_part_copy(
+                **target, UploadId=upload_id, PartNumber=part_number, CopySource=target,
+                CopySourceRange=f'bytes={start}-{min(start + copy_size, keep) - 1}', CopySourceIfMatch=etag)
+            parts.append({'PartNumber': part_number, 'ETag': response['CopyPartResult']['ETag']})
+        response = s3_client.upload_part(**target, UploadId=upload_id, PartNumber=len(parts) + 1, Body=data)
+        parts.append({'PartNumber': len(parts) + 1, 'ETag': response['ETag']})
+        s3_client.complete_multipart_upload(**target, UploadId=upload_id, MultipartUpload={'Parts': parts})
+    except Exception:
+        s3_client.abort_multipart_upload(**target, UploadId=upload_id)
+        raise
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from query_data import row_matches
+
+# Lookups precomputed at generation time: dimension -> columns joined into the indexed value
+INDEX_DIMENSIONS = {'route': ['from_city', 'to_city'], 'from_country': ['from_Country'], 'date': ['from_date']}
+INDEX_COLUMNS = ['from_city', 'to_city', 'from_Country', 'from_date']
+# The postings of a dimension are spread over this many objects by a hash of the value
+INDEX_BUCKETS = 64
+# Consecutive rows per row file, a row id gives the file and the position in it
+ROW_FILE_ROWS = 2000
+ROW_FETCH_WORKERS = 8
+
+
+def index_value(values: List[str]) -> str:
+    """Get the indexed value of a dimension from its column values, 'London|Paris' for a route"""
+    return '|'.join(str(value) for value in values)
+
+
+def value_bucket(value: str, buckets: int = INDEX_BUCKETS) -> int:
+    return zlib.crc32(value.encode('utf-8')) % buckets
+
+
+def postings_name(segment: int, dimension: str, bucket: int) -> str:
+    """Name of a postings object ({value: [row ids]}) relative to {type}/index/"""
+    return f'{segment:05d}/{dimension}-{bucket:03d}.json'
+
+
+def rows_name(segment: int, row_file: int) -> str:
+    """Name of a row file (records layout) relative to {type}/index/"""
+    return f'{segment:05d}/rows-{row_file:05d}.json'
+
+
+def get_lookups(query: dict) -> List[Tuple[str, str]]:
+    """Get the (dimension, value) lookups narrowing a parsed query down, none if it needs every row"""
+    match = query['match']
+    lookups = []
+    if match.get('from_city') and match.get('to_city'):
+        lookups.append(('route', index_value([match['from_city'], match['to_city']])))
+    if match.get('from_Country'):
+        lookups.append(('from_country', match['from_Country']))
+    low, high = query['ranges'].get('from_date', (None, None))
+    if low is not None and low == high:
+        lookups.append(('date', low))
+    return lookups
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Get the (segment, row id) after which an index query resumes, None for a cursor of the full scan"""
+    if not cursor:
+        return 0, -1
+    segment, _, row_id = cursor.partition(':')
+    if not (segment.isdigit() and row_id.isdigit()):
+        return None
+    return int(segment), int(row_id)
+
+
+def get_segment_candidates(manifest: dict, segment: int, lookups: List[Tuple[str, str]],
+                           fetch: Callable[[str], Optional[dict]]) -> List[int]:
+    """Intersect the postings of every lookup in one segment, in row id order"""
+    row_ids = None
+    for dimension, value in lookups:
+        postings = fetch(postings_name(segment, dimension, value_bucket(value, manifest['index_buckets']))) or {}
+        found = set(postings.get(value, []))
+        row_ids = found if row_ids is None else row_ids & found
+    return sorted(row_ids or [])
+
+
+def get_rows(manifest: dict, segment: int, row_ids: List[int],
+             fetch: Callable[[str], Optional[dict]]) -> Optional[Dict[int, list]]:
+    """Fetch the row files holding the row ids in parallel, only those files are read
+
+    None when one of them is missing, an index left stale by a removal or an append cannot answer."""
+    row_file_rows = manifest['row_file_rows']
+    names = sorted({rows_name(segment, row_id // row_file_rows) for row_id in row_ids})
+    with ThreadPoolExecutor(max_workers=min(ROW_FETCH_WORKERS, len(names) or 1)) as executor:
+        row_files = dict(zip(names, executor.map(fetch, names)))
+    if any(row_file is None for row_file in row_files.values()):
+        return None
+    return {row_id: row_files[rows_name(segment, row_id // row_file_rows)]['data'][row_id % row_file_rows]
+            for row_id in row_ids}
+
+
+def run_index_query(manifest: dict, query: dict, fetch: Callable[[str], Optional[dict]]) -> Optional[dict]:
+    """Answer a parsed query from the index objects, fetching only the postings of the values and the rows they point to
+
+    fetch gets a parsed object by its name under {type}/index/. Pages are in (segment, row id) order,
+    None when the query has no indexed lookup or a row file is missing, and has to run on the whole dataset."""
+    lookups = get_lookups(query)
+    start = parse_cursor(query['cursor'])
+    if not lookups or start is None:
+        return None
+    items = {}
+    for segment in manifest['segments']:
+        number = segment['segment']
+        candidates = [row_id for row_id in get_segment_candidates(manifest, number, lookups, fetch)
+                      if (number, row_id) > start]
+        # A page worth of candidates at a time, the other filters may drop some of them
+        for window in range(0, len(candidates), query['limit']):
+            rows = get_rows(manifest, number, candidates[window:window + query['limit']], fetch)
+            if rows is None:
+                return None
+            for row_id, values in rows.items():
+                row = dict(zip(segment['columns'][1:], values[1:]))
+                if not row_matches(row, query):
+                    continue
+                if query['fields']:
+                    row = {field: row[field] for field in query['fields'] if field in row}
+                items[values[0]] = row
+                if len(items) == query['limit']:
+                    return {'items': items, 'count': len(items), 'next_cursor': f'{number}:{row_id}'}
+    return {'items': items, 'count': len(items), 'next_cursor': None}
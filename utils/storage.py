@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import io
+import mmap
+from abc import ABC, abstractmethod
+import os
+import threading
+import time
+from itertools import count
+from typing import Optional, Tuple, Union
+from botocore.exceptions import ClientError
+from common_vars import DATA_DIRECTORY, INDEX_DIRECTORY, OBJECT_FOUND, OBJECT_NOT_FOUND, OBJECT_NOT_MODIFIED
+from common_funcs import get_object_from_s3, write_object_to_s3, delete_object_from_s3, get_s3_client, \
+    transport_in_list
+from compressed_io import decompress_bytes
+from json_layout import from_layout, loads
+from s3_transfer import S3MultipartWriter, download_to_mmap
+
+
+class Storage(ABC):
+    """Objects of the datasets by name ('flights.json', 'flights/manifest.json', ...), wherever they are kept
+
+    get is the read primitive every other read goes through: it takes the version of a copy the caller already
+    has (S3 ETag, file mtime and size, memory counter) and returns OBJECT_NOT_MODIFIED instead of the body.
+    A backend implements get, put, size and delete, the other methods are built on them."""
+    where = 'in storage'
+
+    @abstractmethod
+    def get(self, name: str, version: Optional[str] = None) -> Tuple[str, Optional[bytes], Optional[str]]:
+        """Get the status, body and version of an object, no body when it matches the given version"""
+
+    @abstractmethod
+    def put(self, name: str, body: bytes, **put_args) -> None:
+        """Store a whole object under name"""
+
+    @abstractmethod
+    def size(self, name: str) -> Optional[int]:
+        """Get the size of an object in bytes, None if it does not exist"""
+
+    @abstractmethod
+    def delete(self, name: str) -> None:
+        """Delete an object, a missing one is not an error"""
+
+    def read(self, name: str) -> Optional[bytes]:
+        status, body, _ = self.get(name)
+        return body if status == OBJECT_FOUND else None
+
+    def read_json(self, name: str):
+        """Get a parsed json object, decompressing a gzip or zstd body, None if it does not exist"""
+        body = self.read(name)
+        return None if body is None else loads(decompress_bytes(body))
+
+    def open(self, name: str):
+        """Get a binary file-like object to stream the object from, None if it does not exist"""
+        body = self.read(name)
+        return None if body is None else io.BytesIO(body)
+
+    def map(self, name: str) -> Optional[Union[bytes, mmap.mmap]]:
+        """Get the whole object as a buffer for random access (columnar files), None if it does not exist"""
+        return self.read(name)
+
+    def writer(self, name: str, **put_args):
+        """Get a binary file-like object storing what is written under name when it is closed"""
+        return StorageWriter(self, name, put_args)
+
+    def exists(self, name: str) -> bool:
+        return self.size(name) is not None
+
+
+class StorageWriter(io.BytesIO):
+    """Buffer the written bytes and put them in one go on close"""
+
+    def __init__(self, storage: Storage, name: str, put_args: dict):
+        super().__init__()
+        self.target = (storage, name, put_args)
+
+    def close(self) -> None:
+        if not self.closed:
+            storage, name, put_args = self.target
+            storage.put(name, self.getvalue(), **put_args)
+        super().close()
+
+
+class ReplacingFileWriter(io.BufferedWriter):
+    """Write a temporary file next to the target and move it over the target on close
+
+    Readers of the target, memory mappings included, keep the old file until they reopen it and never see a
+    truncated or half-written one. The temporary file is dropped when the with block raises."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.temp_path = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+        super().__init__(io.FileIO(self.temp_path, 'wb'))
+
+    def close(self) -> None:
+        if not self.closed:
+            super().close()
+            os.replace(self.temp_path, self.path)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        elif not self.closed:
+            super().close()
+            os.remove(self.temp_path)
+
+
+class LocalStorage(Storage):
+    """Files under DATA_DIRECTORY, versioned by mtime and size, columnar files are memory-mapped"""
+    where = 'locally'
+
+    def __init__(self, root: str = DATA_DIRECTORY):
+        self.root = root
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def get(self, name: str, version: Optional[str] = None) -> Tuple[str, Optional[bytes], Optional[str]]:
+        try:
+            stat = os.stat(self.path(name))
+        except FileNotFoundError:
+            return OBJECT_NOT_FOUND, None, None
+        current = f'{stat.st_mtime_ns}-{stat.st_size}'
+        if current == version:
+            return OBJECT_NOT_MODIFIED, None, version
+        with open(self.path(name), 'rb') as local_file:
+            return OBJECT_FOUND, local_file.read(), current
+
+    def open(self, name: str):
+        return open(self.path(name), 'rb') if os.path.exists(self.path(name)) else None
+
+    def map(self, name: str) -> Optional[Union[bytes, mmap.mmap]]:
+        """Map the file read-only, its pages are read on access and shared with every other reader"""
+        if not os.path.exists(self.path(name)):
+            return None
+        with open(self.path(name), 'rb') as local_file:
+            if os.fstat(local_file.fileno()).st_size == 0:
+                # An empty file cannot be mapped
+                return b''
+            # The mapping stays valid after the file is closed
+            return mmap.mmap(local_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def put(self, name: str, body: bytes, **put_args) -> None:
+        with self.writer(name) as local_file:
+            local_file.write(body)
+
+    def writer(self, name: str, **put_args):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        return ReplacingFileWriter(self.path(name))
+
+    def size(self, name: str) -> Optional[int]:
+        return os.path.getsize(self.path(name)) if os.path.exists(self.path(name)) else None
+
+    def delete(self, name: str) -> None:
+        if os.path.exists(self.path(name)):
+            os.remove(self.path(name))
+
+
+class S3Storage(Storage):
+    """Objects of a bucket, versioned by ETag, large objects are written and mapped part by part in parallel"""
+    where = 'in S3'
+
+    def __init__(self, bucket: str, s3_client):
+        self.bucket = bucket
+        self.s3_client = s3_client
+
+    def get(self, name: str, version: Optional[str] = None) -> Tuple[str, Optional[bytes], Optional[str]]:
+        status, response = get_object_from_s3(self.bucket, name, self.s3_client, if_none_match=version)
+        if status != OBJECT_FOUND:
+            return status, None, version if status == OBJECT_NOT_MODIFIED else None
+        return status, response['Body'].read(), response['ETag']
+
+    def open(self, name: str):
+        status, response = get_object_from_s3(self.bucket, name, self.s3_client)
+        return response['Body'] if status == OBJECT_FOUND else None
+
+    def map(self, name: str) -> Optional[Union[bytes, mmap.mmap]]:
+        status, body = download_to_mmap(self.bucket, name, self.s3_client)
+        return body if status == OBJECT_FOUND else None
+
+    def put(self, name: str, body: bytes, **put_args) -> None:
+        write_object_to_s3(self.bucket, name, body, self.s3_client, **put_args)
+
+    def writer(self, name: str, **put_args):
+        return S3MultipartWriter(self.bucket, name, self.s3_client, **put_args)
+
+    def size(self, name: str) -> Optional[int]:
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket, Key=name)['ContentLength']
+        except ClientError:
+            return None
+
+    def delete(self, name: str) -> None:
+        delete_object_from_s3(self.bucket, name, self.s3_client)
+
+
+class MemoryStorage(Storage):
+    """Objects in a dict of the process, for tests and for benchmarks without disk or network"""
+    where = 'in memory'
+
+    def __init__(self):
+        self.objects = {}
+        self.versions = count(1)
+
+    def get(self, name: str, version: Optional[str] = None) -> Tuple[str, Optional[bytes], Optional[str]]:
+        if name not in self.objects:
+            return OBJECT_NOT_FOUND, None, None
+        current, body = self.objects[name]
+        if current == version:
+            return OBJECT_NOT_MODIFIED, None, version
+        return OBJECT_FOUND, body, current
+
+    def put(self, name: str, body: bytes, **put_args) -> None:
+        self.objects[name] = (str(next(self.versions)), bytes(body))
+
+    def size(self, name: str) -> Optional[int]:
+        return len(self.objects[name][1]) if name in self.objects else None
+
+    def delete(self, name: str) -> None:
+        self.objects.pop(name, None)
+
+
+class CachedStorage(Storage):
+    """Read-through cache in front of another storage, a cached copy is revalidated by version after ttl seconds
+
+    Callers can keep what they derive from a body (parsed rows, indexes) in its entry, the entry is
+    replaced as soon as the object changes. A caller keeping a decoded copy can set 'raw' to None."""
+
+    def __init__(self, backend: Storage, ttl: float = 0.0, stats: Optional[dict] = None):
+        self.backend = backend
+        self.where = backend.where
+        self.ttl = ttl
+        self.entries = {}
+        self.stats = stats if stats is not None else {'hits': 0, 'misses': 0, 'revalidations': 0}
+
+    def entry(self, name: str) -> Optional[dict]:
+        cached = self.entries.get(name)
+        now = time.monotonic()
+        if cached and now - cached['checked'] < self.ttl:
+            self.stats['hits'] += 1
+            return cached
+        status, body, version = self.backend.get(name, cached['version'] if cached else None)
+        if status == OBJECT_NOT_MODIFIED:
+            self.stats['revalidations'] += 1
+            cached['checked'] = now
+            return cached
+        if status == OBJECT_NOT_FOUND:
+            self.entries.pop(name, None)
+            return None
+        self.stats['misses'] += 1
+        self.entries[name] = {'version': version, 'raw': body, 'checked': now}
+        return self.entries[name]
+
+    def get(self, name: str, version: Optional[str] = None) -> Tuple[str, Optional[bytes], Optional[str]]:
+        entry = self.entry(name)
+        if entry is None:
+            return OBJECT_NOT_FOUND, None, None
+        if entry['version'] == version:
+            return OBJECT_NOT_MODIFIED, None, version
+        return OBJECT_FOUND, self.raw(name, entry), entry['version']
+
+    def raw(self, name: str, entry: dict) -> bytes:
+        return self.backend.read(name) if entry['raw'] is None else entry['raw']
+
+    def read_json(self, name: str):
+        """Get a parsed json object, parsed once per version"""
+        entry = self.entry(name)
+        if entry is None:
+            return None
+        if 'json' not in entry:
+            entry['json'] = loads(decompress_bytes(self.raw(name, entry)))
+        return entry['json']
+
+    def put(self, name: str, body: bytes, **put_args) -> None:
+        self.entries.pop(name, None)
+        self.backend.put(name, body, **put_args)
+
+    def writer(self, name: str, **put_args):
+        self.entries.pop(name, None)
+        return self.backend.writer(name, **put_args)
+
+    def size(self, name: str) -> Optional[int]:
+        return self.backend.size(name)
+
+    def delete(self, name: str) -> None:
+        self.entries.pop(name, None)
+        self.backend.delete(name)
+
+
+def get_storage(on_aws: bool, bucket: str, s3_client) -> Storage:
+    """Get the storage the on_aws flag of the command lines points to"""
+    return S3Storage(bucket, s3_client) if on_aws else LocalStorage()
+
+
+def read_json_object(object_name: str, on_aws: bool, bucket: str, s3_client) -> Optional[dict]:
+    """Read a parsed json object from S3 or DATA_DIRECTORY, None if it does not exist"""
+    return get_storage(on_aws, bucket, s3_client).read_json(object_name)
+
+
+def read_index_object(transportation_type: str, name: str, on_aws: bool, bucket: str, s3_client) -> Optional[dict]:
+    """Read a parsed object under {type}/index/ from S3 or DATA_DIRECTORY, None if it does not exist"""
+    return read_json_object(f'{transportation_type}/{INDEX_DIRECTORY}/{name}', on_aws, bucket, s3_client)
+
+
+def get_object_size(object_name: str, on_aws: bool, bucket: str, s3_client) -> Optional[int]:
+    """Get the size of an object on S3 (a HEAD request) or under DATA_DIRECTORY, None if it does not exist"""
+    return get_storage(on_aws, bucket, s3_client).size(object_name)
+
+
+def get_json_data(transportation_type: str, aws_profile: str, s3_client,
+                  on_aws: bool, bucket: str, verboseprint, log, logger) -> Tuple[bool, dict]:
+
+    json_data = {}
+    try:
+        if not transport_in_list:
+            return False, json_data
+        if on_aws and s3_client is None:
+            s3_client = get_s3_client(aws_profile)
+        storage = get_storage(on_aws, bucket, s3_client)
+        body = storage.read(f'{transportation_type}.json')
+        if body is None:
+            return False, json_data
+        verboseprint(f'Object {transportation_type}.json exists {storage.where}, retrieving...')
+        log(f'Object {transportation_type}.json exists {storage.where}, retrieving...', 'INFO', logger)
+        json_data = from_layout(loads(decompress_bytes(body)))
+        verboseprint(json_data)
+        return True, json_data
+    except Exception as e:
+        verboseprint(f'Error in get_json_data() - {e}')
+        log(f'Error in get_json_data() - {e}', 'ERROR', logger)
+        return False, json_data
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from bisect import bisect_left, bisect_right
+from typing import Tuple
+
+# Group columns of each precomputed summary, the groups are stored sorted by them
+SUMMARY_DIMENSIONS = {'route': ['from_city', 'to_city'], 'country': ['from_Country'], 'date': ['from_date']}
+# Price name in the responses -> dataset column
+SUMMARY_PRICES = {'economy': 'economy', 'business': 'eusiness', 'first_class': 'first_class'}
+SUMMARY_STATS = ['min', 'mean', 'max']
+# Query parameter -> position of the group column it matches exactly
+SUMMARY_FILTERS = {'route': {'from_city': 0, 'to_city': 1}, 'country': {'from_country': 0}, 'date': {}}
+DEFAULT_GROUPS = 100
+MAX_GROUPS = 1000
+
+
+def summary_columns(dimension: str) -> list:
+    """Columns of a summary row: the group columns, the row count and min/mean/max of every price"""
+    return SUMMARY_DIMENSIONS[dimension] + ['count'] + [f'{price}_{stat}' for price in SUMMARY_PRICES
+                                                        for stat in SUMMARY_STATS]
+
+
+def has_summary_query(params: dict) -> bool:
+    return 'group_by' in params
+
+
+def parse_summary_query(params: dict) -> Tuple[bool, dict]:
+    """Turn request parameters into a summary query, or an error message on invalid input"""
+    dimension = params.get('group_by')
+    if dimension not in SUMMARY_DIMENSIONS:
+        return False, {'error': f'Invalid query - group_by must be one of {list(SUMMARY_DIMENSIONS)}'}
+    query = {'group_by': dimension, 'match': {}, 'range': (params.get('date_from') or None,
+                                                          params.get('date_to') or None),
+             'sort': params.get('sort') or None, 'limit': DEFAULT_GROUPS}
+    try:
+        for param in ('from_city', 'to_city', 'from_country'):
+            if params.get(param):
+                if param not in SUMMARY_FILTERS[dimension]:
+                    raise ValueError(f'{param} does not apply to group_by={dimension}')
+                query['match'][SUMMARY_FILTERS[dimension][param]] = params[param]
+        if query['range'] != (None, None) and dimension != 'date':
+            raise ValueError('date_from and date_to only apply to group_by=date')
+        if query['sort'] and query['sort'].lstrip('-') not in summary_columns(dimension):
+            raise ValueError(f'sort must be one of {summary_columns(dimension)}, - first for descending')
+        if params.get('limit'):
+            query['limit'] = int(params['limit'])
+        if not 1 <= query['limit'] <= MAX_GROUPS:
+            raise ValueError(f'limit must be between 1 and {MAX_GROUPS}')
+    except ValueError as e:
+        return False, {'error': f'Invalid query - {e}'}
+    return True, query
+
+
+def get_group_bounds(summary: dict, query: dict) -> Tuple[int, int]:
+    """Get the [start, end) positions of the groups whose first column matches, the groups being sorted by it"""
+    if 'first' not in summary:
+        # Built once per loaded summary, like the query index
+        summary['first'] = [row[0] for row in summary['data']]
+    first = summary['first']
+    low, high = query['match'].get(0), query['match'].get(0)
+    if query['group_by'] == 'date':
+        low, high = query['range']
+    start = bisect_left(first, low) if low is not None else 0
+    end = bisect_right(first, high) if high is not None else len(first)
+    return start, end
+
+
+def run_summary_query(summary: dict, query: dict) -> dict:
+    """Get the groups matching the filters, sorted by a statistic when asked, as records"""
+    start, end = get_group_bounds(summary, query)
+    rows = [row for row in summary['data'][start:end]
+            if all(row[position] == value for position, value in query['match'].items())]
+    if query['sort']:
+        position = summary['columns'].index(query['sort'].lstrip('-'))
+        rows.sort(key=lambda row: row[position], reverse=query['sort'].startswith('-'))
+    return {'group_by': query['group_by'], 'rows': summary['rows'], 'groups': len(rows),
+            'columns': summary['columns'], 'data': rows[:query['limit']]}
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import re
+import sys
+from typing import Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from common_vars import COLUMNAR_FORMATS
+from common_funcs import get_verbose_logger, get_verbose, get_transportation_type, get_on_aws, get_aws_profile, get_bucket, \
+    get_s3_client, get_logger
+from compressed_io import open_decompressed
+from storage import Storage, get_storage
+from get_data import read_manifest
+
+KEY_CHUNK_ROWS = 500000
+JSON_CHUNK_BYTES = 1024 * 1024
+# Keys of an orient='index' json ("F000001":{...) and rows of a records json (["F000001",...)
+JSON_KEY_PATTERN = re.compile(rb'(?:"[A-Z](\d+)":\{|\["[A-Z](\d+)",)')
+# Longer than any key match, a match starting in the last bytes of a chunk is looked for again with the next one
+JSON_KEY_OVERLAP = 64
+DUPLICATE_EXAMPLES = 10
+
+
+def mark_keys(bitmap: np.ndarray, numbers: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Set the bits of the key numbers in the bitmap, growing it as needed, and get the numbers that were set already
+
+    One bit per possible key number: 125KB for the 1M 6 digit keys, whatever the number of rows."""
+    if numbers.size == 0:
+        return bitmap, numbers
+    size = int(numbers.max()) // 8 + 1
+    if size > bitmap.size:
+        bitmap = np.concatenate([bitmap, np.zeros(size - bitmap.size, dtype=np.uint8)])
+    bytes_index, bits = numbers >> 3, (1 << (numbers & 7)).astype(np.uint8)
+    _, first = np.unique(numbers, return_index=True)
+    repeated = np.ones(numbers.size, dtype=bool)
+    repeated[first] = False
+    # Set before this chunk, or seen earlier in the same chunk
+    duplicates = numbers[((bitmap[bytes_index] & bits) != 0) | repeated]
+    np.bitwise_or.at(bitmap, bytes_index, bits)
+    return bitmap, duplicates
+
+
+def iter_csv_numbers(raw, type_number: str) -> Iterator[np.ndarray]:
+    """Read only the key column of a plain, gzip or zstd csv, a chunk of key numbers at a time"""
+    with pd.read_csv(open_decompressed(raw), usecols=[type_number], dtype=str, chunksize=KEY_CHUNK_ROWS) as reader:
+        for chunk in reader:
+            yield chunk[type_number].str[1:].astype('int64').to_numpy()
+
+
+def iter_columnar_numbers(source, file_format: str, type_number: str) -> Iterator[np.ndarray]:
+    """Read only the key column of a parquet/feather file, a record batch at a time"""
+    if file_format == 'parquet':
+        batches = pq.ParquetFile(source).iter_batches(batch_size=KEY_CHUNK_ROWS, columns=[type_number])
+    else:
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(index) for index in range(reader.num_record_batches))
+    for batch in batches:
+        yield batch.column(type_number).to_pandas().str[1:].astype('int64').to_numpy()
+
+
+def iter_json_numbers(raw) -> Iterator[np.ndarray]:
+    """Scan the keys of an index or records json as text, a chunk of bytes at a time
+
+    json.loads would keep only the last row of a duplicate key, the text still has all of them."""
+    stream = open_decompressed(raw)
+    carry = b''
+    while True:
+        chunk = stream.read(JSON_CHUNK_BYTES)
+        text = carry + chunk
+        boundary = len(text) - JSON_KEY_OVERLAP if chunk else len(text)
+        yield np.array([int(match.group(1) or match.group(2)) for match in JSON_KEY_PATTERN.finditer(text)
+                        if match.start() < boundary], dtype=np.int64)
+        if not chunk:
+            return
+        carry = text[max(boundary, 0):]
+
+
+def count_duplicates(chunks: Iterable[np.ndarray], bitmap: Optional[np.ndarray] = None) -> Tuple[np.ndarray, dict]:
+    """Run the key numbers of one file through the bitmap and count the rows and duplicate keys"""
+    bitmap = np.zeros(0, dtype=np.uint8) if bitmap is None else bitmap
+    rows, duplicates, examples = 0, 0, []
+    for numbers in chunks:
+        bitmap, repeated = mark_keys(bitmap, numbers)
+        rows += numbers.size
+        duplicates += repeated.size
+        examples += repeated[:DUPLICATE_EXAMPLES - len(examples)].tolist()
+    return bitmap, {'rows': rows, 'duplicates': duplicates, 'examples': examples}
+
+
+def open_source(object_name: str, storage: Storage, file_format: str):
+    """Open a file of the dataset for reading, None if it does not exist"""
+    if file_format in COLUMNAR_FORMATS:
+        # Columnar readers seek to the footer and column chunks
+        body = storage.map(object_name)
+        return None if body is None else pa.BufferReader(body)
+    return storage.open(object_name)
+
+
+def iter_numbers(source, file_format: str, type_number: str) -> Iterator[np.ndarray]:
+    if file_format == 'csv':
+        return iter_csv_numbers(source, type_number)
+    if file_format == 'json':
+        return iter_json_numbers(source)
+    return iter_columnar_numbers(source, file_format, type_number)
+
+
+def list_key_files(transportation_type: str, manifest: Optional[dict]) -> List[Tuple[str, str, bool]]:
+    """Get the (name, format, shares the dataset bitmap) of the files that may hold the dataset keys
+
+    The csv and its appended or sharded csv parts share one bitmap, as they are read back as one dataset."""
+    files = [(f'{transportation_type}.{file_format}', file_format, file_format == 'csv')
+             for file_format in ['csv', 'json'] + COLUMNAR_FORMATS
+             if manifest is None or manifest.get('base') or file_format == 'json']
+    return files + [(f'{transportation_type}/{part["file"]}', 'csv', True)
+                    for part in (manifest or {}).get('parts', []) if part['format'] == 'csv']
+
+
+def validate_keys(transportation_type: str, aws_profile: str, on_aws: bool, bucket: str,
+                  verboseprint, log, logger) -> Tuple[bool, List[dict]]:
+    """Report the duplicate keys of every file of a dataset, streaming only the key column through a bitmap"""
+    storage = get_storage(on_aws, bucket, get_s3_client(aws_profile) if on_aws else None)
+    dataset_bitmap = np.zeros(0, dtype=np.uint8)
+    reports = []
+    for object_name, file_format, shared in list_key_files(
+            transportation_type, read_manifest(transportation_type, storage)):
+        source = open_source(object_name, storage, file_format)
+        if source is None:
+            continue
+        verboseprint(f'Checking the keys of {object_name}...')
+        log(f'Checking the keys of {object_name}...', 'INFO', logger)
+        try:
+            checked = count_duplicates(iter_numbers(source, file_format, f'{transportation_type}_number'),
+                                       dataset_bitmap if shared else None)
+        finally:
+            source.close()
+        if shared:
+            dataset_bitmap = checked[0]
+        reports.append(dict(checked[1], file=object_name))
+    return all(report['duplicates'] == 0 for report in reports), reports
+
+
+def main():
+    global verboseprint
+    global log
+    global logger
+    (transportation_type,
+     aws_profile,
+     on_aws,
+     bucket,
+     verbose,
+     logger) = check_args(sys.argv[1:])
+
+    verboseprint, log, logger = get_verbose_logger(verbose, logger)
+
+    verboseprint((f' transportation_type: {transportation_type}\n'
+                  f' aws_profile: {aws_profile}\n'
+                  f' on_aws: {on_aws}\n'
+                  f' bucket: {bucket}\n'
+                  f' verbose: {verbose}\n'
+                  f'logger: {logger}'))
+    valid = True
+    for ttype in transportation_type:
+        unique, reports = validate_keys(ttype, aws_profile, on_aws, bucket, verboseprint, log, logger)
+        for report in reports:
+            print(f'{report["file"]}: {report["rows"]} rows, {report["duplicates"]} duplicate keys'
+                  + (f' e.g. {report["examples"]}' if report['examples'] else ''))
+        if not unique:
+            log(f'Duplicate keys in {ttype}', 'ERROR', logger)
+        valid = valid and unique
+    return valid
+
+
+def check_args(args=None) -> Tuple[str, str, bool, str, bool, bool]:
+    """Get command line arguments"""
+    parser = argparse.ArgumentParser(description="Report duplicate keys in the dataset files")
+
+    get_transportation_type(parser)
+    get_aws_profile(parser)
+    get_on_aws(parser)
+    get_bucket(parser)
+    get_verbose(parser)
+    get_logger(parser)
+
+    cmd_line_args = parser.parse_args(args)
+    return (cmd_line_args.transportation_type,
+            cmd_line_args.aws_profile,
+            cmd_line_args.on_aws,
+            cmd_line_args.bucket,
+            cmd_line_args.verbose,
+            cmd_line_args.logger
+            )
+
+
+if __name__ == '__main__':
+    main()
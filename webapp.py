@@ -1,20 +1,43 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# Run this app with `python app.py` and
+# Run this app with `python webapp.py` (or `gunicorn webapp:server`, see gunicorn.conf.py) and
 # visit http://127.0.0.1:5000/ in your web browser.
-import json
-# import os
-from flask import Flask
+import gzip
+import hashlib
+import os
+from typing import Optional
+from flask import Flask, Response, request
 from dotenv import load_dotenv
-from common_vars import FLIGHTS, BUS, TRAIN
-# from generate_csv_data import generate_csv_data
-# from get_data import get_json_data
-from common_funcs import get_verbose_logger
+from common_vars import transportation_type_list, MANIFEST_NAME, SUMMARY_DIRECTORY, INDEX_DIRECTORY
+from common_funcs import get_verbose_logger, get_s3_client
+from data_store import DataStore, GZIP_LEVEL, REFRESH_SECONDS
+from storage import CachedStorage, get_storage
+from query_data import has_query, parse_query
+from secondary_index import run_index_query
+from summaries import has_summary_query, parse_summary_query, run_summary_query
+from dataset_metadata import metadata_name
+from json_layout import dumps, get_layout, to_layout
 load_dotenv()
 server = Flask(__name__)
-global verboseprint
-global log
-global logger
+# Smaller bodies are not worth compressing on the fly
+GZIP_MIN_BYTES = 1024
+verboseprint, log, logger = get_verbose_logger(True, False)
+
+
+def store_log(msg: str, level: str) -> None:
+    verboseprint(msg)
+    log(msg, level, logger)
+
+
+# S3 when AWS_BUCKET is set, DATA_DIRECTORY otherwise
+storage = get_storage(bool(os.environ.get('AWS_BUCKET')), os.environ.get('AWS_BUCKET', ''),
+                      get_s3_client(os.environ.get('AWS_PROFILE', '')) if os.environ.get('AWS_BUCKET') else None)
+# Summaries and metadata are a few KB, kept in memory and revalidated as often as the datasets
+small_objects = CachedStorage(storage, REFRESH_SECONDS)
+# Loaded at import: gunicorn preloads the app, so the workers it forks share these pages until a refresh
+store = DataStore(transportation_type_list, storage, store_log)
+store.load_all()
+server.extensions['data_store'] = store
 
 
 @server.route('/')
@@ -24,35 +47,99 @@ def home():
 
 @server.route('/<data_type>')
 def get_transport_data(data_type):
-    verboseprint, log, logger = get_verbose_logger(True, False)
-    if data_type == 'flights':
-        return json.dumps(get_transport_list(FLIGHTS, verboseprint, log, logger), indent=4, sort_keys=True)
-    if data_type == 'bus':
-        return json.dumps(get_transport_list(BUS, verboseprint, log, logger), indent=4, sort_keys=True)
-    if data_type == 'train':
-        return json.dumps(get_transport_list(TRAIN, verboseprint, log, logger), indent=4, sort_keys=True)
-    return 'Invalid data type'
+    if data_type not in transportation_type_list:
+        return 'Invalid data type'
+    if has_summary_query(request.args):
+        return get_summary_response(data_type, request.args.to_dict())
+    # Responses are minified, ?layout=records|columns states the column names once
+    success, layout = get_layout(request.args)
+    if not success:
+        return layout, 400
+    if has_query(request.args):
+        return get_query_response(data_type, request.args.to_dict(), layout)
+    return get_transport_list(data_type, layout)
+
+
+@server.route('/<data_type>/stats')
+def get_transport_stats(data_type):
+    """Serve {type}.meta.json: row count, sizes, schema and ranges without touching the dataset"""
+    if data_type not in transportation_type_list:
+        return 'Invalid data type'
+    metadata = small_objects.read_json(metadata_name(data_type))
+    if metadata is None:
+        return 'stats not found', 404
+    return json_response(dumps(metadata).encode('utf-8'))
+
+
+def accepts_gzip() -> bool:
+    return 'gzip' in request.headers.get('Accept-Encoding', '')
+
+
+def json_response(body: bytes, etag: Optional[str] = None, encoded: bool = False) -> Response:
+    """Send a JSON body with its ETag, gzipped when the client accepts it, 304 when it already has it
+
+    A body without an ETag is hashed, encoded means it is gzipped already."""
+    use_gzip = encoded or (accepts_gzip() and len(body) >= GZIP_MIN_BYTES)
+    if etag is None:
+        etag = hashlib.sha256(body).hexdigest()[:32] + ('-gz' if use_gzip else '')
+    return conditional_response(body if encoded or not use_gzip else gzip.compress(body, compresslevel=GZIP_LEVEL),
+                                etag, use_gzip)
+
+
+def conditional_response(body, etag: str, use_gzip: bool) -> Response:
+    """Send a JSON body or stream of chunks with its ETag, 304 without consuming it when the client has it"""
+    response = Response(body, mimetype='application/json')
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def get_query_response(transportation_type, params, layout):
+    success, query = parse_query(params)
+    if not success:
+        return query['error'], 400
+    # The loaded rows answer every query in memory, the index objects only stand in for a dataset not loaded
+    entry = store.get(transportation_type)
+    result = entry['rows'].run_query(query) if entry is not None else get_indexed_result(transportation_type, query)
+    if result is None:
+        return 'data not found', 404
+    result['items'] = to_layout(result['items'], layout, f'{transportation_type}_number')
+    return json_response(dumps(result).encode('utf-8'))
+
+
+def get_summary_response(transportation_type, params):
+    """Answer a group_by query from the precomputed summary, a few KB instead of the dataset"""
+    success, query = parse_summary_query(params)
+    if not success:
+        return query['error'], 400
+    summary = small_objects.read_json(f'{transportation_type}/{SUMMARY_DIRECTORY}/{query["group_by"]}.json')
+    if summary is None:
+        return 'summary not found', 404
+    return json_response(dumps(run_summary_query(summary, query)).encode('utf-8'))
 
 
-def get_transport_list(transportation_type, verboseprint, log, logger):
-    # ttype = str(transportation_type)
-    # try:
-    #     success, transport_list = get_json_data(ttype, aws_profile=str(os.environ.get('AWS_PROFILE')), on_aws=True, bucket=str(
-    #         os.environ.get('AWS_BUCKET')), verboseprint=verboseprint, log=log, logger=logger)
+def get_indexed_result(transportation_type, query):
+    """Answer a route, country or single date query from the secondary index objects, None without them
 
-    #     if success:
-    #         return transport_list
+    They are read through the cache like the summaries, so a repeated lookup does not go back to S3."""
+    manifest = small_objects.read_json(f'{transportation_type}/{INDEX_DIRECTORY}/{MANIFEST_NAME}')
+    if manifest is None:
+        return None
+    return run_index_query(manifest, query, lambda name: small_objects.read_json(
+        f'{transportation_type}/{INDEX_DIRECTORY}/{name}'))
 
-    #     generate_csv_data(50, ttype, aws_creds=str(os.environ.get('AWS_PROFILE')),
-    #                       on_aws=True, bucket=str(os.environ.get('AWS_BUCKET')), on_ddb=False, overwrite=True, json=True)
-    #     return get_json_data(ttype, aws_profile=str(os.environ.get('AWS_PROFILE')), on_aws=True, bucket=str(os.environ.get('AWS_BUCKET')), verboseprint=verboseprint, log=log, logger=logger)[1]
 
-    # except Exception:
-    #     generate_csv_data(50, ttype, aws_creds=str(os.environ.get('AWS_PROFILE')),
-    #                       on_aws=True, bucket=str(os.environ.get('AWS_BUCKET')), on_ddb=False, overwrite=True, json=True)
-    #     return get_json_data(ttype, aws_profile=str(os.environ.get('AWS_PROFILE')), on_aws=True, bucket=str(os.environ.get('AWS_BUCKET')), verboseprint=verboseprint, log=log, logger=logger)[1]
-    return json.dumps('Unused')
+def get_transport_list(transportation_type, layout):
+    """Serve the whole dataset from the store, streamed as it is encoded from the loaded rows"""
+    use_gzip = accepts_gzip()
+    body = store.get_body(transportation_type, layout, use_gzip)
+    if body is None:
+        return 'data not found', 404
+    return conditional_response(body[0], body[1], use_gzip)
 
 
 if __name__ == '__main__':
+    store.start_refresh()
     server.run(debug=False, port=5000, host='0.0.0.0')